@@ -32,4 +32,4 @@ def main():
 
 
 if __name__ == "__main__":
-    test(main, cover_time=True, cover_cpu=True, cover_lines=True)
+    test(main, cover_time=True, cover_cpu=True, cover_lines=True, cover_allocations=True, allocation_interval=0.05)
@@ -1,32 +1,45 @@
 from .profiler import profile_script, cpu_gpu_usage
 from .analyzer import analyze_code
-from .coverage import run_coverage
-import time
+from .coverage import run_coverage, LineCoverage, code_lines
+from .sampling import SamplingProfiler, sample_script
+from .benchmark import benchmark, print_result, HISTORY_FILE
+from .resources import ResourceSampler, default_gpu_probe
+from .allocations import AllocationTracker, track_allocations
 import inspect
-import tracemalloc
+import os
 
 
-def test(function: callable, *, cover_time=True, cover_cpu=True, cover_lines=True):
+def test(function: callable, *, cover_time=True, cover_cpu=True, cover_lines=True, name=None,
+         history=HISTORY_FILE, resource_interval=0.1, gpu=False, sparkline=False, cover_allocations=False,
+         allocation_interval=None, **benchmark_options):
     print(f"[+] Testing function: {function.__name__}")
 
-    if cover_time:
-        start = time.time()
-        tracemalloc.start()
+    # CPU/RSS/etc. are sampled in the background for as long as the function is being exercised
+    sampler = ResourceSampler(interval=resource_interval, gpu_probe=default_gpu_probe() if gpu else None)
+    if cover_cpu:
+        sampler.start()
 
-    result = function()
+    # First call runs alone (under coverage if asked) and provides the return value
+    if cover_lines:
+        path = os.path.abspath(inspect.getsourcefile(function))
+        with LineCoverage([path]) as cov:
+            result = function()
+        # The `def` line itself runs when the function is defined, not when it is called
+        body = code_lines(function.__code__) - {function.__code__.co_firstlineno}
+        hit = {line for (_, line) in cov.hits} & body
+        print(f"Executed {len(hit)}/{len(body)} lines in function `{function.__name__}`")
+    else:
+        result = function()
 
     if cover_time:
-        current, peak = tracemalloc.get_traced_memory()
-        end = time.time()
-        tracemalloc.stop()
-        print(f"Execution time: {end - start:.2f}s")
-        print(f"Memory usage: {peak / 10 ** 6:.2f}MB")
+        print_result(benchmark(function, name=name, history=history, **benchmark_options))
 
     if cover_cpu:
-        cpu_gpu_usage()
+        sampler.stop()
+        sampler.print_summary(sparkline=sparkline)
 
-    if cover_lines:
-        lines = inspect.getsourcelines(function)[0]
-        print(f"Executed {len(lines)} lines in function `{function.__name__}`")
+    # Own call, so snapshot overhead never lands in the timed rounds
+    if cover_allocations:
+        track_allocations(function, interval=allocation_interval)
 
     return result
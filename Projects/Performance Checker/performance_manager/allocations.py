@@ -0,0 +1,144 @@
+import fnmatch
+import os
+import threading
+import time
+import tracemalloc
+
+# Allocations made by the import system and by the tracker itself are noise in every report
+NOISE_FILTERS = [
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<frozen abc>"),
+    tracemalloc.Filter(False, "<unknown>"),
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+]
+
+
+def _format_bytes(size):
+    sign = "-" if size < 0 else "+"
+    size = abs(size)
+    for unit, scale in (("MB", 10 ** 6), ("KB", 10 ** 3)):
+        if size >= scale:
+            return f"{sign}{size / scale:.1f}{unit}"
+    return f"{sign}{size}B"
+
+
+def _where(stat):
+    frame = stat.traceback[0]
+    return f"{os.path.basename(frame.filename)}:{frame.lineno}"
+
+
+class AllocationTracker:
+    """
+    Takes tracemalloc snapshots at start, end, every `interval` seconds (optional) and on demand via
+    snapshot(label), then diffs them by line and by traceback.
+    """
+
+    def __init__(self, frames=10, interval=None, filters=None):
+        self.frames = frames
+        self.interval = interval
+        self.filters = NOISE_FILTERS + (filters or [])
+        self.snapshots = []  # (label, snapshot)
+        self._started_tracing = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def snapshot(self, label):
+        self.snapshots.append((label, tracemalloc.take_snapshot().filter_traces(self.filters)))
+
+    def _run(self):
+        start = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            self.snapshot(f"t+{time.perf_counter() - start:.2f}s")
+
+    def start(self):
+        # Filters match through fnmatch, which compiles and caches each pattern on first use; do that
+        # before the baseline so it does not show up as memory allocated by the profiled code.
+        # The interval thread is started before the baseline for the same reason.
+        for trace_filter in self.filters:
+            fnmatch.fnmatch(__file__, trace_filter.filename_pattern)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started_tracing = True
+        if self.interval:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        self.snapshot("start")
+
+    def stop(self):
+        if self._thread:
+            self._stop.set()
+            self._thread.join()
+        self.snapshot("end")
+        if self._started_tracing:
+            tracemalloc.stop()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ---------------- REPORTS ----------------
+    def growth(self, key_type="lineno"):
+        """Diffs between consecutive snapshots: [(from_label, to_label, [StatisticDiff, ...]), ...]."""
+        return [(a_label, b_label, b.compare_to(a, key_type))
+                for (a_label, a), (b_label, b) in zip(self.snapshots, self.snapshots[1:])]
+
+    def top_allocating_lines(self, top=10):
+        """Lines whose memory grew the most, summed over every interval (churn that is freed in between is not seen)."""
+        totals, counts = {}, {}
+        for _, _, diffs in self.growth():
+            for stat in diffs:
+                if stat.size_diff > 0:
+                    key = stat.traceback[0]
+                    totals[key] = totals.get(key, 0) + stat.size_diff
+                    counts[key] = counts.get(key, 0) + stat.count_diff
+        ranked = sorted(totals.items(), key=lambda kv: kv[1], reverse=True)[:top]
+        return [(f"{os.path.basename(frame.filename)}:{frame.lineno}", size, counts[frame]) for frame, size in ranked]
+
+    def still_alive(self, key_type="lineno"):
+        """Memory allocated after start that is still held at the end."""
+        (_, first), (_, last) = self.snapshots[0], self.snapshots[-1]
+        return [stat for stat in last.compare_to(first, key_type) if stat.size_diff > 0]
+
+    def print_report(self, top=10, tracebacks=3):
+        labels = [label for label, _ in self.snapshots]
+        shown = labels if len(labels) <= 6 else labels[:3] + ["..."] + labels[-2:]
+        print(f"Allocation snapshots ({len(labels)}): {', '.join(shown)}")
+
+        print("Top allocating lines:")
+        for where, size, count in self.top_allocating_lines(top):
+            print(f"  {where}: {_format_bytes(size)} in {count:+} blocks")
+
+        if len(self.snapshots) > 2:
+            print("Growth between snapshots:")
+            for a_label, b_label, diffs in self.growth():
+                total = sum(stat.size_diff for stat in diffs)
+                if not total:
+                    continue
+                biggest = max(diffs, key=lambda s: s.size_diff, default=None)
+                hotspot = f" (mostly {_where(biggest)} {_format_bytes(biggest.size_diff)})" \
+                    if biggest and biggest.size_diff > 0 else ""
+                print(f"  {a_label} -> {b_label}: {_format_bytes(total)}{hotspot}")
+
+        alive = self.still_alive()
+        print(f"Still alive at end: {_format_bytes(sum(stat.size_diff for stat in alive))} "
+              f"in {sum(stat.count_diff for stat in alive):+} blocks")
+        for stat in alive[:top]:
+            print(f"  {_where(stat)}: {_format_bytes(stat.size_diff)} in {stat.count_diff:+} blocks")
+
+        for stat in self.still_alive("traceback")[:tracebacks]:
+            print(f"Retained {_format_bytes(stat.size_diff)} allocated at:")
+            for line in stat.traceback.format(most_recent_first=True)[:8]:
+                print(f"    {line}")
+
+
+def track_allocations(function, interval=None, frames=10, top=10):
+    """Run `function` once under an AllocationTracker, print the report and return (result, tracker)."""
+    with AllocationTracker(frames=frames, interval=interval) as tracker:
+        result = function()
+    tracker.print_report(top=top)
+    return result, tracker
@@ -1,4 +1,26 @@
 import ast
+import hashlib
+import json
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+ANALYZER_VERSION = 1  # Bump when rules change, so cached results are recomputed
+CACHE_FILE = ".performance_analyzer_cache.json"
+SKIP_DIRS = {".git", "__pycache__", ".venv", "venv", "env", "build", "dist", "node_modules"}
+
+# idiom: (weight, adds a factor of n to the loop it sits in, message)
+IDIOMS = {
+    "list_insert_front": (5, True, "list.insert(0, ...) shifts every element; use collections.deque.appendleft"),
+    "list_membership": (5, True, "`in` on a list is a linear scan; build a set once before the loop"),
+    "str_concat": (5, True, "string += copies the whole string each time; collect parts and ''.join() them"),
+    "regex_compile": (3, False, "regex compiled inside the loop; compile it once outside"),
+    "regex_call": (2, False, "re.<func> with a literal pattern hits the regex cache every iteration; precompile"),
+    "sum_list": (1, False, "sum([...]) builds a throwaway list; pass a generator: sum(x for ...)"),
+    "repeated_len": (1, False, "len() of the same object evaluated repeatedly in the loop; hoist it"),
+    "repeated_attr": (1, False, "attribute looked up repeatedly in the loop; bind it to a local first"),
+}
+REGEX_FUNCS = {"match", "search", "fullmatch", "findall", "finditer", "sub", "subn", "split"}
 
 
 class Analyzer(ast.NodeVisitor):
@@ -25,6 +47,201 @@ class Analyzer(ast.NodeVisitor):
         self.generic_visit(node)
 
 
+# ---------------- HOT PATH ANALYSIS ----------------
+class HotPathAnalyzer(ast.NodeVisitor):
+    """Per-function loop nesting depth and slow idioms inside loops, with an estimated cost to rank by."""
+
+    def __init__(self):
+        self.functions = []
+        self._scopes = []  # Stack of function records being visited
+        self._names = []  # Qualified-name parts (classes and functions)
+        self._enter("<module>", 1)
+
+    # ---------------- SCOPES ----------------
+    def _enter(self, name, line):
+        record = {"name": ".".join(self._names + [name]), "line": line, "max_loop_depth": 0,
+                  "findings": [], "_depth": 0, "_loops": [], "_kinds": {}}
+        self._scopes.append(record)
+        self.functions.append(record)
+        return record
+
+    @property
+    def _scope(self):
+        return self._scopes[-1]
+
+    def visit_FunctionDef(self, node):
+        self._enter(node.name, node.lineno)
+        self._names.append(node.name)
+        for child in node.body:
+            self.visit(child)
+        self._names.pop()
+        self._scopes.pop()
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node):
+        self._names.append(node.name)
+        self.generic_visit(node)
+        self._names.pop()
+
+    # ---------------- LOOPS ----------------
+    def _loop(self, body_nodes, levels=1):
+        scope = self._scope
+        scope["_depth"] += levels
+        scope["max_loop_depth"] = max(scope["max_loop_depth"], scope["_depth"])
+        scope["_loops"].append({"lens": Counter(), "attrs": Counter(), "lines": {}})
+        for child in body_nodes:
+            self.visit(child)
+        loop = scope["_loops"].pop()
+        for key, count in loop["lens"].items():
+            if count >= 2:
+                self._flag("repeated_len", loop["lines"][key], f"len({key}) x{count}")
+        for key, count in loop["attrs"].items():
+            if count >= 3 or key.count(".") >= 2:
+                self._flag("repeated_attr", loop["lines"][key], f"{key} x{count}")
+        scope["_depth"] -= levels
+
+    def visit_For(self, node):
+        self.visit(node.iter)  # Evaluated once, outside the loop
+        self._loop([node.target, *node.body])
+        for child in node.orelse:
+            self.visit(child)
+
+    visit_AsyncFor = visit_For
+
+    def visit_While(self, node):
+        self._loop([node.test, *node.body])  # The condition runs every iteration
+        for child in node.orelse:
+            self.visit(child)
+
+    def _comprehension(self, node, elements):
+        self.visit(node.generators[0].iter)
+        rest = [node.generators[0].target, *node.generators[0].ifs]
+        for gen in node.generators[1:]:
+            rest += [gen.iter, gen.target, *gen.ifs]
+        self._loop(rest + elements, levels=len(node.generators))
+
+    def visit_ListComp(self, node):
+        self._comprehension(node, [node.elt])
+
+    visit_SetComp = visit_GeneratorExp = visit_ListComp
+
+    def visit_DictComp(self, node):
+        self._comprehension(node, [node.key, node.value])
+
+    # ---------------- FINDINGS ----------------
+    def _flag(self, idiom, line, detail=None):
+        scope = self._scope
+        finding = {"idiom": idiom, "line": line, "loop_depth": scope["_depth"], "message": IDIOMS[idiom][2]}
+        if detail:
+            finding["detail"] = detail
+        scope["findings"].append(finding)
+
+    @property
+    def _in_loop(self):
+        return self._scope["_depth"] > 0
+
+    @staticmethod
+    def _kind(value):
+        if isinstance(value, (ast.List, ast.ListComp)) or (
+                isinstance(value, ast.Call) and isinstance(value.func, ast.Name) and value.func.id == "list"):
+            return "list"
+        if isinstance(value, ast.JoinedStr) or (isinstance(value, ast.Constant) and isinstance(value.value, str)):
+            return "str"
+        return None
+
+    def visit_Assign(self, node):
+        kind = self._kind(node.value)
+        for target in node.targets:
+            if isinstance(target, ast.Name):
+                self._scope["_kinds"][target.id] = kind
+        self.generic_visit(node)
+
+    def visit_AugAssign(self, node):
+        if (self._in_loop and isinstance(node.op, ast.Add) and isinstance(node.target, ast.Name)
+                and (self._scope["_kinds"].get(node.target.id) == "str" or self._kind(node.value) == "str")):
+            self._flag("str_concat", node.lineno, node.target.id)
+        self.generic_visit(node)
+
+    def visit_Compare(self, node):
+        if self._in_loop:
+            for op, right in zip(node.ops, node.comparators):
+                # Literal lists are folded into tuple constants by the compiler, only named lists are slow
+                if (isinstance(op, (ast.In, ast.NotIn)) and isinstance(right, ast.Name)
+                        and self._scope["_kinds"].get(right.id) == "list"):
+                    self._flag("list_membership", node.lineno, right.id)
+        self.generic_visit(node)
+
+    def visit_Call(self, node):
+        func = node.func
+        if isinstance(func, ast.Name) and func.id == "sum" and node.args and isinstance(node.args[0], ast.ListComp):
+            self._flag("sum_list", node.lineno)
+        if self._in_loop:
+            loop = self._scope["_loops"][-1]
+            if isinstance(func, ast.Attribute):
+                if (func.attr == "insert" and node.args and isinstance(node.args[0], ast.Constant)
+                        and node.args[0].value == 0):
+                    self._flag("list_insert_front", node.lineno)
+                if isinstance(func.value, ast.Name) and func.value.id == "re":
+                    if func.attr == "compile":
+                        self._flag("regex_compile", node.lineno)
+                    elif func.attr in REGEX_FUNCS and node.args and isinstance(node.args[0], ast.Constant):
+                        self._flag("regex_call", node.lineno, f"re.{func.attr}")
+            elif isinstance(func, ast.Name) and func.id == "len" and len(node.args) == 1:
+                key = ast.unparse(node.args[0])
+                loop["lens"][key] += 1
+                loop["lines"].setdefault(key, node.lineno)
+        self.generic_visit(node)
+
+    def visit_Attribute(self, node):
+        if self._in_loop and isinstance(node.ctx, ast.Load):
+            # Count whole dotted chains (a.b.c) once, not each inner link
+            inner = node.value
+            while isinstance(inner, ast.Attribute):
+                inner = inner.value
+            if isinstance(inner, ast.Name):
+                loop = self._scope["_loops"][-1]
+                key = ast.unparse(node)
+                loop["attrs"][key] += 1
+                loop["lines"].setdefault(key, node.lineno)
+                return
+        self.generic_visit(node)
+
+
+def _finalize(record):
+    findings = record["findings"]
+    # An O(n) operation inside a loop of depth d behaves like a loop of depth d + 1
+    order = max([record["max_loop_depth"]] +
+                [f["loop_depth"] + 1 for f in findings if IDIOMS[f["idiom"]][1]])
+    cost = 10 ** order + sum(IDIOMS[f["idiom"]][0] * 10 ** f["loop_depth"] for f in findings)
+    return {
+        "name": record["name"],
+        "line": record["line"],
+        "max_loop_depth": record["max_loop_depth"],
+        "complexity": f"O(n^{order})" if order > 1 else ("O(n)" if order == 1 else "O(1)"),
+        "cost": cost,
+        "findings": sorted(findings, key=lambda f: f["line"]),
+    }
+
+
+def hot_paths(code: str, filename="<string>"):
+    """Functions of `code` ranked by estimated cost (highest first), each with its findings."""
+    visitor = HotPathAnalyzer()
+    visitor.visit(ast.parse(code, filename))
+    functions = [_finalize(r) for r in visitor.functions]
+    return sorted((f for f in functions if f["name"] != "<module>" or f["max_loop_depth"] or f["findings"]),
+                  key=lambda f: f["cost"], reverse=True)
+
+
+def print_hot_paths(functions, top=10, filename=None):
+    for f in functions[:top]:
+        where = f"{filename}:{f['line']}" if filename else f"line {f['line']}"
+        print(f"  {f['name']} ({where}): loop depth {f['max_loop_depth']}, {f['complexity']}, cost {f['cost']}")
+        for finding in f["findings"]:
+            detail = f" [{finding['detail']}]" if "detail" in finding else ""
+            print(f"    line {finding['line']} (depth {finding['loop_depth']}): {finding['message']}{detail}")
+
+
 def analyze_code(code: str):
     tree = ast.parse(code)
     analyzer = Analyzer()
@@ -32,4 +249,81 @@ def analyze_code(code: str):
     print(f"Total loops: {analyzer.loops}")
     print(f"Total conditionals: {analyzer.conditions}")
     print(f"Total functions: {len(analyzer.functions)}")
-    # print(f"Code Complexity (approx): O(n^{analyzer.loops})")
+    functions = hot_paths(code)
+    if functions:
+        print("Hot paths (by estimated cost):")
+        print_hot_paths(functions)
+    return functions
+
+
+# ---------------- DIRECTORY ANALYSIS ----------------
+def analyze_file(path):
+    with open(path, "rb") as f:
+        source = f.read()
+    report = {"file": path, "sha256": hashlib.sha256(source).hexdigest()}
+    try:
+        report["functions"] = hot_paths(source.decode("utf-8", errors="replace"), path)
+    except SyntaxError as e:
+        report["functions"], report["error"] = [], f"SyntaxError: {e}"
+    return report
+
+
+def _python_files(root):
+    for directory, dirs, files in os.walk(root):
+        dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+        for name in files:
+            if name.endswith(".py"):
+                yield os.path.join(directory, name)
+
+
+def analyze_directory(root, workers=None, cache_path=CACHE_FILE, report_path=None, top=15):
+    """
+    Analyze every .py file under `root` in a process pool and print the costliest functions tree-wide.
+
+    Results are cached by file content hash in `cache_path`, so unchanged files are not parsed again.
+    """
+    cache = {}
+    if cache_path and os.path.isfile(cache_path):
+        with open(cache_path) as f:
+            cache = json.load(f)
+        if cache.get("version") != ANALYZER_VERSION:
+            cache = {}
+    entries = cache.setdefault("files", {})
+    cache["version"] = ANALYZER_VERSION
+
+    reports, todo = [], []
+    for path in _python_files(root):
+        with open(path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        cached = entries.get(path)
+        if cached and cached["sha256"] == digest:
+            reports.append(cached)
+        else:
+            todo.append(path)
+
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for report in pool.map(analyze_file, todo, chunksize=8):
+                entries[report["file"]] = report
+                reports.append(report)
+    print(f"Analyzed {len(reports)} files ({len(todo)} parsed, {len(reports) - len(todo)} from cache)")
+
+    if cache_path:
+        # Drop files that no longer exist
+        cache["files"] = {r["file"]: r for r in reports}
+        with open(cache_path, "w") as f:
+            json.dump(cache, f)
+
+    ranked = sorted(((r["file"], fn) for r in reports for fn in r["functions"]),
+                    key=lambda item: item[1]["cost"], reverse=True)
+    for path, fn in ranked[:top]:
+        print_hot_paths([fn], filename=path)
+    for r in reports:
+        if "error" in r:
+            print(f"[!] {r['file']}: {r['error']}")
+
+    if report_path:
+        with open(report_path, "w") as f:
+            json.dump({"root": root, "files": sorted(reports, key=lambda r: r["file"])}, f, indent=4)
+        print(f"Static analysis report written to {report_path}")
+    return reports
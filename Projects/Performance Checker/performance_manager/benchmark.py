@@ -0,0 +1,145 @@
+import gc
+import json
+import os
+import statistics
+import time
+import tracemalloc
+
+HISTORY_FILE = ".performance_history.json"
+
+
+def _format_ns(ns):
+    for unit, scale in (("s", 10 ** 9), ("ms", 10 ** 6), ("us", 10 ** 3)):
+        if ns >= scale:
+            return f"{ns / scale:.3f}{unit}"
+    return f"{ns:.0f}ns"
+
+
+def _time_round(function, iterations):
+    start = time.perf_counter_ns()
+    for _ in range(iterations):
+        function()
+    return time.perf_counter_ns() - start
+
+
+def calibrate(function, round_time_ns=10 ** 7):
+    """Smallest power-of-two iteration count whose round takes at least `round_time_ns` (so timer resolution is noise)."""
+    iterations = 1
+    while _time_round(function, iterations) < round_time_ns and iterations < 2 ** 30:
+        iterations *= 2
+    return iterations
+
+
+def summarize(samples_ns):
+    q1, median, q3 = statistics.quantiles(samples_ns, n=4) if len(samples_ns) > 1 else [samples_ns[0]] * 3
+    iqr = q3 - q1
+    low, high = q1 - 1.5 * iqr, q3 + 1.5 * iqr
+    return {
+        "mean_ns": statistics.fmean(samples_ns),
+        "stddev_ns": statistics.stdev(samples_ns) if len(samples_ns) > 1 else 0.0,
+        "median_ns": median,
+        "iqr_ns": iqr,
+        "min_ns": min(samples_ns),
+        "max_ns": max(samples_ns),
+        "outliers": sum(1 for s in samples_ns if s < low or s > high),
+    }
+
+
+def measure_memory(function):
+    """Peak traced allocation of a single call, in its own pass so tracemalloc never slows the timed rounds."""
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    function()
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    if not was_tracing:
+        tracemalloc.stop()
+    return peak
+
+
+# ---------------- HISTORY ----------------
+def load_history(path=HISTORY_FILE):
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def record_result(result, path=HISTORY_FILE, threshold=0.1, keep=50):
+    """Compare `result` with the last run of the same name, flag a regression, then append it to the history file."""
+    history = load_history(path)
+    runs = history.setdefault(result["name"], [])
+    if runs:
+        previous = runs[-1]
+        change = (result["median_ns"] - previous["median_ns"]) / previous["median_ns"]
+        # Only a slowdown larger than both the threshold and the previous run's spread counts
+        noise = previous["iqr_ns"] / previous["median_ns"] if previous["median_ns"] else 0.0
+        result["change"] = change
+        result["regression"] = change > max(threshold, noise)
+    runs.append({k: v for k, v in result.items() if k not in ("samples_ns", "regression", "change")})
+    history[result["name"]] = runs[-keep:]
+    with open(path, "w") as f:
+        json.dump(history, f, indent=4)
+    return result
+
+
+# ---------------- BENCHMARK ----------------
+def benchmark(function, *, name=None, warmup=3, rounds=None, max_time=1.0, min_rounds=5, max_rounds=1000,
+              iterations=None, disable_gc=True, memory=True, history=HISTORY_FILE, threshold=0.1):
+    """
+    Time `function` over repeated rounds and return a summary (all times are per call, in ns).
+
+    After `warmup` untimed calls, the iterations per round are calibrated (unless given) and rounds run
+    until `max_time` seconds have passed (at least `min_rounds`), or exactly `rounds` if given. The GC is
+    collected and paused while timing unless `disable_gc` is False. Memory is measured in a separate pass.
+    With `history` set, the result is saved under `name` and compared with the previous run.
+    """
+    name = name or f"{function.__module__}.{function.__qualname__}"
+    for _ in range(warmup):
+        function()
+    iterations = iterations or calibrate(function)
+
+    gc_was_enabled = gc.isenabled()
+    if disable_gc:
+        gc.collect()
+        gc.disable()
+    samples = []
+    try:
+        deadline = time.perf_counter_ns() + int(max_time * 10 ** 9)
+        while True:
+            samples.append(_time_round(function, iterations) / iterations)
+            if rounds is not None:
+                if len(samples) >= rounds:
+                    break
+            elif len(samples) >= max_rounds or (len(samples) >= min_rounds and time.perf_counter_ns() >= deadline):
+                break
+    finally:
+        if disable_gc and gc_was_enabled:
+            gc.enable()
+
+    result = {
+        "name": name,
+        "timestamp": time.time(),
+        "rounds": len(samples),
+        "iterations": iterations,
+        **summarize(samples),
+        "peak_memory_bytes": measure_memory(function) if memory else None,
+        "samples_ns": samples,
+    }
+    if history:
+        record_result(result, history, threshold)
+    return result
+
+
+def print_result(result):
+    print(f"Benchmark: {result['name']} ({result['rounds']} rounds x {result['iterations']} iterations)")
+    print(f"  Mean: {_format_ns(result['mean_ns'])} +- {_format_ns(result['stddev_ns'])} | "
+          f"Median: {_format_ns(result['median_ns'])} | IQR: {_format_ns(result['iqr_ns'])} | "
+          f"Min/Max: {_format_ns(result['min_ns'])}/{_format_ns(result['max_ns'])} | Outliers: {result['outliers']}")
+    if result["peak_memory_bytes"] is not None:
+        print(f"  Peak memory: {result['peak_memory_bytes'] / 10 ** 6:.2f}MB")
+    if "change" in result:
+        verdict = "[!] REGRESSION" if result["regression"] else "ok"
+        print(f"  vs previous run: {result['change'] * 100:+.1f}% median ({verdict})")
@@ -1,16 +1,37 @@
 import argparse
+import json
 import os
 import sys
 
-from performance_manager import analyzer, profiler, coverage
+from performance_manager import analyzer, profiler, coverage, sampling, resources, compare
 
 
 def run_cli():
     parser = argparse.ArgumentParser(description="Performance Manager CLI")
-    parser.add_argument("script", nargs='?', help="Python script to analyze")
+    parser.add_argument("script", nargs='?', help="Python script to analyze (or a directory for static analysis only)")
+    parser.add_argument("--compare", metavar="SCRIPT_B", help="A/B mode: compare the script against SCRIPT_B")
+    parser.add_argument("--revs", nargs=2, metavar=("REV_A", "REV_B"),
+                        help="A/B mode: compare two git revisions of the script (WORKTREE = file on disk)")
+    parser.add_argument("--trials", type=int, default=10, help="Interleaved trials per side in A/B mode")
+    parser.add_argument("--report", metavar="PATH", help="Write the static analysis report as JSON")
+    parser.add_argument("--workers", type=int, help="Worker processes for directory analysis")
     parser.add_argument("--no-time-coverage", action='store_true')
     parser.add_argument("--no-cpu", action='store_true')
     parser.add_argument("--no-line-coverage", action='store_true')
+    parser.add_argument("--resource-interval", type=float, default=100.0, help="Resource sampling interval in ms")
+    parser.add_argument("--sparkline", action='store_true', help="Show sparklines of the resource samples")
+    parser.add_argument("--gpu", action='store_true', help="Also sample GPU use (NVML or nvidia-smi)")
+    parser.add_argument("--allocations", action='store_true', help="Report allocation hotspots from tracemalloc snapshots")
+    parser.add_argument("--alloc-interval", type=float, help="Also snapshot allocations every N seconds")
+    parser.add_argument("--hot-lines", action='store_true', help="Count every line hit instead of first-hit coverage")
+    parser.add_argument("--coverage-json", metavar="PATH", help="Write the coverage report as JSON")
+    parser.add_argument("--sample", action='store_true', help="Run the statistical sampling profiler")
+    parser.add_argument("--sample-interval", type=float, default=5.0, help="Sampling interval in ms")
+    parser.add_argument("--sample-mode", choices=["thread", "signal"], default="thread")
+    parser.add_argument("--sample-repeat", type=int, default=1, help="Run the script N times while sampling")
+    parser.add_argument("--top", type=int, default=15, help="Functions to show in the sampling table")
+    parser.add_argument("--flamegraph", metavar="PATH", help="Write collapsed stacks for flamegraph.pl / speedscope")
+    parser.add_argument("--sample-overhead", action='store_true', help="Measure the sampling profiler's overhead")
 
     args = parser.parse_args()
 
@@ -18,23 +39,54 @@ def run_cli():
         parser.print_help()
         sys.exit(0)
 
+    if os.path.isdir(args.script):
+        print(f"[*] Static Analysis of {args.script}:")
+        analyzer.analyze_directory(args.script, workers=args.workers, report_path=args.report)
+        sys.exit(0)
+
     if not os.path.isfile(args.script):
         print(f"Script '{args.script}' not found.")
         sys.exit(1)
 
+    if args.compare or args.revs:
+        print("[*] A/B Comparison:")
+        compare.compare(args.script, script_b=args.compare, revisions=args.revs, trials=args.trials,
+                        interval=args.sample_interval / 1000, top=args.top)
+        sys.exit(0)
+
     with open(args.script, "r") as file:
         code = file.read()
 
     print("[*] Static Analysis:")
-    analyzer.analyze_code(code)
+    functions = analyzer.analyze_code(code)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"file": args.script, "functions": functions}, f, indent=4)
+        print(f"Static analysis report written to {args.report}")
 
     print("\n[*] Profiling:")
-    if not args.no_time_coverage:
-        profiler.profile_script(args.script)
+    gpu_probe = None
+    if args.gpu:
+        gpu_probe = resources.default_gpu_probe()
+        if gpu_probe is None:
+            print("[!] No GPU probe available (install nvidia-ml-py or put nvidia-smi on PATH)")
+
+    if not args.no_time_coverage or not args.no_cpu:
+        profiler.profile_script(args.script, cover_time=not args.no_time_coverage, cover_cpu=not args.no_cpu,
+                                interval=args.resource_interval / 1000, gpu_probe=gpu_probe, sparkline=args.sparkline)
+
+    if args.allocations:
+        print("\n[*] Allocations:")
+        profiler.allocation_profile(args.script, interval=args.alloc_interval, top=args.top)
+
+    if args.sample:
+        print("\n[*] Sampling Profile:")
+        sampling.sample_script(args.script, interval=args.sample_interval / 1000, mode=args.sample_mode,
+                               top=args.top, flamegraph=args.flamegraph, repeat=args.sample_repeat)
 
-    if not args.no_cpu:
-        profiler.cpu_gpu_usage()
+    if args.sample_overhead:
+        sampling.measure_overhead(args.script, interval=args.sample_interval / 1000, mode=args.sample_mode)
 
     if not args.no_line_coverage:
-        print("\n[*] Line Coverage in a .cover file")
-        coverage.run_coverage(args.script)
+        print("\n[*] Line Coverage:")
+        coverage.run_coverage(args.script, hot_lines=args.hot_lines, json_path=args.coverage_json)
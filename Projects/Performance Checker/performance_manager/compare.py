@@ -0,0 +1,180 @@
+import json
+import math
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from performance_manager.sampling import SamplingProfiler
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKTREE = "WORKTREE"  # Revision name meaning "the file as it is on disk"
+
+
+# ---------------- WORKER (runs in the trial subprocess) ----------------
+def _peak_rss_bytes():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024  # Linux reports KB
+    except ImportError:  # Windows
+        import psutil
+        return psutil.Process().memory_info().peak_wset
+
+
+def _worker(script_path, out_path, interval):
+    script_path = os.path.abspath(script_path)
+    with open(script_path) as f:
+        code = compile(f.read(), script_path, 'exec')
+
+    profiler = SamplingProfiler(interval=interval)
+    start = time.perf_counter()
+    profiler.start()
+    exec(code, {"__name__": "__main__", "__file__": script_path})
+    profiler.stop()
+    elapsed = time.perf_counter() - start
+
+    # Functions of the script itself are keyed without file/line, so they match across versions
+    def label(entry):
+        filename, name, line = entry
+        return f"{name} (<script>)" if filename == script_path else f"{name} ({os.path.basename(filename)}:{line})"
+
+    self_counts, cumulative = profiler.function_stats()
+    with open(out_path, "w") as f:
+        json.dump({
+            "time": elapsed,
+            "peak_rss": _peak_rss_bytes(),
+            "samples": profiler.samples,
+            "self": {label(k): v for k, v in self_counts.items()},
+            "cumulative": {label(k): v for k, v in cumulative.items()},
+        }, f)
+
+
+# ---------------- STATISTICS ----------------
+def mann_whitney(a, b):
+    """Two-sided Mann-Whitney U test (normal approximation with tie correction). Returns (U, p-value)."""
+    values = sorted([(v, 0) for v in a] + [(v, 1) for v in b])
+    ranks, ties, i = [0.0] * len(values), 0.0, 0
+    while i < len(values):
+        j = i
+        while j + 1 < len(values) and values[j + 1][0] == values[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2 + 1
+        ties += (j - i + 1) ** 3 - (j - i + 1)
+        i = j + 1
+    n1, n2 = len(a), len(b)
+    u = sum(r for r, (_, group) in zip(ranks, values) if group == 0) - n1 * (n1 + 1) / 2
+    n = n1 + n2
+    sigma = math.sqrt(n1 * n2 / 12 * ((n + 1) - ties / (n * (n - 1))))
+    if sigma == 0:
+        return u, 1.0
+    z = (abs(u - n1 * n2 / 2) - 0.5) / sigma  # Continuity correction
+    return u, min(1.0, math.erfc(max(z, 0) / math.sqrt(2)))
+
+
+# ---------------- TRIALS ----------------
+def materialize(script_path, revision, workdir):
+    """Path of `script_path` as of `revision` (a git rev, or WORKTREE for the file on disk)."""
+    if revision == WORKTREE:
+        return os.path.abspath(script_path)
+    directory, name = os.path.split(os.path.abspath(script_path))
+    source = subprocess.run(["git", "-C", directory, "show", f"{revision}:./{name}"],
+                            capture_output=True, check=True).stdout
+    path = os.path.join(workdir, f"{revision.replace('/', '_').replace('~', '-').replace('^', '-')}", name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(source)
+    return path
+
+
+def _run_trial(script_path, cwd, interval, workdir):
+    out_path = os.path.join(workdir, "trial.json")
+    env = dict(os.environ)
+    # The package for the worker, and the script's original directory for its own imports
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (PACKAGE_ROOT, cwd, env.get("PYTHONPATH")) if p)
+    subprocess.run([sys.executable, "-m", "performance_manager.compare", script_path, out_path, str(interval)],
+                   cwd=cwd, env=env, check=True, stdout=subprocess.DEVNULL)
+    with open(out_path) as f:
+        return json.load(f)
+
+
+def compare(script_a, script_b=None, revisions=None, trials=10, interval=0.005, alpha=0.05, top=15):
+    """
+    Run two versions for `trials` interleaved rounds in fresh subprocesses and report the differences.
+
+    Either pass two scripts (`script_a`, `script_b`), or one script and `revisions=(rev_a, rev_b)`.
+    Rounds alternate ABBA order so drift (thermal, caches, other load) hits both sides equally.
+    """
+    with tempfile.TemporaryDirectory(prefix="perf_compare_") as workdir:
+        if revisions:
+            labels = list(revisions)
+            paths = [materialize(script_a, rev, workdir) for rev in revisions]
+            cwd = os.path.dirname(os.path.abspath(script_a))
+            cwds = [cwd, cwd]
+        else:
+            labels = [script_a, script_b]
+            paths = [os.path.abspath(script_a), os.path.abspath(script_b)]
+            cwds = [os.path.dirname(p) for p in paths]
+
+        results = ([], [])
+        for trial in range(trials):
+            order = (0, 1) if trial % 2 == 0 else (1, 0)
+            for side in order:
+                results[side].append(_run_trial(paths[side], cwds[side], interval, workdir))
+            print(f"\r  trial {trial + 1}/{trials}", end="", flush=True)
+        print()
+
+    report = {"a": labels[0], "b": labels[1], "trials": trials, "metrics": {}, "functions": []}
+    for metric in ("time", "peak_rss"):
+        a = [r[metric] for r in results[0]]
+        b = [r[metric] for r in results[1]]
+        _, p = mann_whitney(a, b)
+        med_a, med_b = statistics.median(a), statistics.median(b)
+        report["metrics"][metric] = {
+            "median_a": med_a, "median_b": med_b,
+            "change": (med_b - med_a) / med_a if med_a else 0.0,
+            "p_value": p, "significant": p < alpha,
+        }
+
+    # Per-function share of samples, summed over all trials of each side
+    shares = []
+    for side in results:
+        total = sum(r["samples"] for r in side) or 1
+        self_counts, cumulative = Counter(), Counter()
+        for r in side:
+            self_counts.update(r["self"])
+            cumulative.update(r["cumulative"])
+        shares.append(({k: v / total for k, v in self_counts.items()}, {k: v / total for k, v in cumulative.items()}))
+    names = set(shares[0][1]) | set(shares[1][1])
+    report["functions"] = sorted(({
+        "function": name,
+        "self_a": shares[0][0].get(name, 0.0), "self_b": shares[1][0].get(name, 0.0),
+        "cumulative_a": shares[0][1].get(name, 0.0), "cumulative_b": shares[1][1].get(name, 0.0),
+    } for name in names), key=lambda f: abs(f["self_b"] - f["self_a"]), reverse=True)[:top]
+
+    print_comparison(report, alpha)
+    return report
+
+
+def print_comparison(report, alpha=0.05):
+    print(f"A: {report['a']}\nB: {report['b']}\n{report['trials']} interleaved trials per side")
+    for metric, label, fmt in (("time", "Time", lambda v: f"{v * 1000:.1f}ms"),
+                               ("peak_rss", "Peak RSS", lambda v: f"{v / 10 ** 6:.1f}MB")):
+        m = report["metrics"][metric]
+        verdict = "significant" if m["significant"] else "not significant"
+        print(f"{label}: A {fmt(m['median_a'])} -> B {fmt(m['median_b'])} ({m['change'] * 100:+.1f}%, "
+              f"p={m['p_value']:.4f}, {verdict} at alpha={alpha})")
+
+    print("Per-function share of samples (self / cumulative), biggest self-time changes first:")
+    print(f"{'Self A':>7} {'Self B':>7} {'Delta':>7} {'Cum A':>7} {'Cum B':>7}  Function")
+    for f in report["functions"]:
+        print(f"{f['self_a'] * 100:6.1f}% {f['self_b'] * 100:6.1f}% {(f['self_b'] - f['self_a']) * 100:+6.1f}% "
+              f"{f['cumulative_a'] * 100:6.1f}% {f['cumulative_b'] * 100:6.1f}%  {f['function']}")
+
+
+if __name__ == "__main__":
+    _worker(sys.argv[1], sys.argv[2], float(sys.argv[3]))
@@ -1,8 +1,159 @@
-import trace
+import json
+import os
+import sys
+import threading
+from collections import Counter
 
+MONITORING_TOOL = "performance_manager"
 
-def run_coverage(script_path):
-    tracer = trace.Trace(count=True, trace=False)
-    tracer.run(f"exec(open('{script_path}').read(), {{}})")
-    results = tracer.results()
-    results.write_results(show_missing=True, coverdir=".")
+
+def code_lines(code):
+    """Every line number the compiler attached bytecode to, for `code` and all nested functions/classes."""
+    lines, todo = set(), [code]
+    while todo:
+        code = todo.pop()
+        lines.update(line for _, _, line in code.co_lines() if line)
+        todo.extend(c for c in code.co_consts if hasattr(c, "co_lines"))
+    return lines
+
+
+def executable_lines(path):
+    with open(path) as f:
+        return code_lines(compile(f.read(), path, 'exec'))
+
+
+class LineCoverage:
+    """
+    Records which lines of the given files run (coverage mode) or how often (hot_lines mode).
+
+    On Python 3.12+ this uses sys.monitoring (PEP 669): in coverage mode each line event is disabled
+    after its first hit, so covered code runs at full speed afterwards, and other files are never traced.
+    Older interpreters fall back to sys.settrace, which has to see every line.
+    """
+
+    def __init__(self, paths, hot_lines=False):
+        self.paths = {os.path.abspath(p) for p in paths}
+        self.hot_lines = hot_lines
+        self.hits = Counter()
+        self.engine = None
+        self._tool_id = None
+
+    # ---------------- SYS.MONITORING ----------------
+    def _on_line(self, code, line):
+        if code.co_filename not in self.paths:
+            return sys.monitoring.DISABLE
+        if self.hot_lines:
+            self.hits[(code.co_filename, line)] += 1
+            return None
+        # DISABLE is per instruction, a line spanning several can still fire more than once
+        self.hits[(code.co_filename, line)] = 1
+        return sys.monitoring.DISABLE
+
+    def _start_monitoring(self):
+        mon = sys.monitoring
+        for tool_id in (mon.COVERAGE_ID, mon.PROFILER_ID, 3, 4):
+            try:
+                mon.use_tool_id(tool_id, MONITORING_TOOL)
+            except ValueError:  # Slot taken by another tool (e.g. coverage.py)
+                continue
+            self._tool_id = tool_id
+            mon.register_callback(tool_id, mon.events.LINE, self._on_line)
+            mon.set_events(tool_id, mon.events.LINE)
+            return True
+        return False
+
+    def _stop_monitoring(self):
+        mon = sys.monitoring
+        mon.set_events(self._tool_id, 0)
+        mon.register_callback(self._tool_id, mon.events.LINE, None)
+        mon.free_tool_id(self._tool_id)
+        # Re-arm locations disabled during this run so later runs see them again
+        mon.restart_events()
+
+    # ---------------- SETTRACE FALLBACK ----------------
+    def _trace_lines(self, frame, event, arg):
+        if event == "line":
+            key = (frame.f_code.co_filename, frame.f_lineno)
+            if self.hot_lines or key not in self.hits:
+                self.hits[key] += 1
+        return self._trace_lines
+
+    def _trace_calls(self, frame, event, arg):
+        # Only frames from the covered files get a local tracer, everything else runs untraced
+        if frame.f_code.co_filename in self.paths:
+            return self._trace_lines
+        return None
+
+    # ---------------- CONTROL ----------------
+    def start(self):
+        if hasattr(sys, "monitoring") and self._start_monitoring():
+            self.engine = "sys.monitoring"
+        else:
+            self.engine = "sys.settrace"
+            threading.settrace(self._trace_calls)
+            sys.settrace(self._trace_calls)
+
+    def stop(self):
+        if self.engine == "sys.monitoring":
+            self._stop_monitoring()
+        else:
+            sys.settrace(None)
+            threading.settrace(None)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ---------------- REPORTING ----------------
+    def report(self):
+        files = {}
+        for path in sorted(self.paths):
+            executable = executable_lines(path)
+            hits = {line: count for (filename, line), count in self.hits.items() if filename == path}
+            covered = executable & hits.keys()
+            files[path] = {
+                "executable": len(executable),
+                "covered": len(covered),
+                "percent": round(len(covered) / len(executable) * 100, 2) if executable else 100.0,
+                "missing": sorted(executable - covered),
+                "hits": {str(line): hits[line] for line in sorted(hits)},
+            }
+        return {"engine": self.engine, "mode": "hot_lines" if self.hot_lines else "coverage", "files": files}
+
+
+def print_annotated(report, top=10):
+    """Source listing with a hit column (count in hot_lines mode, `1` = covered otherwise); `>>>>>>` marks missed lines."""
+    for path, data in report["files"].items():
+        print(f"--- {path}: {data['covered']}/{data['executable']} lines ({data['percent']}%) [{report['engine']}]")
+        missing = set(data["missing"])
+        with open(path) as f:
+            for number, source in enumerate(f, start=1):
+                count = data["hits"].get(str(number))
+                mark = f"{count:>6}" if count else (">>>>>>" if number in missing else "")
+                print(f"{mark:>6} {number:>4}| {source.rstrip()}")
+
+        if report["mode"] == "hot_lines" and data["hits"]:
+            print("Hottest lines:")
+            for line, count in sorted(data["hits"].items(), key=lambda kv: kv[1], reverse=True)[:top]:
+                print(f"  line {line:>4}: {count} hits")
+
+
+def run_coverage(script_path, hot_lines=False, json_path=None, annotate=True):
+    path = os.path.abspath(script_path)
+    with open(path) as f:
+        code = compile(f.read(), path, 'exec')
+
+    with LineCoverage([path], hot_lines=hot_lines) as cov:
+        exec(code, {})
+
+    report = cov.report()
+    if annotate:
+        print_annotated(report)
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(report, f, indent=4)
+        print(f"Coverage report written to {json_path}")
+    return report
@@ -1,27 +1,53 @@
 import time
 import tracemalloc
 import psutil
-import subprocess
 
+from .resources import ResourceSampler, default_gpu_probe
+from .allocations import track_allocations
 
-def profile_script(script_path):
-    start = time.time()
-    tracemalloc.start()
+
+def profile_script(script_path, cover_time=True, cover_cpu=False, interval=0.1, gpu_probe=None, sparkline=False):
+    # Resources are sampled while the script runs, not after it has finished
+    sampler = ResourceSampler(interval=interval, gpu_probe=gpu_probe) if cover_cpu else None
     with open(script_path) as f:
         code = compile(f.read(), script_path, 'exec')
+    if cover_time:
+        tracemalloc.start()
+    if sampler:
+        sampler.start()
+    start = time.perf_counter()
+    try:
         exec(code, {})
-    current, peak = tracemalloc.get_traced_memory()
-    end = time.time()
-    tracemalloc.stop()
-    print(f"Execution time: {end - start:.2f}s")
-    print(f"Peak memory usage: {peak / 10**6:.2f}MB")
+    finally:
+        end = time.perf_counter()
+        if sampler:
+            sampler.stop()
+    if cover_time:
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"Execution time: {end - start:.2f}s")
+        print(f"Peak memory usage: {peak / 10**6:.2f}MB")
+    if sampler:
+        sampler.print_summary(sparkline=sparkline)
+    return sampler
+
+
+def allocation_profile(script_path, interval=None, top=10):
+    with open(script_path) as f:
+        code = compile(f.read(), script_path, 'exec')
+    _, tracker = track_allocations(lambda: exec(code, {}), interval=interval, top=top)
+    return tracker
 
 
 def cpu_gpu_usage():
+    # System-wide snapshot; use ResourceSampler to measure a specific run
     print(f"CPU Usage: {psutil.cpu_percent(interval=1)}%")
-    # GPU placeholder
+    probe = default_gpu_probe()
     try:
-        out = subprocess.check_output("nvidia-smi --query-gpu=utilization.gpu --format=csv,noheader,nounits", shell=True)
-        print(f"GPU Usage: {out.decode().strip()}%")
+        stats = probe() if probe else None
     except Exception:
+        stats = None
+    if stats:
+        print(f"GPU Usage: {stats['gpu_util']:.0f}%")
+    else:
         print("GPU Usage: [!] Could not determine GPU usage (nvidia-smi missing?)")
@@ -0,0 +1,154 @@
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+import psutil
+
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+
+# ---------------- GPU PROBES ----------------
+# A probe is any callable returning {"gpu_util": %, "gpu_mem_mb": MB} (or None when it cannot read the GPU)
+def nvml_probe():
+    """Probe backed by NVML (`pip install nvidia-ml-py`), no subprocess per sample. None if unavailable."""
+    try:
+        import pynvml
+        pynvml.nvmlInit()
+        handle = pynvml.nvmlDeviceGetHandleByIndex(0)
+    except Exception:
+        return None
+
+    def probe():
+        util = pynvml.nvmlDeviceGetUtilizationRates(handle)
+        mem = pynvml.nvmlDeviceGetMemoryInfo(handle)
+        return {"gpu_util": float(util.gpu), "gpu_mem_mb": mem.used / 10 ** 6}
+
+    return probe
+
+
+def nvidia_smi_probe(timeout=2.0):
+    """Probe that calls the nvidia-smi binary directly (no shell). None if it is not on PATH."""
+    binary = shutil.which("nvidia-smi")
+    if binary is None:
+        return None
+
+    def probe():
+        out = subprocess.run([binary, "--query-gpu=utilization.gpu,memory.used", "--format=csv,noheader,nounits"],
+                             capture_output=True, text=True, timeout=timeout, check=True).stdout
+        util, mem = out.splitlines()[0].split(",")
+        return {"gpu_util": float(util), "gpu_mem_mb": float(mem)}
+
+    return probe
+
+
+def default_gpu_probe():
+    return nvml_probe() or nvidia_smi_probe()
+
+
+# ---------------- SAMPLER ----------------
+class ResourceSampler:
+    """Records CPU%, RSS, threads, context switches and I/O bytes of this process every `interval` seconds."""
+
+    def __init__(self, interval=0.1, gpu_probe=None):
+        self.interval = interval
+        self.gpu_probe = gpu_probe
+        self.samples = []
+        self.process = psutil.Process(os.getpid())
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _snapshot(self):
+        with self.process.oneshot():
+            ctx = self.process.num_ctx_switches()
+            sample = {
+                "t": time.perf_counter() - self._start,
+                "cpu_percent": self.process.cpu_percent(),
+                "rss_mb": self.process.memory_info().rss / 10 ** 6,
+                # Not counting the sampler's own thread
+                "threads": self.process.num_threads() - (threading.current_thread() is self._thread),
+                "ctx_switches": ctx.voluntary + ctx.involuntary,
+            }
+            try:
+                io = self.process.io_counters()
+                sample["read_bytes"], sample["write_bytes"] = io.read_bytes, io.write_bytes
+            except (AttributeError, psutil.AccessDenied):  # Not available on macOS
+                pass
+        if self.gpu_probe:
+            try:
+                sample.update(self.gpu_probe() or {})
+            except Exception:
+                self.gpu_probe = None  # A failing probe is dropped instead of retried every sample
+        return sample
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.samples.append(self._snapshot())
+
+    def start(self):
+        self._start = time.perf_counter()
+        self.process.cpu_percent()  # First call only primes the counter
+        self.samples.append(self._snapshot())
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.samples.append(self._snapshot())
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ---------------- SUMMARY ----------------
+    def series(self, key):
+        return [s[key] for s in self.samples if key in s]
+
+    def summary(self):
+        # The first sample only primes cpu_percent, so gauges use the rest when there are any
+        gauges = self.samples[1:] or self.samples
+        result = {"duration_s": self.samples[-1]["t"], "samples": len(self.samples)}
+        for key in ("cpu_percent", "rss_mb", "threads", "gpu_util", "gpu_mem_mb"):
+            values = [s[key] for s in gauges if key in s]
+            if values:
+                result[key] = {"peak": max(values), "avg": sum(values) / len(values)}
+        # Counters are reported as totals over the run
+        for key in ("ctx_switches", "read_bytes", "write_bytes"):
+            values = self.series(key)
+            if values:
+                result[key] = values[-1] - values[0]
+        return result
+
+    def print_summary(self, sparkline=False):
+        summary = self.summary()
+        print(f"Resources over {summary['duration_s']:.2f}s ({summary['samples']} samples, "
+              f"{self.interval * 1000:.0f}ms interval):")
+        for key, label, unit in (("cpu_percent", "CPU", "%"), ("rss_mb", "RSS", "MB"), ("threads", "Threads", ""),
+                                 ("gpu_util", "GPU", "%"), ("gpu_mem_mb", "GPU memory", "MB")):
+            if key in summary:
+                line = f"  {label}: peak {summary[key]['peak']:.1f}{unit}, avg {summary[key]['avg']:.1f}{unit}"
+                if sparkline:
+                    line += f"  {spark(self.series(key))}"
+                print(line)
+        if "ctx_switches" in summary:
+            print(f"  Context switches: {summary['ctx_switches']}")
+        if "read_bytes" in summary:
+            print(f"  I/O: read {summary['read_bytes'] / 10 ** 6:.2f}MB, written {summary['write_bytes'] / 10 ** 6:.2f}MB")
+        return summary
+
+
+def spark(values, width=40):
+    """Unicode sparkline of `values`, downsampled to at most `width` characters."""
+    if not values:
+        return ""
+    if len(values) > width:
+        step = len(values) / width
+        values = [max(values[int(i * step):int((i + 1) * step)] or [values[-1]]) for i in range(width)]
+    low, high = min(values), max(values)
+    scale = (high - low) or 1
+    return "".join(SPARK_CHARS[int((v - low) / scale * (len(SPARK_CHARS) - 1))] for v in values)
@@ -0,0 +1,177 @@
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler: periodically records the target thread's call stack instead of tracing every call.
+
+    mode="thread" uses a watcher thread reading sys._current_frames() (works everywhere).
+    mode="signal" uses a SIGPROF interval timer whose handler runs on the main thread (Unix only).
+    """
+
+    def __init__(self, interval=0.005, mode="thread"):
+        if mode == "signal" and not hasattr(signal, "setitimer"):
+            raise ValueError("Signal sampling needs signal.setitimer (Unix only), use mode='thread'")
+        self.interval = interval
+        self.mode = mode
+        self.stacks = Counter()
+        self.samples = 0
+        self.elapsed = 0.0
+        self._root = None
+        self._thread_id = None
+        self._stop = threading.Event()
+        self._watcher = None
+
+    # ---------------- SAMPLING ----------------
+    def _record(self, frame):
+        stack = []
+        while frame is not None and frame is not self._root:
+            code = frame.f_code
+            if code is _STOP_CODE:
+                return  # Caught the target thread inside stop(), not in the profiled code
+            if code.co_filename != __file__:  # Leave out the profiler's own frames
+                stack.append((code.co_filename, code.co_name, code.co_firstlineno))
+            frame = frame.f_back
+        if stack:
+            stack.reverse()
+            self.stacks[tuple(stack)] += 1
+            self.samples += 1
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                self._record(frame)
+
+    def _on_signal(self, signum, frame):
+        self._record(frame)
+
+    def start(self):
+        # Frames at or above the caller of start() belong to the profiler, not the target
+        self._root = sys._getframe(1)
+        self._thread_id = threading.get_ident()
+        self._start_time = time.perf_counter()
+        if self.mode == "signal":
+            signal.signal(signal.SIGPROF, self._on_signal)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        else:
+            self._stop.clear()
+            self._watcher = threading.Thread(target=self._watch, daemon=True)
+            self._watcher.start()
+
+    def stop(self):
+        if self.mode == "signal":
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, signal.SIG_DFL)
+        else:
+            self._stop.set()
+            self._watcher.join()
+        self.elapsed = time.perf_counter() - self._start_time
+
+    # ---------------- REPORTING ----------------
+    @staticmethod
+    def _label(entry):
+        filename, name, line = entry
+        return f"{name} ({os.path.basename(filename)}:{line})"
+
+    def collapsed(self):
+        """Stacks in collapsed/folded format ("a;b;c count"), as read by flamegraph.pl and speedscope."""
+        return [f"{';'.join(self._label(e) for e in stack)} {count}" for stack, count in self.stacks.most_common()]
+
+    def write_collapsed(self, path):
+        with open(path, "w") as f:
+            f.write("\n".join(self.collapsed()) + "\n")
+
+    def function_stats(self):
+        """Per-function (self, cumulative) sample counts; recursion counts once per sample for cumulative."""
+        self_counts, cumulative = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            self_counts[stack[-1]] += count
+            for entry in set(stack):
+                cumulative[entry] += count
+        return self_counts, cumulative
+
+    def print_top(self, top=15):
+        self_counts, cumulative = self.function_stats()
+        total = self.samples or 1
+        per_sample = self.elapsed / total
+        print(f"Samples: {self.samples} over {self.elapsed:.2f}s ({self.mode} mode, {self.interval * 1000:.1f}ms interval)")
+        print(f"{'Self %':>7} {'Self s':>8} {'Cum %':>7} {'Cum s':>8}  Function")
+        for entry, _ in sorted(cumulative.items(), key=lambda kv: (self_counts[kv[0]], kv[1]), reverse=True)[:top]:
+            print(f"{self_counts[entry] / total * 100:6.1f}% {self_counts[entry] * per_sample:7.3f}s "
+                  f"{cumulative[entry] / total * 100:6.1f}% {cumulative[entry] * per_sample:7.3f}s  {self._label(entry)}")
+
+
+_STOP_CODE = SamplingProfiler.stop.__code__
+
+
+def _load(script_path):
+    with open(script_path) as f:
+        return compile(f.read(), script_path, 'exec')
+
+
+def _run_code(code, repeat=1):
+    for _ in range(repeat):
+        exec(code, {})
+
+
+def sample_script(script_path, interval=0.005, mode="thread", top=15, flamegraph=None, repeat=1):
+    # Short scripts finish before many samples land, `repeat` runs them back to back in one session
+    code = _load(script_path)
+
+    profiler = SamplingProfiler(interval=interval, mode=mode)
+    profiler.start()
+    try:
+        _run_code(code, repeat)
+    finally:
+        profiler.stop()
+
+    profiler.print_top(top)
+    if flamegraph:
+        profiler.write_collapsed(flamegraph)
+        print(f"Collapsed stacks written to {flamegraph} (flamegraph.pl / speedscope compatible)")
+    return profiler
+
+
+def measure_overhead(script_path, trials=15, interval=0.005, mode="thread", min_time=0.2):
+    """
+    Time the script with and without sampling (interleaved trials) and return the relative slowdown.
+
+    Each trial repeats the script until it runs for at least `min_time` seconds, so thread start-up
+    and timer jitter do not swamp a script that only takes a few milliseconds.
+    """
+    code = _load(script_path)
+    repeat = 1
+    while True:
+        start = time.perf_counter()
+        _run_code(code, repeat)
+        if time.perf_counter() - start >= min_time:
+            break
+        repeat *= 2
+
+    plain, sampled = [], []
+    for _ in range(trials):
+        start = time.perf_counter()
+        _run_code(code, repeat)
+        plain.append(time.perf_counter() - start)
+
+        profiler = SamplingProfiler(interval=interval, mode=mode)
+        start = time.perf_counter()
+        profiler.start()
+        _run_code(code, repeat)
+        profiler.stop()
+        sampled.append(time.perf_counter() - start)
+
+    plain.sort()
+    sampled.sort()
+    # Medians, so one-off scheduler hiccups do not dominate
+    base, with_sampling = plain[trials // 2], sampled[trials // 2]
+    overhead = (with_sampling - base) / base
+    print(f"Sampling overhead: {overhead * 100:.2f}% (median {base * 1000:.1f}ms -> {with_sampling * 1000:.1f}ms, "
+          f"{trials} interleaved trials of {repeat} run(s), {interval * 1000:.1f}ms {mode} sampling)")
+    return overhead
@@ -1,13 +1,18 @@
-import re
+import signal
+import socket
 import sys
+import threading
 import time
 import uuid as uid
+from bisect import bisect_left
 from datetime import datetime, timedelta
 import os
 
 import psycopg2
-from flask import Flask, request, render_template, jsonify, session, redirect, url_for, Response
-from waitress import serve
+from flask import Flask, request, render_template, jsonify, session, redirect, url_for, Response, g, abort
+from waitress import serve, create_server
+from waitress.channel import HTTPChannel
+from waitress.server import BaseWSGIServer
 
 app = Flask(__name__)
 
@@ -20,6 +25,24 @@ DB_URL = os.getenv('DB_URL')
 MAX_DB_RETRIES = 3
 # Delay between retries (in seconds)
 DB_RETRY_DELAY = 2
+# Seconds /healthz waits for the database
+HEALTH_DB_TIMEOUT = 2
+# Seconds a worker stopped by server_wrapper.py gets to finish its requests
+WORKER_DRAIN_TIMEOUT = int(os.getenv('WORKER_DRAIN_TIMEOUT', 30))
+# Upper bounds (ms) of the latency histogram reported to server_wrapper.py
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+# Requests served by this process, read by server_wrapper.py through /healthz
+REQUEST_STATS = {
+    "requests": 0,
+    "errors": 0,
+    "in_flight": 0,
+    "latency_ms": 0.0,
+    "buckets": [0] * (len(LATENCY_BUCKETS_MS) + 1)
+}
+REQUEST_STATS_LOCK = threading.Lock()
+# Port of the private socket server_wrapper.py probes, the only one /healthz answers on
+HEALTH_PORT = None
 
 
 # --- DATABASE CONNECTION ---
@@ -55,6 +78,62 @@ def get_db():
     raise last_error
 
 
+# --- REQUEST STATS ---
+@app.before_request
+def start_request_timer():
+    if request.endpoint == "healthz":
+        return  # Probes would drown out the real traffic
+    g.request_started = time.perf_counter()
+    with REQUEST_STATS_LOCK:
+        REQUEST_STATS["in_flight"] += 1
+
+
+@app.after_request
+def remember_status(response):
+    g.response_status = response.status_code
+    return response
+
+
+@app.teardown_request
+def record_request(error=None):
+    started = g.pop("request_started", None)
+    if started is None:
+        return
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    status = g.pop("response_status", 500)  # Unhandled exceptions never reach after_request
+
+    with REQUEST_STATS_LOCK:
+        REQUEST_STATS["in_flight"] -= 1
+        REQUEST_STATS["requests"] += 1
+        REQUEST_STATS["errors"] += status >= 500
+        REQUEST_STATS["latency_ms"] += elapsed_ms
+        REQUEST_STATS["buckets"][bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+
+
+# --- HEALTH CHECK ---
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    """ Liveness and database check for server_wrapper.py, along with this worker's request stats. """
+    # Waitress sets SERVER_PORT from the socket the request came in on, so the public listener gets a plain 404
+    if HEALTH_PORT is None or request.environ.get("SERVER_PORT") != str(HEALTH_PORT):
+        abort(404)
+
+    with REQUEST_STATS_LOCK:
+        stats = dict(REQUEST_STATS, buckets=list(REQUEST_STATS["buckets"]))
+    stats["pid"] = os.getpid()
+
+    try:
+        conn = psycopg2.connect(DB_URL, connect_timeout=HEALTH_DB_TIMEOUT)
+        conn.close()
+        stats["database"] = True
+    except psycopg2.Error as e:
+        # Logged for server_wrapper.py rather than returned, the message can name the database host
+        print(f"Health check database error: {str(e)}")
+        stats["database"] = False
+
+    return jsonify(stats), 200 if stats["database"] else 503
+
+
 # --- ROOT ROUTE ---
 @app.route("/", methods=["GET"])
 def home():
@@ -247,8 +326,9 @@ def purchase():
                 # Include the amount in the reason for better tracking
                 reason = f"{data['reason']} (-{scraps_amount} scraps)"
 
-                cur.execute("INSERT INTO transaction_logs (uuid, name, reason) VALUES (%s, %s, %s)",
-                            (data["uuid"], "Purchase", reason))
+                cur.execute("INSERT INTO transaction_logs (uuid, name, reason, amount, direction) "
+                            "VALUES (%s, %s, %s, %s, -1)",
+                            (data["uuid"], "Purchase", reason, scraps_amount))
                 conn.commit()
         return jsonify({"message": "💸 Purchase successful!"})
     except Exception as e:
@@ -274,8 +354,9 @@ def reimbursement():
                 # Include the amount in the reason for better tracking
                 reason = f"{data['reason']} (+{scraps_amount} scraps)"
 
-                cur.execute("INSERT INTO transaction_logs (uuid, name, reason) VALUES (%s, %s, %s)",
-                            (data["uuid"], "Reimbursement", reason))
+                cur.execute("INSERT INTO transaction_logs (uuid, name, reason, amount, direction) "
+                            "VALUES (%s, %s, %s, %s, 1)",
+                            (data["uuid"], "Reimbursement", reason, scraps_amount))
                 conn.commit()
         return jsonify({"message": "🔁 Reimbursement successful!"})
     except Exception as e:
@@ -313,8 +394,9 @@ def batch_operation():
 
                     # Log the batch transaction for each user
                     for user in affected_users:
-                        cur.execute("INSERT INTO transaction_logs (uuid, name, reason) VALUES (%s, %s, %s)",
-                                    (user[0], "Batch Add", f"{reason} (+{amount} scraps)"))
+                        cur.execute("INSERT INTO transaction_logs (uuid, name, reason, amount, direction) "
+                                    "VALUES (%s, %s, %s, %s, 1)",
+                                    (user[0], "Batch Add", f"{reason} (+{amount} scraps)", amount))
 
                     message = f"✅ Added {amount} scraps to {affected_count} users!"
 
@@ -334,8 +416,9 @@ def batch_operation():
 
                     # Log the batch transaction for each user
                     for user in affected_users:
-                        cur.execute("INSERT INTO transaction_logs (uuid, name, reason) VALUES (%s, %s, %s)",
-                                    (user[0], "Batch Remove", f"{reason} (-{amount} scraps)"))
+                        cur.execute("INSERT INTO transaction_logs (uuid, name, reason, amount, direction) "
+                                    "VALUES (%s, %s, %s, %s, -1)",
+                                    (user[0], "Batch Remove", f"{reason} (-{amount} scraps)", amount))
 
                     message = f"✅ Removed {amount} scraps from {affected_count} users!"
 
@@ -417,62 +500,6 @@ def export_transactions():
         return f"Error exporting transactions: {str(e)}", 500
 
 
-# Helper function to extract amount from transaction reason
-def extract_amount_from_reason(transaction_type, reason):
-    try:
-        # Log the input for debugging
-        print(f"Extracting amount from: Type={transaction_type}, Reason={reason}")
-
-        # Different patterns based on transaction type
-        if transaction_type in ["Purchase", "Batch Remove"]:
-            # Look for pattern like "(-X scraps)" or just numbers
-            minus_pattern = r'$$-(\d+)\s*scraps$$'
-            minus_match = re.search(minus_pattern, reason)
-            if minus_match:
-                amount = int(minus_match.group(1))
-                print(f"Found amount with minus pattern: {amount}")
-                return amount
-
-            # Try another pattern like "- X scraps"
-            alt_minus_pattern = r'-\s*(\d+)\s*scraps'
-            alt_minus_match = re.search(alt_minus_pattern, reason)
-            if alt_minus_match:
-                amount = int(alt_minus_match.group(1))
-                print(f"Found amount with alt minus pattern: {amount}")
-                return amount
-
-        elif transaction_type in ["Reimbursement", "Batch Add"]:
-            # Look for pattern like "(+X scraps)" or just numbers
-            plus_pattern = r'$$\+(\d+)\s*scraps$$'
-            plus_match = re.search(plus_pattern, reason)
-            if plus_match:
-                amount = int(plus_match.group(1))
-                print(f"Found amount with plus pattern: {amount}")
-                return amount
-
-            # Try another pattern like "+ X scraps"
-            alt_plus_pattern = r'\+\s*(\d+)\s*scraps'
-            alt_plus_match = re.search(alt_plus_pattern, reason)
-            if alt_plus_match:
-                amount = int(alt_plus_match.group(1))
-                print(f"Found amount with alt plus pattern: {amount}")
-                return amount
-
-        # If specific patterns fail, try to find any number in the reason
-        numbers = re.findall(r'\d+', reason)
-        if numbers:
-            amount = int(numbers[0])
-            print(f"Found amount with generic number pattern: {amount}")
-            return amount
-
-        # If no amount found, log it and return default
-        print(f"No amount found in reason: {reason}")
-        return None
-    except Exception as e:
-        print(f"Error extracting amount: {str(e)}")
-        return None
-
-
 # --- USER TRANSACTIONS API ---
 @app.route("/api/user-transactions", methods=["GET"])
 def user_transactions():
@@ -486,7 +513,7 @@ def user_transactions():
             with conn.cursor() as cur:
                 # Get user transactions
                 cur.execute("""
-                    SELECT name, reason, timestamp 
+                    SELECT name, reason, timestamp, amount, direction
                     FROM transaction_logs 
                     WHERE uuid = %s 
                     ORDER BY timestamp DESC 
@@ -502,7 +529,9 @@ def user_transactions():
                     transactions.append({
                         "type": transaction_type,
                         "reason": reason,
-                        "timestamp": timestamp.isoformat()
+                        "timestamp": timestamp.isoformat(),
+                        "amount": row[3],
+                        "direction": row[4]
                     })
 
                 return jsonify({
@@ -525,78 +554,43 @@ def transaction_analytics():
     transaction_type = request.args.get("type", "all")
 
     try:
-        # Calculate time range
+        # Calculate time range, in whole hours like the rollup
         end_time = datetime.now()
-        start_time = end_time - timedelta(hours=hours)
+        start_time = (end_time - timedelta(hours=hours)).replace(minute=0, second=0, microsecond=0)
 
         with get_db() as conn:
             with conn.cursor() as cur:
-                # Build query based on transaction type
-                if transaction_type == "all":
-                    query = """
-                        SELECT 
-                            DATE_TRUNC('hour', timestamp) as hour_timestamp,
-                            name,
-                            COUNT(*) as count
-                        FROM transaction_logs
-                        WHERE timestamp >= %s AND timestamp <= %s
-                        GROUP BY DATE_TRUNC('hour', timestamp), name
-                        ORDER BY hour_timestamp
-                    """
-                    cur.execute(query, (start_time, end_time))
-                else:
-                    query = """
-                        SELECT 
-                            DATE_TRUNC('hour', timestamp) as hour_timestamp,
-                            name,
-                            COUNT(*) as count
-                        FROM transaction_logs
-                        WHERE timestamp >= %s AND timestamp <= %s AND name = %s
-                        GROUP BY DATE_TRUNC('hour', timestamp), name
-                        ORDER BY hour_timestamp
-                    """
-                    cur.execute(query, (start_time, end_time, transaction_type))
-
+                # One row per hour in the range from the hourly rollup (see migrate_rollups.py), summed over its
+                # shards, hours without transactions included as zeros
+                cur.execute("""
+                    SELECT
+                        to_char(h.hour, 'YYYY-MM-DD HH24:00'),
+                        COALESCE(SUM(t.transactions) FILTER (WHERE t.name = 'Purchase'), 0)::BIGINT,
+                        COALESCE(SUM(t.transactions) FILTER (WHERE t.name = 'Reimbursement'), 0)::BIGINT,
+                        COALESCE(SUM(t.scraps) FILTER (WHERE t.name = 'Purchase'), 0)::BIGINT,
+                        COALESCE(SUM(t.scraps) FILTER (WHERE t.name = 'Reimbursement'), 0)::BIGINT
+                    FROM generate_series(%(start)s::timestamp, %(end)s::timestamp, interval '1 hour') h(hour)
+                    LEFT JOIN transaction_type_hourly t
+                        ON t.hour = h.hour AND (%(type)s = 'all' OR t.name = %(type)s)
+                    GROUP BY h.hour
+                    ORDER BY h.hour
+                """, {"start": start_time, "end": end_time, "type": transaction_type})
                 results = cur.fetchall()
 
-        # Process results into a format suitable for charts
-        hours_labels = []
-        purchases = []
-        reimbursements = []
-
-        # Create a dictionary to store counts by hour
-        hour_data = {}
-
-        for row in results:
-            hour_str = row[0].strftime("%Y-%m-%d %H:00")
-            if hour_str not in hour_data:
-                hour_data[hour_str] = {"Purchase": 0, "Reimbursement": 0}
-
-            transaction_name = row[1]
-            if transaction_name in ["Purchase", "Reimbursement"]:
-                hour_data[hour_str][transaction_name] = row[2]
-
-        # Fill in missing hours in the range
-        current_hour = start_time.replace(minute=0, second=0, microsecond=0)
-        while current_hour <= end_time:
-            hour_str = current_hour.strftime("%Y-%m-%d %H:00")
-            if hour_str not in hour_data:
-                hour_data[hour_str] = {"Purchase": 0, "Reimbursement": 0}
-            current_hour += timedelta(hours=1)
-
-        # Sort hours and create final arrays
-        sorted_hours = sorted(hour_data.keys())
-        for hour in sorted_hours:
-            hours_labels.append(hour)
-            purchases.append(hour_data[hour]["Purchase"])
-            reimbursements.append(hour_data[hour]["Reimbursement"])
+        hours_labels = [row[0] for row in results]
+        purchases = [row[1] for row in results]
+        reimbursements = [row[2] for row in results]
+        purchased_scraps = [row[3] for row in results]
+        reimbursed_scraps = [row[4] for row in results]
 
         return jsonify({
             "success": True,
             "data": {
                 "labels": hours_labels,
                 "purchases": purchases,
-                "reimbursements": reimbursements
+                "reimbursements": reimbursements,
+                "purchasedScraps": purchased_scraps,
+                "reimbursedScraps": reimbursed_scraps
             }
         })
     except Exception as e:
@@ -613,17 +607,13 @@ def dashboard_stats():
     try:
         with get_db() as conn:
             with conn.cursor() as cur:
-                # Get total users
-                cur.execute("SELECT COUNT(*) FROM credit_card")
-                total_users = cur.fetchone()[0]
-
-                # Get total transactions
-                cur.execute("SELECT COUNT(*) FROM transaction_logs")
-                total_transactions = cur.fetchone()[0]
-
-                # Get total scraps
-                cur.execute("SELECT SUM(scraps) FROM credit_card")
-                total_scraps = cur.fetchone()[0] or 0
+                # Running totals, kept current by triggers on credit_card and transaction_logs, one row per shard
+                cur.execute("""
+                    SELECT COALESCE(sum(users), 0)::BIGINT, COALESCE(sum(transactions), 0)::BIGINT,
+                           COALESCE(sum(scraps), 0)::BIGINT
+                    FROM bank_totals
+                """)
+                total_users, total_transactions, total_scraps = cur.fetchone()
 
         return jsonify({
             "success": True,
@@ -742,33 +732,15 @@ def fraud_detection():
                 # 4. Detect unusual transaction times (outside normal hours 8am-8pm)
                 unusual_times = []  # Empty list since we're removing this risk factor
 
-                # 5. Detect sudden balance changes
-                cur.execute(r"""
-                    WITH balance_changes AS (
-    SELECT 
-        tl.uuid,
-        tl.name AS transaction_type,
-        CASE 
-            WHEN tl.name IN ('Purchase', 'Batch Remove') THEN -1
-            WHEN tl.name IN ('Reimbursement', 'Batch Add') THEN 1
-            ELSE 0
-        END AS direction,
-        tl.reason,
-        tl.timestamp
-    FROM transaction_logs tl
-    WHERE timestamp >= %s
-)
-SELECT 
-    uuid, 
-    COUNT(*) AS large_changes
-FROM balance_changes
-WHERE 
-    reason ~ '[-+]?\d{2,}'  -- Matches numbers 30 and above (positive or negative)
-    AND ABS(CAST((regexp_match(reason, '[-+]?\d{2,}'))[1] AS INTEGER)) >= 30
-GROUP BY uuid
-HAVING COUNT(*) > 2
-ORDER BY large_changes DESC
-LIMIT 10;
+                # 5. Detect sudden balance changes (30 scraps or more either way)
+                cur.execute("""
+                    SELECT uuid, COUNT(*) AS large_changes
+                    FROM transaction_logs
+                    WHERE timestamp >= %s AND amount >= 30
+                    GROUP BY uuid
+                    HAVING COUNT(*) > 2
+                    ORDER BY large_changes DESC
+                    LIMIT 10
                 """, (start_time,))
 
                 large_changes = []
@@ -846,6 +818,52 @@ LIMIT 10;
         return jsonify({"success": False, "message": str(e)}), 500
 
 
+# --- SUPERVISED WORKER ---
+def serve_worker(listen_fd, health_fd):
+    """ Serve on the sockets inherited from server_wrapper.py, finishing in-flight requests on SIGTERM. """
+    global HEALTH_PORT
+    health = socket.socket(fileno=health_fd)
+    HEALTH_PORT = health.getsockname()[1]
+    server = create_server(app, sockets=[socket.socket(fileno=listen_fd), health])
+
+    def close_idle_channels():
+        # Runs on the server loop, so no request can start on a connection between the check and the close
+        for channel in list(server.map.values()):
+            if (isinstance(channel, HTTPChannel) and not channel.requests and channel.request is None
+                    and not channel.total_outbufs_len):
+                channel.will_close = True  # A kept-alive connection between requests, the client reconnects
+
+    def idle() -> bool:
+        with REQUEST_STATS_LOCK:
+            if REQUEST_STATS["in_flight"]:
+                return False
+        dispatcher = server.task_dispatcher
+        with dispatcher.lock:
+            if dispatcher.queue or dispatcher.active_count:
+                return False
+        # Every response written out and its connection closed
+        return not any(isinstance(channel, HTTPChannel) for channel in list(server.map.values()))
+
+    def exit_when_idle(listener):
+        deadline = time.monotonic() + WORKER_DRAIN_TIMEOUT
+        while time.monotonic() < deadline and not idle():
+            # Connections go idle as their last response is flushed
+            listener.trigger.pull_trigger(close_idle_channels)
+            time.sleep(0.1)
+        os._exit(0)
+
+    def drain(sig, frame):
+        # Stop accepting, the other workers keep taking connections from the shared socket
+        print(f"Worker {os.getpid()} draining...")
+        listeners = [dispatcher for dispatcher in list(server.map.values()) if isinstance(dispatcher, BaseWSGIServer)]
+        for listener in listeners:
+            listener.accepting = False
+        threading.Thread(target=exit_when_idle, args=(listeners[0],), daemon=True).start()
+
+    signal.signal(signal.SIGTERM, drain)
+    server.run()
+
+
 if __name__ == "__main__":
     print("Starting Flask application...")
     try:
@@ -855,8 +873,12 @@ if __name__ == "__main__":
                 cur_main.execute("SELECT 1")
         print("Database connection successful")
 
-        # Run with Waitress
-        serve(app, host="0.0.0.0", port=5000)
+        if os.getenv("BANK_LISTEN_FD"):
+            # Started by server_wrapper.py, which owns the listening socket
+            serve_worker(int(os.getenv("BANK_LISTEN_FD")), int(os.getenv("BANK_HEALTH_FD")))
+        else:
+            # Run with Waitress
+            serve(app, host="0.0.0.0", port=5000)
     except Exception as err:
         print(f"Failed to start application: {str(err)}")
         sys.exit(1)
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+import argparse
+import os
+
+import psycopg2
+
+from migrate_transaction_amounts import apply_schema as apply_amount_schema
+
+DB_URL = os.getenv('DB_URL')
+# Counter rows per rollup, concurrent writers spread over them
+ROLLUP_SHARDS = int(os.getenv("ROLLUP_SHARDS", 16))
+
+# Transactions and scraps moved per hour and type, and bank-wide running totals, kept current by triggers so the
+# dashboard and analytics never scan transaction_logs. The same tables and triggers as the Sharjah app's
+# create_tables (which shares them), so whichever app sets them up first, the other finds them as expected. Each
+# database session adds to its own shard row and readers sum the shards; compaction folds them back into shard 0.
+SCHEMA = [
+    f"""
+    CREATE OR REPLACE FUNCTION rollup_shard() RETURNS INTEGER AS $$
+        SELECT pg_backend_pid() % {ROLLUP_SHARDS}
+    $$ LANGUAGE sql
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS transaction_type_hourly (
+        hour TIMESTAMP NOT NULL,
+        name VARCHAR(255) NOT NULL,
+        shard INTEGER NOT NULL DEFAULT 0,
+        transactions INTEGER NOT NULL DEFAULT 0,
+        scraps BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (hour, name, shard)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS bank_totals (
+        id INTEGER PRIMARY KEY,  -- The shard
+        users BIGINT NOT NULL DEFAULT 0,
+        transactions BIGINT NOT NULL DEFAULT 0,
+        scraps BIGINT NOT NULL DEFAULT 0
+    )
+    """,
+    # Before the shards there was one row per hour and type, and a single totals row (id = 1)
+    """
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_schema = current_schema()
+                       AND table_name = 'transaction_type_hourly' AND column_name = 'shard') THEN
+            ALTER TABLE transaction_type_hourly ADD COLUMN shard INTEGER NOT NULL DEFAULT 0;
+            ALTER TABLE transaction_type_hourly DROP CONSTRAINT transaction_type_hourly_pkey;
+            ALTER TABLE transaction_type_hourly ADD PRIMARY KEY (hour, name, shard);
+        END IF;
+    END;
+    $$
+    """,
+    # Rollups from before the scraps column are emptied, and rebuilt with it below
+    """
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_schema = current_schema()
+                       AND table_name = 'transaction_type_hourly' AND column_name = 'scraps') THEN
+            LOCK TABLE transaction_logs IN SHARE MODE;
+            ALTER TABLE transaction_type_hourly ADD COLUMN scraps BIGINT NOT NULL DEFAULT 0;
+            DELETE FROM transaction_type_hourly;
+        END IF;
+    END;
+    $$
+    """,
+    """
+    ALTER TABLE bank_totals DROP CONSTRAINT IF EXISTS bank_totals_id_check
+    """,
+    """
+    INSERT INTO bank_totals (id, users, transactions, scraps)
+    SELECT 0, (SELECT count(*) FROM credit_card), (SELECT count(*) FROM transaction_logs),
+           (SELECT COALESCE(sum(scraps), 0) FROM credit_card)
+    WHERE NOT EXISTS (SELECT 1 FROM bank_totals)
+    """,
+    """
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM transaction_type_hourly) THEN
+            INSERT INTO transaction_type_hourly (hour, name, transactions, scraps)
+            SELECT date_trunc('hour', timestamp), name, count(*),
+                   COALESCE(sum(COALESCE(amount, transaction_amount(name, reason))), 0)
+            FROM transaction_logs
+            GROUP BY 1, 2;
+        END IF;
+    END;
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION add_bank_totals(users_delta BIGINT, transactions_delta BIGINT, scraps_delta BIGINT)
+    RETURNS VOID AS $$
+        INSERT INTO bank_totals AS t (id, users, transactions, scraps)
+        VALUES (rollup_shard(), users_delta, transactions_delta, scraps_delta)
+        ON CONFLICT (id) DO UPDATE SET users = t.users + EXCLUDED.users,
+                                       transactions = t.transactions + EXCLUDED.transactions,
+                                       scraps = t.scraps + EXCLUDED.scraps
+    $$ LANGUAGE sql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION roll_up_transaction_counts() RETURNS TRIGGER AS $$
+    BEGIN
+        -- Deletes are counted off this session's shard as well, a shard may go negative, only the sum matters
+        IF TG_OP = 'INSERT' THEN
+            INSERT INTO transaction_type_hourly AS r (hour, name, shard, transactions, scraps)
+            SELECT date_trunc('hour', timestamp), name, rollup_shard(), count(*),
+                   COALESCE(sum(COALESCE(amount, transaction_amount(name, reason))), 0)
+            FROM new_rows
+            GROUP BY 1, 2
+            ON CONFLICT (hour, name, shard) DO UPDATE SET transactions = r.transactions + EXCLUDED.transactions,
+                                                          scraps = r.scraps + EXCLUDED.scraps;
+            PERFORM add_bank_totals(0, (SELECT count(*) FROM new_rows), 0);
+        ELSE
+            INSERT INTO transaction_type_hourly AS r (hour, name, shard, transactions, scraps)
+            SELECT date_trunc('hour', timestamp), name, rollup_shard(), -count(*),
+                   -COALESCE(sum(COALESCE(amount, transaction_amount(name, reason))), 0)
+            FROM old_rows
+            GROUP BY 1, 2
+            ON CONFLICT (hour, name, shard) DO UPDATE SET transactions = r.transactions + EXCLUDED.transactions,
+                                                          scraps = r.scraps + EXCLUDED.scraps;
+            PERFORM add_bank_totals(0, -(SELECT count(*) FROM old_rows), 0);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION roll_up_bank_totals() RETURNS TRIGGER AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            PERFORM add_bank_totals((SELECT count(*) FROM new_rows), 0,
+                                    (SELECT COALESCE(sum(scraps), 0) FROM new_rows));
+        ELSIF TG_OP = 'DELETE' THEN
+            PERFORM add_bank_totals(-(SELECT count(*) FROM old_rows), 0,
+                                    -(SELECT COALESCE(sum(scraps), 0) FROM old_rows));
+        ELSE
+            PERFORM add_bank_totals(0, 0, (SELECT COALESCE(sum(scraps), 0) FROM new_rows)
+                                          - (SELECT COALESCE(sum(scraps), 0) FROM old_rows));
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    # Transition tables allow one event per trigger, hence one trigger per event
+    """
+    DROP TRIGGER IF EXISTS transaction_logs_count_insert ON transaction_logs;
+    CREATE TRIGGER transaction_logs_count_insert
+    AFTER INSERT ON transaction_logs REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION roll_up_transaction_counts()
+    """,
+    """
+    DROP TRIGGER IF EXISTS transaction_logs_count_delete ON transaction_logs;
+    CREATE TRIGGER transaction_logs_count_delete
+    AFTER DELETE ON transaction_logs REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION roll_up_transaction_counts()
+    """,
+    """
+    DROP TRIGGER IF EXISTS credit_card_totals_insert ON credit_card;
+    CREATE TRIGGER credit_card_totals_insert
+    AFTER INSERT ON credit_card REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION roll_up_bank_totals()
+    """,
+    """
+    DROP TRIGGER IF EXISTS credit_card_totals_update ON credit_card;
+    CREATE TRIGGER credit_card_totals_update
+    AFTER UPDATE ON credit_card REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION roll_up_bank_totals()
+    """,
+    """
+    DROP TRIGGER IF EXISTS credit_card_totals_delete ON credit_card;
+    CREATE TRIGGER credit_card_totals_delete
+    AFTER DELETE ON credit_card REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION roll_up_bank_totals()
+    """,
+]
+
+
+def apply_schema(conn):
+    """ Create the rollup tables and triggers and fill them from the logs (safe to run again). """
+    # The scraps rollup sums transaction_amount, which the amounts migration defines
+    apply_amount_schema(conn)
+    with conn.cursor() as cur:
+        for statement in SCHEMA:
+            cur.execute(statement)
+    conn.commit()
+
+
+def compact(conn):
+    """ Fold the shard rows into shard 0, the sums stay the same so writers can carry on. """
+    with conn.cursor() as cur:
+        # Finished hours only, the current one is still being written to
+        cur.execute("""
+            WITH folded AS (
+                DELETE FROM transaction_type_hourly
+                WHERE shard <> 0 AND hour < date_trunc('hour', LOCALTIMESTAMP)
+                RETURNING hour, name, transactions, scraps
+            )
+            INSERT INTO transaction_type_hourly AS r (hour, name, shard, transactions, scraps)
+            SELECT hour, name, 0, sum(transactions), sum(scraps) FROM folded GROUP BY 1, 2
+            ON CONFLICT (hour, name, shard) DO UPDATE SET transactions = r.transactions + EXCLUDED.transactions,
+                                                          scraps = r.scraps + EXCLUDED.scraps
+        """)
+        cur.execute("""
+            WITH folded AS (
+                DELETE FROM bank_totals WHERE id <> 0 RETURNING users, transactions, scraps
+            )
+            INSERT INTO bank_totals AS t (id, users, transactions, scraps)
+            SELECT 0, sum(users), sum(transactions), sum(scraps) FROM folded HAVING count(*) > 0
+            ON CONFLICT (id) DO UPDATE SET users = t.users + EXCLUDED.users,
+                                           transactions = t.transactions + EXCLUDED.transactions,
+                                           scraps = t.scraps + EXCLUDED.scraps
+        """)
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Set up the dashboard rollups, or compact their shards")
+    parser.add_argument("--dsn", default=DB_URL)
+    parser.add_argument("--compact", action="store_true", help="Only fold the shard rows together (e.g. from cron)")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(args.dsn)
+    try:
+        if args.compact:
+            compact(conn)
+            print("Rollups compacted")
+        else:
+            apply_schema(conn)
+            print("Rollups ready")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
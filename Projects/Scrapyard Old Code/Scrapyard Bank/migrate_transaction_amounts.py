@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import time
+
+import psycopg2
+
+DB_URL = os.getenv('DB_URL')
+# Rows parsed per transaction by the backfill
+CHUNK_SIZE = int(os.getenv("BACKFILL_CHUNK_SIZE", 10000))
+# Name of this migration in migration_progress
+MIGRATION = "transaction_logs_amounts"
+
+# Typed amount/direction columns, the parsing rules as SQL functions, and a trigger filling them in for writers
+# that still only log a reason (e.g. the Sharjah app, which shares this table). All in one transaction, so no row
+# is written between adding the columns and the trigger.
+SCHEMA = [
+    """
+    ALTER TABLE transaction_logs
+        ADD COLUMN IF NOT EXISTS amount INTEGER,
+        ADD COLUMN IF NOT EXISTS direction SMALLINT
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS migration_progress (
+        name TEXT PRIMARY KEY,
+        last_id INTEGER NOT NULL DEFAULT 0,
+        finished_at TIMESTAMP
+    )
+    """,
+    r"""
+    CREATE OR REPLACE FUNCTION transaction_amount(name TEXT, reason TEXT) RETURNS INTEGER AS $$
+        -- The old extract_amount_from_reason: "(-X scraps)" / "(+X scraps)" by type, else the first number
+        SELECT CASE WHEN length(digits) <= 9 THEN digits::INTEGER END
+        FROM (SELECT COALESCE(
+            CASE
+                WHEN name IN ('Purchase', 'Batch Remove') THEN substring(reason FROM '-\s*(\d+)\s*scraps')
+                WHEN name IN ('Reimbursement', 'Batch Add') THEN substring(reason FROM '\+\s*(\d+)\s*scraps')
+            END,
+            substring(reason FROM '(\d+)')
+        ) AS digits) parsed
+    $$ LANGUAGE sql IMMUTABLE
+    """,
+    """
+    CREATE OR REPLACE FUNCTION transaction_direction(name TEXT) RETURNS SMALLINT AS $$
+        SELECT CASE
+            WHEN name IN ('Purchase', 'Batch Remove') THEN -1
+            WHEN name IN ('Reimbursement', 'Batch Add') THEN 1
+            ELSE 0
+        END::SMALLINT
+    $$ LANGUAGE sql IMMUTABLE
+    """,
+    """
+    CREATE OR REPLACE FUNCTION fill_transaction_amount() RETURNS trigger AS $$
+    BEGIN
+        IF NEW.amount IS NULL THEN
+            NEW.amount := transaction_amount(NEW.name, NEW.reason);
+        END IF;
+        IF NEW.direction IS NULL THEN
+            NEW.direction := transaction_direction(NEW.name);
+        END IF;
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS transaction_logs_fill_amount ON transaction_logs",
+    """
+    CREATE TRIGGER transaction_logs_fill_amount
+    BEFORE INSERT ON transaction_logs
+    FOR EACH ROW EXECUTE FUNCTION fill_transaction_amount()
+    """,
+]
+
+
+def apply_schema(conn):
+    """ Add the columns, functions and trigger (safe to run again). """
+    with conn.cursor() as cur:
+        for statement in SCHEMA:
+            cur.execute(statement)
+        cur.execute("INSERT INTO migration_progress (name) VALUES (%s) ON CONFLICT (name) DO NOTHING", (MIGRATION,))
+    conn.commit()
+
+
+def backfill(conn, chunk_size=CHUNK_SIZE, progress=None):
+    """ Parse historical rows in id order, one transaction per chunk, resuming from the last committed chunk. """
+    with conn.cursor() as cur:
+        cur.execute("SELECT last_id FROM migration_progress WHERE name = %s", (MIGRATION,))
+        last_id = cur.fetchone()[0]
+    conn.commit()
+
+    total = 0
+    while True:
+        with conn.cursor() as cur:
+            cur.execute("""
+                WITH batch AS (
+                    SELECT id FROM transaction_logs WHERE id > %s ORDER BY id LIMIT %s
+                ), parsed AS (
+                    UPDATE transaction_logs t
+                    SET amount = COALESCE(t.amount, transaction_amount(t.name, t.reason)),
+                        direction = COALESCE(t.direction, transaction_direction(t.name))
+                    FROM batch
+                    WHERE t.id = batch.id
+                    RETURNING t.id
+                )
+                SELECT max(id), count(*) FROM parsed
+            """, (last_id, chunk_size))
+            max_id, count = cur.fetchone()
+            if not count:
+                cur.execute("UPDATE migration_progress SET finished_at = now() WHERE name = %s", (MIGRATION,))
+                conn.commit()
+                return total
+
+            # Saved with the chunk, an interrupted backfill picks up right after it
+            last_id = max_id
+            cur.execute("UPDATE migration_progress SET last_id = %s WHERE name = %s", (last_id, MIGRATION))
+        conn.commit()
+        total += count
+        if progress:
+            progress(total, last_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Store transaction amounts as columns and backfill old logs")
+    parser.add_argument("--dsn", default=DB_URL)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--restart", action="store_true", help="Backfill from the first row again")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(args.dsn)
+    try:
+        apply_schema(conn)
+        if args.restart:
+            with conn.cursor() as cur:
+                cur.execute("UPDATE migration_progress SET last_id = 0, finished_at = NULL WHERE name = %s",
+                            (MIGRATION,))
+            conn.commit()
+        print("Schema ready, backfilling...")
+
+        start = time.time()
+
+        def report(rows, last_id):
+            print(f"Backfilled {rows} rows (up to id {last_id}), {rows / (time.time() - start):.0f} rows/s")
+
+        rows = backfill(conn, args.chunk_size, report)
+        print(f"Backfill finished: {rows} rows in {time.time() - start:.1f} seconds")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,116 +1,292 @@
 #!/usr/bin/env python3
+import http.client
+import json
+import os
 import signal
+import socket
 import subprocess
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-# Maximum number of restarts before giving up
+# Worker processes serving the bank, all accepting from one listening socket
+WORKERS = int(os.getenv("BANK_WORKERS", os.cpu_count() or 2))
+# Address the bank is served on
+HOST = os.getenv("BANK_HOST", "0.0.0.0")
+PORT = int(os.getenv("BANK_PORT", 5000))
+# Time between health probes of each worker (in seconds)
+HEALTH_INTERVAL = 5
+# Time a health probe may take (in seconds)
+HEALTH_TIMEOUT = 3
+# Failed probes in a row before a worker is replaced
+HEALTH_FAILURES = 3
+# Time a new worker has to pass its first probe (in seconds)
+STARTUP_TIMEOUT = 30
+# Time a stopped worker gets to finish its requests before it is killed (in seconds)
+DRAIN_TIMEOUT = 30
+# Delay before restarting a worker, doubled on every failure up to the maximum (in seconds)
+RESTART_DELAY = 1
+MAX_RESTART_DELAY = 60
+# Time a worker must stay healthy before its restart delay is reset (in seconds)
+BACKOFF_RESET = 60
+# Maximum number of restarts of one worker before giving up
 MAX_RESTARTS = 10
-# Time to wait between restarts (in seconds)
-RESTART_DELAY = 5
 # Time window for restart counting (in seconds)
 RESTART_WINDOW = 300  # 5 minutes
+# Time between request stats reports (in seconds)
+STATS_INTERVAL = int(os.getenv("BANK_STATS_INTERVAL", 30))
+# Upper bounds (ms) of the latency histogram, must match LATENCY_BUCKETS_MS in app.py
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
 
-# Track restarts
-restart_times = []
+# Log lines meaning the worker lost its database and should be replaced
+FATAL_ERRORS = ("could not translate host name", "Error in database connection")
 
 
-def signal_handler(sig):
-    """Handle termination signals by cleaning up the child process."""
-    print(f"Received signal {sig}, shutting down...")
-    if current_process:
-        print("Terminating Flask server...")
+class Worker:
+    """One worker process, serving the shared socket plus a private socket used for health probes."""
+
+    def __init__(self, slot, listener):
+        self.slot = slot
+        health = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        health.bind(("127.0.0.1", 0))
+        health.listen(16)
+        self.health_port = health.getsockname()[1]
+
+        env = dict(os.environ, BANK_LISTEN_FD=str(listener.fileno()), BANK_HEALTH_FD=str(health.fileno()),
+                   WORKER_DRAIN_TIMEOUT=str(DRAIN_TIMEOUT))
+        # Use sys.executable to ensure we use the same Python interpreter
+        self.process = subprocess.Popen(
+            [sys.executable, "app.py"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+            bufsize=1,  # Line buffered
+            env=env,
+            pass_fds=(listener.fileno(), health.fileno())
+        )
+        health.close()  # The worker has its own copy
+
+        self.started = time.time()
+        self.healthy_since = None
+        self.failures = 0
+        self.fatal = False
+        self.last_stats = None
+        threading.Thread(target=self.monitor_output, daemon=True).start()
+
+    @property
+    def name(self):
+        return f"worker {self.slot} (pid {self.process.pid})"
+
+    def monitor_output(self):
+        """Print the worker's output and watch it for database errors."""
+        for line in self.process.stdout:
+            print(f"[{self.name}] {line.strip().replace('INFO:werkzeug:', '').replace('INFO:__main__:', '')}")
+            if any(error in line for error in FATAL_ERRORS):
+                print(f"[{self.name}] Database connection error detected!")
+                self.fatal = True
+
+    def probe(self):
+        """GET /healthz on the worker's private socket, returns its stats or None."""
         try:
-            current_process.terminate()
-            current_process.wait(timeout=5)
-        except subprocess.TimeoutExpired:
-            print("Flask server did not terminate gracefully, killing...")
-            current_process.kill()
-    else:
-        print("No running process to terminate.")
-    sys.exit(0)
+            conn = http.client.HTTPConnection("127.0.0.1", self.health_port, timeout=HEALTH_TIMEOUT)
+            try:
+                conn.request("GET", "/healthz")
+                response = conn.getresponse()
+                stats = json.loads(response.read())
+                return stats if response.status == 200 else None
+            finally:
+                conn.close()
+        except (OSError, ValueError, http.client.HTTPException):
+            return None
 
+    def stop(self):
+        """Ask the worker to finish its requests and exit, kill it if it takes too long."""
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=DRAIN_TIMEOUT + 5)
+            except subprocess.TimeoutExpired:
+                print(f"{self.name} did not stop gracefully, killing...")
+                self.process.kill()
+                self.process.wait()
 
-# Register signal handlers
-signal.signal(signal.SIGINT, signal_handler)
-signal.signal(signal.SIGTERM, signal_handler)
 
+class Supervisor:
+    def __init__(self, workers):
+        self.listener = socket.create_server((HOST, PORT), backlog=1024)
+        self.listener.set_inheritable(True)
+        self.workers = [None] * workers
+        self.delays = [RESTART_DELAY] * workers
+        self.next_start = [0.0] * workers
+        self.restart_times = [[] for _ in range(workers)]
+        self.reported = {}  # slot -> stats at the last report
+        self.last_report = time.time()
+        self.rolling_restart = False
+        self.running = True
+        self.probes = ThreadPoolExecutor(max_workers=workers)
 
-def monitor_output(process):
-    """Monitor the process output for specific error messages."""
-    while True:
-        # Read a line from stderr
-        line = process.stderr.readline()
-        if not line and process.poll() is not None:
-            break
+    def start(self, slot):
+        # Track restarts, giving up like before if a worker keeps dying
+        current_time = time.time()
+        self.restart_times[slot] = [t for t in self.restart_times[slot] if current_time - t < RESTART_WINDOW]
+        if len(self.restart_times[slot]) >= MAX_RESTARTS:
+            print(f"Too many restarts of worker {slot} ({len(self.restart_times[slot])}) "
+                  f"in the last {RESTART_WINDOW} seconds. Giving up.")
+            self.shutdown(1)
+        self.restart_times[slot].append(current_time)
 
-        if line:
-            # Log
-            print(f"{line.strip().replace('INFO:werkzeug:', '').replace('INFO:__main__:', '')}")
+        worker = Worker(slot, self.listener)
+        print(f"Started {worker.name}, health checks on port {worker.health_port}")
+        return worker
 
-            # Check for the specific database connection error
-            if "psycopg2.OperationalError" in line and "could not translate host name" in line:
-                print("Database connection error detected! Restarting server...")
-                return True  # Signal that we need to restart
+    def schedule_restart(self, slot, reason):
+        delay = self.delays[slot]
+        print(f"Worker {slot} {reason}, restarting in {delay} seconds...")
+        self.workers[slot] = None
+        self.next_start[slot] = time.time() + delay
+        self.delays[slot] = min(delay * 2, MAX_RESTART_DELAY)
 
-            # Check for other critical errors that might require restart
-            if "Error in database connection" in line:
-                print("Database connection error detected! Restarting server...")
-                return True
+    def check(self, worker, stats):
+        """Act on one probe result, returns False when the worker has to go."""
+        now = time.time()
+        if stats is not None:
+            worker.failures = 0
+            worker.last_stats = stats
+            if worker.healthy_since is None:
+                worker.healthy_since = now
+                print(f"{worker.name} is healthy")
+            elif now - worker.healthy_since > BACKOFF_RESET:
+                self.delays[worker.slot] = RESTART_DELAY
+            return not worker.fatal
 
-    # If we get here, the process exited without the specific error
-    exit_code = process.poll()
-    print(f"Flask server exited with code {exit_code}")
-    return exit_code != 0  # Restart if exit code is non-zero
+        worker.failures += 1
+        if worker.healthy_since is None:
+            return now - worker.started < STARTUP_TIMEOUT
+        return worker.failures < HEALTH_FAILURES and not worker.fatal
 
+    def supervise(self):
+        now = time.time()
+        for slot, worker in enumerate(self.workers):
+            if worker is None and now >= self.next_start[slot]:
+                self.workers[slot] = self.start(slot)
+            elif worker is not None and worker.process.poll() is not None:
+                self.schedule_restart(slot, f"exited with code {worker.process.returncode}")
 
-if __name__ == "__main__":
-    print("Server wrapper starting...")
-    restart_count = 0
+        live = [worker for worker in self.workers if worker is not None]
+        for worker, stats in zip(live, self.probes.map(Worker.probe, live)):
+            if not self.check(worker, stats):
+                # Its replacement comes up while the other workers keep serving
+                threading.Thread(target=worker.stop, daemon=True).start()
+                self.schedule_restart(worker.slot, "is unhealthy")
 
-    while True:
-        # Clean up old restart times
-        current_time = time.time()
-        restart_times = [t for t in restart_times if current_time - t < RESTART_WINDOW]
+    def replace(self, slot):
+        """Start a new worker for the slot, and stop the old one once the new one passes a probe."""
+        old = self.workers[slot]
+        new = self.start(slot)
+        while time.time() - new.started < STARTUP_TIMEOUT and new.process.poll() is None:
+            if self.check(new, new.probe()) and new.healthy_since:
+                break
+            time.sleep(1)
+        if new.healthy_since is None:
+            print(f"{new.name} did not become healthy, keeping {old.name if old else 'the slot empty'}")
+            new.stop()
+            return False
+        self.workers[slot] = new
+        if old:
+            print(f"Draining {old.name}...")
+            old.stop()
+        return True
 
-        # Check if we've restarted too many times
-        if len(restart_times) >= MAX_RESTARTS:
-            print(
-                f"Too many restarts ({len(restart_times)}) in the last {RESTART_WINDOW} seconds. Giving up.")
-            sys.exit(1)
+    def restart_all(self):
+        """Rolling restart, one worker at a time so the others keep serving."""
+        print("Rolling restart...")
+        for slot in range(len(self.workers)):
+            if not self.running:
+                return
+            if not self.replace(slot):
+                print("Rolling restart aborted")
+                return
+        print("Rolling restart done")
 
-        # Start the server
-        print("Starting Flask server...")
+    def report(self):
+        """Print each worker's requests and latency since the last report."""
+        now = time.time()
+        elapsed = now - self.last_report
+        self.last_report = now
+        for worker in self.workers:
+            if worker is None or worker.last_stats is None:
+                continue
+            stats = worker.last_stats
+            previous = self.reported.get(worker.slot)
+            if previous is None or previous["pid"] != stats["pid"]:
+                previous = {"requests": 0, "errors": 0, "latency_ms": 0.0, "buckets": [0] * len(stats["buckets"])}
+            self.reported[worker.slot] = stats
 
-        # Use sys.executable to ensure we use the same Python interpreter
-        current_process = subprocess.Popen(
-            [sys.executable, "app.py"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True,
-            bufsize=1  # Line buffered
-        )
+            requests = stats["requests"] - previous["requests"]
+            if not requests:
+                print(f"[{worker.name}] idle")
+                continue
+            errors = stats["errors"] - previous["errors"]
+            average = (stats["latency_ms"] - previous["latency_ms"]) / requests
+            buckets = [now_count - then for now_count, then in zip(stats["buckets"], previous["buckets"])]
+            print(f"[{worker.name}] {requests} requests ({requests / elapsed:.1f}/s), {errors} errors, "
+                  f"avg {average:.1f}ms, p50 {percentile(buckets, 0.5)}, p95 {percentile(buckets, 0.95)}, "
+                  f"{stats['in_flight']} in flight")
 
-        # Record the restart time
-        restart_times.append(time.time())
-        restart_count += 1
+    def run(self):
+        print(f"Serving on {HOST}:{PORT} with {len(self.workers)} workers")
+        while self.running:
+            if self.rolling_restart:
+                self.rolling_restart = False
+                self.restart_all()
+            self.supervise()
+            if time.time() - self.last_report >= STATS_INTERVAL:
+                self.report()
+            time.sleep(HEALTH_INTERVAL)
 
-        # Monitor the server output
-        needs_restart = monitor_output(current_process)
+    def shutdown(self, code=0):
+        self.running = False
+        workers = [worker for worker in self.workers if worker is not None]
+        print("Terminating workers...")
+        stoppers = [threading.Thread(target=worker.stop) for worker in workers]
+        for stopper in stoppers:
+            stopper.start()
+        for stopper in stoppers:
+            stopper.join()
+        self.listener.close()
+        sys.exit(code)
 
-        # If the server doesn't need to restart, we're done
-        if not needs_restart:
-            break
 
-        print(f"Waiting {RESTART_DELAY} seconds before restarting...")
-        time.sleep(RESTART_DELAY)
+def percentile(buckets, fraction):
+    """Upper bound of the latency bucket holding the given fraction of requests."""
+    target = sum(buckets) * fraction
+    seen = 0
+    for bound, count in zip(LATENCY_BUCKETS_MS + (None,), buckets):
+        seen += count
+        if seen >= target:
+            return f"<={bound}ms" if bound else f">{LATENCY_BUCKETS_MS[-1]}ms"
+    return "n/a"
 
-        # Try to terminate the process if it's still running
-        if current_process.poll() is None:
-            print("Terminating Flask server...")
-            current_process.terminate()
-            try:
-                current_process.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                print("Flask server did not terminate gracefully, killing...")
-                current_process.kill()
+
+def signal_handler(sig, frame):
+    """Handle termination signals by draining the workers."""
+    print(f"Received signal {sig}, shutting down...")
+    supervisor.shutdown(0)
+
+
+def rolling_restart_handler(sig, frame):
+    """SIGHUP replaces the workers one by one, e.g. after deploying new code."""
+    supervisor.rolling_restart = True
+
+
+if __name__ == "__main__":
+    print("Server wrapper starting...")
+    supervisor = Supervisor(WORKERS)
+
+    # Register signal handlers
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+    signal.signal(signal.SIGHUP, rolling_restart_handler)
+
+    supervisor.run()
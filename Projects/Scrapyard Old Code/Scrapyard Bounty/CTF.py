@@ -1,12 +1,16 @@
 import os
+import queue
 import re
+import sqlite3
 import tempfile
+import threading
 import time
 import uuid
+import zlib
+from collections import OrderedDict
 from datetime import datetime
 from functools import wraps
 from io import BytesIO
-from typing import List
 
 import psycopg2
 import requests
@@ -54,14 +58,22 @@ if "ERR" in [FLAG_1, FLAG_2, FLAG_3, FLAG_4, FLAG_5, KEY]:
 VALID_API_KEYS = [os.getenv("API")]
 
 # Global Tracker Variables
-RATE_LIMIT = 0
-LAST_RESET_TIME = time.time()
 START_TIME = time.time()
 
+# Rate limit Global Var
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB")  # SQLite file shared by all workers, in-process only if unset
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", 100000))  # In-process store evicts beyond this
+ADMIN_FAILED_LIMIT = 15  # Invalid admin API keys allowed per IP per hour
+
 # DB Global Var
 DB_URL_AIVEN = os.getenv("DB_URL_AIVEN")
 DB_NAME = os.getenv("DB_NAME")
 
+# Retry Global Var
+RETRY_TIMEOUT = float(os.getenv("RETRY_TIMEOUT", 5))  # Seconds /retry waits for the retried URL
+RETRY_CACHE_TTL = float(os.getenv("RETRY_CACHE_TTL", 10))  # Seconds a /retry result is reused
+RETRY_CACHE_SIZE = int(os.getenv("RETRY_CACHE_SIZE", 256))  # Retried URLs kept in the cache
+
 
 # ------------------------- DATABASE ------------------------- #
 
@@ -71,21 +83,102 @@ def get_db_connection() -> psycopg2._psycopg.connection:
     return conn
 
 
-# Reset admin required rate limit
-def reset_rate_limit():
-    global RATE_LIMIT, LAST_RESET_TIME
-    if time.time() - LAST_RESET_TIME >= 3600:
-        RATE_LIMIT = 0
-        LAST_RESET_TIME = time.time()
+# ---------------------- RATE LIMITING ----------------------- #
+
+# Sliding window counter: this window's hits plus last window's, weighted by how much of it still overlaps
+# state is (window_start, current, previous, ...) or None, returns (allowed, new state)
+def slide_window(state: tuple, limit: int, window: float, now: float) -> tuple:
+    start = now - now % window
+    if state is None or state[0] < start - window:
+        current, previous = 0, 0
+    elif state[0] < start:
+        current, previous = 0, state[1]
+    else:
+        current, previous = state[1], state[2]
+    if previous * (1 - (now - start) / window) + current >= limit:
+        return False, (start, current, previous)
+    return True, (start, current + 1, previous)
+
+
+# Rate limit state for a single process, least recently hit keys are evicted first
+class MemoryRateStore:
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._windows = OrderedDict()  # key -> (window_start, current, previous, expires)
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, limit: int, window: float, now: float = None) -> bool:
+        now = time.time() if now is None else now
+        with self._lock:
+            # A key idle for two windows has nothing left to count
+            while self._windows and (len(self._windows) >= self.max_keys
+                                     or next(iter(self._windows.values()))[3] <= now):
+                self._windows.popitem(last=False)
+            allowed, state = slide_window(self._windows.pop(key, None), limit, window, now)
+            self._windows[key] = (*state, state[0] + 2 * window)
+        return allowed
+
+    def __len__(self):
+        return len(self._windows)
+
+
+# Rate limit state in a local SQLite file, shared by every worker process on the machine
+class SQLiteRateStore:
+    def __init__(self, path: str, sweep_every: int = 1000):
+        self.path = path
+        self.sweep_every = sweep_every  # Delete expired keys once per this many hits
+        self._local = threading.local()
+        self._hits = 0
+        self._connection().execute("""
+            CREATE TABLE IF NOT EXISTS rate_limits (
+                key TEXT PRIMARY KEY,
+                window_start REAL NOT NULL,
+                current INTEGER NOT NULL,
+                previous INTEGER NOT NULL,
+                expires REAL NOT NULL
+            )
+        """)
+        self._connection().execute("CREATE INDEX IF NOT EXISTS rate_limits_expires ON rate_limits (expires)")
+
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def hit(self, key: str, limit: int, window: float, now: float = None) -> bool:
+        now = time.time() if now is None else now
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")  # Take the write lock up front, so the read-modify-write is atomic
+        try:
+            row = db.execute("SELECT window_start, current, previous FROM rate_limits WHERE key = ?",
+                             (key,)).fetchone()
+            allowed, state = slide_window(row, limit, window, now)
+            db.execute("INSERT OR REPLACE INTO rate_limits VALUES (?, ?, ?, ?, ?)",
+                       (key, *state, state[0] + 2 * window))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        self._hits += 1
+        if self._hits % self.sweep_every == 0:
+            db.execute("DELETE FROM rate_limits WHERE expires <= ?", (now,))
+        return allowed
+
+    def __len__(self):
+        return self._connection().execute("SELECT count(*) FROM rate_limits").fetchone()[0]
+
+
+RATE_LIMITER = SQLiteRateStore(RATE_LIMIT_DB) if RATE_LIMIT_DB else MemoryRateStore(RATE_LIMIT_MAX_KEYS)
 
 
 # Decorator to check if the user is an admin
 def admin_required(param: callable):
     @wraps(param)
     def wrap(*args, **kwargs):
-        global RATE_LIMIT
-        reset_rate_limit()
-
         is_browser_request = request.accept_mimetypes.best_match(["text/html", "application/json"]) == "text/html"
 
         if is_browser_request:
@@ -96,13 +189,13 @@ def admin_required(param: callable):
         else:
             try:
                 api_key = request.json.get('api-key') if request.is_json else request.headers.get('api-key')
-                if api_key not in VALID_API_KEYS:
-                    RATE_LIMIT += 1
-                    if RATE_LIMIT > 15:
-                        abort(429, description="Rate limit exceeded. Try again later.")
-                    abort(403, description="Invalid API Key for ADMIN")
             except Exception:
                 abort(400, description="No API key passed")
+            if api_key not in VALID_API_KEYS:
+                # Failed attempts are limited per client IP
+                if not RATE_LIMITER.hit(f"admin:{request.remote_addr}", ADMIN_FAILED_LIMIT, 3600):
+                    abort(429, description="Rate limit exceeded. Try again later.")
+                abort(403, description="Invalid API Key for ADMIN")
 
         return param(*args, **kwargs)
 
@@ -111,27 +204,12 @@ def admin_required(param: callable):
 
 # Decorator to rate limit the user - Advised not to use with @admin_required
 def rate_limit(limit: int, time_window: int = 3600):
-    # Create an independent store for each decorator instance
-    request_store = {}
-
     def decorator(func):
         @wraps(func)  # Preserve the original function metadata
         def wrapper(*args, **kwargs):
-            user_ip = request.remote_addr
-            current_time = time.time()
-
-            # Ensure user IP is in the request store
-            if user_ip not in request_store:
-                request_store[user_ip] = []
-
-            timestamps = request_store[user_ip]
-            valid_timestamps = [ts for ts in timestamps if current_time - ts <= time_window]
-            request_store[user_ip] = valid_timestamps
-
-            if len(valid_timestamps) >= limit:
+            # Keyed by route too, so each decorated route keeps an independent limit
+            if not RATE_LIMITER.hit(f"{func.__name__}:{request.remote_addr}", limit, time_window):
                 abort(429, description="Rate limit exceeded. Try again later.")
-
-            request_store[user_ip].append(current_time)
             return func(*args, **kwargs)
 
         return wrapper
@@ -219,30 +297,96 @@ def download_challenge_files(challenge_id: str):
         return abort(404, description="Challenge files not found")
 
 
+# File-like target for COPY ... TO STDOUT, passes ~64KB chunks to the response through a bounded queue
+class CopyChunkWriter:
+    def __init__(self, chunks: queue.Queue, cancelled: threading.Event, size: int = 64 * 1024):
+        self.chunks = chunks
+        self.cancelled = cancelled
+        self.size = size
+        self._buffer = bytearray()
+
+    def write(self, data):
+        self._buffer += data
+        if len(self._buffer) >= self.size:
+            self.flush()
+
+    def flush(self):
+        chunk, self._buffer = bytes(self._buffer), bytearray()
+        if not put_chunk(self.chunks, self.cancelled, chunk):
+            raise IOError("Backup download was cancelled")
+
+
+# Blocks while the client is behind, gives up (returns False) once the response is closed
+def put_chunk(chunks: queue.Queue, cancelled: threading.Event, chunk) -> bool:
+    while not cancelled.is_set():
+        try:
+            chunks.put(chunk, timeout=1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+# Stream `COPY <table> TO STDOUT` for each table without holding the dump in memory, optionally gzipped
+def stream_copy(tables: list, compress: bool = False):
+    chunks = queue.Queue(maxsize=16)
+    cancelled = threading.Event()
+
+    def produce():
+        # psycopg2 pushes COPY output into a file object, so it runs in its own thread
+        try:
+            conn = get_db_connection()
+            try:
+                with conn.cursor() as cursor:
+                    writer = CopyChunkWriter(chunks, cancelled)
+                    for table_name in tables:
+                        cursor.copy_expert(
+                            sql.SQL("COPY {} TO STDOUT WITH BINARY").format(sql.Identifier(table_name)), writer)
+                    writer.flush()
+            finally:
+                conn.close()
+            put_chunk(chunks, cancelled, None)
+        except Exception as e:
+            # Timed like the chunks, a client that left with the queue full must not leave this thread stuck
+            put_chunk(chunks, cancelled, e)
+
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31 writes a gzip container
+    try:
+        # Started on first read, so a response that is never sent never ties up a connection
+        threading.Thread(target=produce, daemon=True).start()
+        while (chunk := chunks.get()) is not None:
+            if isinstance(chunk, Exception):
+                # Headers are already sent, all we can do is end the download early and log it
+                print(f"Error streaming database backup: {chunk}")
+                return
+            chunk = compressor.compress(chunk) if compressor else chunk
+            if chunk:
+                yield chunk
+        if compressor:
+            yield compressor.flush()
+    finally:
+        cancelled.set()
+
+
 @app.route('/backup/db', methods=['GET'])
 @admin_required
 def backup_db():
     try:
-        # Get the PostgreSQL database connection
         conn = get_db_connection()
-        backup_file = BytesIO()
-
-        with conn.cursor() as cursor:
-            # Use PostgreSQL's built-in COPY command to dump the entire database
-            cursor.execute("SELECT tablename FROM pg_tables WHERE schemaname='public'")
-            tables = cursor.fetchall()
-
-            for table in tables:
-                table_name = table[0]
-                cursor.copy_expert(f"COPY {table_name} TO STDOUT WITH BINARY", backup_file)
-
-        backup_file.seek(0)
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT tablename FROM pg_tables WHERE schemaname='public'")
+                tables = [table[0] for table in cursor.fetchall()]
+        finally:
+            conn.close()
 
-        # Create a response to stream the file to the user
+        # Use PostgreSQL's built-in COPY command to dump the entire database, streamed straight to the user
+        compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+        filename = "database_backup.dump.gz" if compress else "database_backup.dump"
         return Response(
-            backup_file,
-            mimetype='application/octet-stream',
-            headers={"Content-Disposition": "attachment; filename=database_backup.dump"}
+            stream_copy(tables, compress),
+            mimetype='application/gzip' if compress else 'application/octet-stream',
+            headers={"Content-Disposition": f"attachment; filename={filename}"}
         )
     except Exception as e:
         return abort(500, description=f"Error backing up database as {e}")
@@ -818,7 +962,7 @@ def retry(url_to_check: str):
         sanitized_url = re.sub(r'^(https?://)?(www\.)?', '', url_to_check)
 
         # Prevent SSRF by checking if the URL is in the whitelist
-        if not any(re.fullmatch(pattern, sanitized_url) for pattern in allowed_urls()):
+        if not ALLOWED_URLS.match(sanitized_url):
             return jsonify({
                 "error_code": "URL_NOT_ALLOWED",
                 "error_message": "URL not in whitelist. Contact the developer if this is unexpected.",
@@ -833,16 +977,21 @@ def retry(url_to_check: str):
                 "status_code": 400
             }), 400
 
-        # Attempt the request
-        response = requests.get(url_to_check)
+        # Attempt the request, or reuse the result of a retry from the last few seconds
+        result = RETRY_CACHE.get(url_to_check)
+        if result is None:
+            response = RETRY_SESSION.get(url_to_check, timeout=RETRY_TIMEOUT)
+            result = (response.status_code, response.text[:250])  # Limit response to prevent excessive logging
+            RETRY_CACHE.put(url_to_check, result)
+        status_code, response_text = result
 
         # Return a structured JSON response
         return jsonify({
-            "message": "Retry successful" if response.status_code == 200 else "Retry failed",
+            "message": "Retry successful" if status_code == 200 else "Retry failed",
             "retried_url": url_to_check,
-            "status_code": response.status_code,
-            "response_text": response.text[:250]  # Limit response to prevent excessive logging
-        }), response.status_code
+            "status_code": status_code,
+            "response_text": response_text
+        }), status_code
 
     except requests.exceptions.ConnectionError:
         return jsonify({
@@ -875,14 +1024,68 @@ def retry(url_to_check: str):
         }), 500
 
 
-def allowed_urls() -> List[str]:
-    allowed = []
-    for rule in app.url_map.iter_rules():
-        url = "scrapyard-bounty.vercel.app" + str(rule)
-        # Convert Flask URL rules to regex patterns
-        url_pattern = re.sub(r'<[^>]+>', r'[^/]+', url)
-        allowed.append(url_pattern)
-    return allowed
+# Every route of this app as one compiled pattern, rebuilt only after a rule is added
+class RouteMatcher:
+    def __init__(self, url_map, domain: str):
+        self.domain = domain
+        self._url_map = url_map
+        self._pattern = None
+        self._lock = threading.Lock()
+
+        # Flask registers every rule through Map.add, so a new route just drops the compiled pattern
+        add = url_map.add
+
+        def add_rule(rule_factory):
+            add(rule_factory)
+            self._pattern = None
+
+        url_map.add = add_rule
+
+    def _compile(self) -> re.Pattern:
+        with self._lock:
+            if self._pattern is None:
+                # Convert Flask URL rules to regex patterns, a variable matches one path segment
+                routes = sorted({"[^/]+".join(re.escape(part) for part in re.split(r'<[^>]+>', rule.rule))
+                                 for rule in self._url_map.iter_rules()})
+                self._pattern = re.compile(f"{re.escape(self.domain)}(?:{'|'.join(routes)})")
+            return self._pattern
+
+    def match(self, url: str) -> bool:
+        pattern = self._pattern or self._compile()
+        return pattern.fullmatch(url) is not None
+
+
+# Recent /retry results by URL, expired ones are dropped when looked up and the oldest when full
+class ResponseCache:
+    def __init__(self, ttl: float, max_items: int):
+        self.ttl = ttl
+        self.max_items = max_items
+        self._items = OrderedDict()  # url -> (expires at, result)
+        self._lock = threading.Lock()
+
+    def get(self, url: str):
+        with self._lock:
+            entry = self._items.get(url)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._items[url]
+                return None
+            return entry[1]
+
+    def put(self, url: str, result):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._items[url] = (time.monotonic() + self.ttl, result)
+            self._items.move_to_end(url)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+
+ALLOWED_URLS = RouteMatcher(app.url_map, "scrapyard-bounty.vercel.app")
+RETRY_CACHE = ResponseCache(RETRY_CACHE_TTL, RETRY_CACHE_SIZE)
+RETRY_SESSION = requests.Session()  # Keeps connections to retried hosts open between calls
 
 
 # Modify the receipt generation to return the receipt image in-memory
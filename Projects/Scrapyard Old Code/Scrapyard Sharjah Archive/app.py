@@ -1,14 +1,23 @@
+import csv
 import os
+import queue
 import re
+import sqlite3
 import sys
 import tempfile
+import threading
 import time
 import uuid
 import uuid as uid
+import zlib
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from functools import wraps
-from io import BytesIO
-from typing import List
+from io import BytesIO, StringIO
+from itertools import chain
+from typing import Optional
 
 import psycopg2
 import requests
@@ -20,7 +29,9 @@ from flask import send_file
 from flask import send_from_directory
 from psycopg2 import sql
 from psycopg2._psycopg import DatabaseError
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
 from psycopg2.extras import RealDictCursor
+from psycopg2.pool import PoolError
 from scapy.all import rdpcap
 from waitress import serve
 from werkzeug.security import check_password_hash, generate_password_hash
@@ -46,6 +57,11 @@ FLAG_2_SCORE = 75
 FLAG_3_SCORE = 125
 FLAG_4_SCORE = 150
 FLAG_5_SCORE = 100
+# flag -> (challenge number, points), built once so checking a submission is a single dict lookup
+FLAG_SCORES = {flag: (challenge, score) for challenge, (flag, score) in enumerate(
+    ((FLAG_1, FLAG_1_SCORE), (FLAG_2, FLAG_2_SCORE), (FLAG_3, FLAG_3_SCORE), (FLAG_4, FLAG_4_SCORE),
+     (FLAG_5, FLAG_5_SCORE)), start=1) if flag}
+CHALLENGE_FLAGS = {challenge: flag for flag, (challenge, _) in FLAG_SCORES.items()}
 
 # Flag key variable
 KEY = os.getenv("KEY")
@@ -54,42 +70,354 @@ KEY = os.getenv("KEY")
 VALID_API_KEYS = [os.getenv("VALID_API_KEY")]
 
 # Global Tracker Variables
-RATE_LIMIT = 0
-LAST_RESET_TIME = time.time()
 START_TIME = time.time()
 
+# Rate limit Global Var
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB")  # SQLite file shared by all workers, in-process only if unset
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", 100000))  # In-process store evicts beyond this
+ADMIN_FAILED_LIMIT = 15  # Invalid admin API keys allowed per IP per hour
+
 # DB Global Var
 DB_URL_AIVEN = os.getenv("DB_URL_AIVEN")
 DB_NAME = os.getenv("DB_NAME")
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 2))  # Connections kept open even when idle
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 10))  # Hard cap on open connections
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))  # Seconds to wait for a free connection
+DB_POOL_PING_AFTER = float(os.getenv("DB_POOL_PING_AFTER", 5))  # Ping connections idle for longer than this
+DB_POOL_IDLE_TIMEOUT = float(os.getenv("DB_POOL_IDLE_TIMEOUT", 300))  # Close extra connections idle this long
+LEADERBOARD_SYNC_INTERVAL = float(os.getenv("LEADERBOARD_SYNC_INTERVAL", 2))  # Seconds between version checks
+RETRY_TIMEOUT = float(os.getenv("RETRY_TIMEOUT", 5))  # Seconds /retry waits for the retried URL
+RETRY_CACHE_TTL = float(os.getenv("RETRY_CACHE_TTL", 10))  # Seconds a /retry result is reused
+RETRY_CACHE_SIZE = int(os.getenv("RETRY_CACHE_SIZE", 256))  # Retried URLs kept in the cache
 
 # Bank Global Var
 USERNAME = os.getenv('USERNAME_BANK')
 PASSWORD = os.getenv('PASSWORD_BANK')
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", 5000))  # Users changed per transaction by batch operations
+BATCH_PROGRESS = {}  # job_id -> progress of batch operations in this process
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 2000))  # Rows fetched per round trip by CSV exports
+ROLLUP_SHARDS = int(os.getenv("ROLLUP_SHARDS", 16))  # Counter rows per dashboard rollup, concurrent writers spread over them
 
 
 # ------------------------- DATABASE ------------------------- #
 
-# Database connection
-def get_db_connection() -> psycopg2._psycopg.connection:
-    conn = psycopg2.connect(dsn=DB_URL_AIVEN, dbname=DB_NAME)
-    return conn
+# Thread-safe connection pool, so requests reuse open (TLS) connections instead of connecting each time
+class ConnectionPool:
+    def __init__(self, minconn: int, maxconn: int, timeout: float, ping_after: float, idle_timeout: float,
+                 **connect_kwargs):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self.idle_timeout = idle_timeout
+        self.connect_kwargs = connect_kwargs
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxconn)  # One slot per connection that may be checked out
+        self._idle = deque()  # (connection, last returned at), most recently used on the right
+        self._open = 0
+        self._stats = {"checkouts": 0, "created": 0, "discarded": 0, "timeouts": 0, "wait_seconds": 0.0}
+
+    def _connect(self) -> psycopg2._psycopg.connection:
+        conn = psycopg2.connect(**self.connect_kwargs)
+        with self._lock:
+            self._open += 1
+            self._stats["created"] += 1
+        return conn
+
+    def _discard(self, conn: psycopg2._psycopg.connection):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._open -= 1
+            self._stats["discarded"] += 1
+
+    def _healthy(self, conn: psycopg2._psycopg.connection, idle_since: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.ping_after:
+            return True
+        # Pre-ping: the server or a proxy may have dropped a connection that sat idle
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _checkout(self) -> psycopg2._psycopg.connection:
+        start = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._stats["timeouts"] += 1
+            raise PoolError(f"No database connection free after {self.timeout}s (max {self.maxconn})")
+        try:
+            while True:
+                stale = []
+                with self._lock:
+                    # Close extra connections nobody has needed for a while (oldest are on the left)
+                    while (len(self._idle) > self.minconn
+                           and time.monotonic() - self._idle[0][1] > self.idle_timeout):
+                        stale.append(self._idle.popleft()[0])
+                    item = self._idle.pop() if self._idle else None
+                for conn in stale:
+                    self._discard(conn)
+                if item is None:
+                    conn = self._connect()
+                    break
+                conn, idle_since = item
+                if self._healthy(conn, idle_since):
+                    break
+                self._discard(conn)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._stats["checkouts"] += 1
+            self._stats["wait_seconds"] += time.monotonic() - start
+        return conn
+
+    def _checkin(self, conn: psycopg2._psycopg.connection, broken: bool = False):
+        try:
+            if broken or conn.closed:
+                self._discard(conn)
+                return
+            if conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            with self._lock:
+                self._idle.append((conn, time.monotonic()))
+        except psycopg2.Error:
+            self._discard(conn)
+        finally:
+            self._slots.release()
+
+    def fill(self):
+        # Open the minimum number of connections up front
+        while True:
+            with self._lock:
+                if self._open >= self.minconn:
+                    return
+            conn = self._connect()
+            with self._lock:
+                self._idle.append((conn, time.monotonic()))
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection; commit on success, roll back on error, and always give it back."""
+        conn = self._checkout()
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except BaseException as e:
+            broken = isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
+            if not broken and not conn.closed:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+            raise
+        finally:
+            self._checkin(conn, broken)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            idle = len(self._idle)
+            return {
+                "min": self.minconn,
+                "max": self.maxconn,
+                "open": self._open,
+                "idle": idle,
+                "in_use": self._open - idle,
+                **self._stats,
+                "avg_wait_ms": round(self._stats["wait_seconds"] / self._stats["checkouts"] * 1000, 3)
+                if self._stats["checkouts"] else 0.0,
+            }
+
+
+DB_POOL = ConnectionPool(DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT, DB_POOL_PING_AFTER, DB_POOL_IDLE_TIMEOUT,
+                         dsn=DB_URL_AIVEN, dbname=DB_NAME)
+
+
+# Database connection, use as `with get_db_connection() as conn:` so it always goes back to the pool
+def get_db_connection():
+    return DB_POOL.connection()
+
+
+# In-process scoreboard, sorted once and then kept current, so leaderboard reads do not re-sort `teams`
+class Leaderboard:
+    def __init__(self, sync_interval: float):
+        self.sync_interval = sync_interval
+        self.loaded = False
+        self._keys = []  # (-score, team_name), sorted so the best team is first
+        self._scores = {}  # team_name -> score
+        self._versions = {}  # team_name -> teams.version of the score we hold
+        self._version_sum = 0
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._checked = 0.0
+
+    def _set(self, team_name: str, score):
+        if team_name in self._scores:
+            del self._keys[bisect_left(self._keys, (-self._scores[team_name], team_name))]
+        insort(self._keys, (-score, team_name))
+        self._scores[team_name] = score
+
+    def load(self, rows: list):
+        keys = sorted((-score, team_name) for team_name, score, _ in rows)
+        with self._lock:
+            self._keys = keys
+            self._scores = {team_name: score for team_name, score, _ in rows}
+            self._versions = {team_name: version for team_name, _, version in rows}
+            self._version_sum = sum(self._versions.values())
+            self.loaded = True
+
+    def apply(self, team_name: str, score, version: int):
+        # Called after our own commit with the row's new version. Writes to one team are ordered by its row lock, so a
+        # lower version than ours is older data, e.g. a submit that finished after a sync already loaded the next one.
+        with self._lock:
+            if version <= self._versions.get(team_name, -1):
+                return
+            self._set(team_name, score)
+            self._version_sum += version - self._versions.get(team_name, 0)
+            self._versions[team_name] = version
+
+    def sync(self, force: bool = False):
+        # Other workers (and admin queries) change `teams` too; at most one cheap check per interval
+        if not force and self.loaded and time.monotonic() - self._checked < self.sync_interval:
+            return
+        # Only one thread reloads, the rest keep serving the current data (unless there is none yet)
+        if not self._sync_lock.acquire(blocking=not self.loaded):
+            return
+        try:
+            with get_db_connection() as conn, conn.cursor() as cursor:
+                # Versions only grow, so any insert, update or delete changes the row count or their sum. Unlike a
+                # "latest version" this also catches a write committed after a newer one we have already seen.
+                cursor.execute("SELECT count(*), COALESCE(sum(version), 0) FROM teams")
+                if cursor.fetchone() != (len(self._scores), self._version_sum) or not self.loaded:
+                    cursor.execute("SELECT team_name, score, version FROM teams")
+                    self.load(cursor.fetchall())
+            self._checked = time.monotonic()
+        finally:
+            self._sync_lock.release()
+
+    def page(self, offset: int, limit: int = None) -> list:
+        with self._lock:
+            end = None if limit is None else offset + limit
+            return [(team_name, -score) for score, team_name in self._keys[offset:end]]
+
+    def rank(self, team_name: str):
+        """Returns (rank, (team_name, score) of the team right below) or None, tied scores share a rank."""
+        with self._lock:
+            if team_name not in self._scores:
+                return None
+            score = self._scores[team_name]
+            below = bisect_right(self._keys, (-score, team_name))
+            next_team = (self._keys[below][1], -self._keys[below][0]) if below < len(self._keys) else None
+            return bisect_left(self._keys, (-score,)) + 1, next_team
+
+
+LEADERBOARD = Leaderboard(LEADERBOARD_SYNC_INTERVAL)
+
+
+# ---------------------- RATE LIMITING ----------------------- #
 
+# Sliding window counter: this window's hits plus last window's, weighted by how much of it still overlaps
+# state is (window_start, current, previous, ...) or None, returns (allowed, new state)
+def slide_window(state: tuple, limit: int, window: float, now: float) -> tuple:
+    start = now - now % window
+    if state is None or state[0] < start - window:
+        current, previous = 0, 0
+    elif state[0] < start:
+        current, previous = 0, state[1]
+    else:
+        current, previous = state[1], state[2]
+    if previous * (1 - (now - start) / window) + current >= limit:
+        return False, (start, current, previous)
+    return True, (start, current + 1, previous)
+
+
+# Rate limit state for a single process, least recently hit keys are evicted first
+class MemoryRateStore:
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._windows = OrderedDict()  # key -> (window_start, current, previous, expires)
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, limit: int, window: float, now: float = None) -> bool:
+        now = time.time() if now is None else now
+        with self._lock:
+            # A key idle for two windows has nothing left to count
+            while self._windows and (len(self._windows) >= self.max_keys
+                                     or next(iter(self._windows.values()))[3] <= now):
+                self._windows.popitem(last=False)
+            allowed, state = slide_window(self._windows.pop(key, None), limit, window, now)
+            self._windows[key] = (*state, state[0] + 2 * window)
+        return allowed
+
+    def __len__(self):
+        return len(self._windows)
+
+
+# Rate limit state in a local SQLite file, shared by every worker process on the machine
+class SQLiteRateStore:
+    def __init__(self, path: str, sweep_every: int = 1000):
+        self.path = path
+        self.sweep_every = sweep_every  # Delete expired keys once per this many hits
+        self._local = threading.local()
+        self._hits = 0
+        self._connection().execute("""
+            CREATE TABLE IF NOT EXISTS rate_limits (
+                key TEXT PRIMARY KEY,
+                window_start REAL NOT NULL,
+                current INTEGER NOT NULL,
+                previous INTEGER NOT NULL,
+                expires REAL NOT NULL
+            )
+        """)
+        self._connection().execute("CREATE INDEX IF NOT EXISTS rate_limits_expires ON rate_limits (expires)")
+
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def hit(self, key: str, limit: int, window: float, now: float = None) -> bool:
+        now = time.time() if now is None else now
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")  # Take the write lock up front, so the read-modify-write is atomic
+        try:
+            row = db.execute("SELECT window_start, current, previous FROM rate_limits WHERE key = ?",
+                             (key,)).fetchone()
+            allowed, state = slide_window(row, limit, window, now)
+            db.execute("INSERT OR REPLACE INTO rate_limits VALUES (?, ?, ?, ?, ?)",
+                       (key, *state, state[0] + 2 * window))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        self._hits += 1
+        if self._hits % self.sweep_every == 0:
+            db.execute("DELETE FROM rate_limits WHERE expires <= ?", (now,))
+        return allowed
 
-# Reset admin required rate limit
-def reset_rate_limit():
-    global RATE_LIMIT, LAST_RESET_TIME
-    if time.time() - LAST_RESET_TIME >= 3600:
-        RATE_LIMIT = 0
-        LAST_RESET_TIME = time.time()
+    def __len__(self):
+        return self._connection().execute("SELECT count(*) FROM rate_limits").fetchone()[0]
+
+
+RATE_LIMITER = SQLiteRateStore(RATE_LIMIT_DB) if RATE_LIMIT_DB else MemoryRateStore(RATE_LIMIT_MAX_KEYS)
 
 
 # Decorator to check if the user is an admin
 def admin_required(param: callable):
     @wraps(param)
     def wrap(*args, **kwargs):
-        global RATE_LIMIT
-        reset_rate_limit()
-
         is_browser_request = request.accept_mimetypes.best_match(["text/html", "application/json"]) == "text/html"
 
         if is_browser_request:
@@ -100,13 +428,13 @@ def admin_required(param: callable):
         else:
             try:
                 api_key = request.json.get('api-key') if request.is_json else request.headers.get('api-key')
-                if api_key not in VALID_API_KEYS:
-                    RATE_LIMIT += 1
-                    if RATE_LIMIT > 15:
-                        abort(429, description="Rate limit exceeded. Try again later.")
-                    abort(403, description="Invalid API Key for ADMIN")
             except Exception:
                 abort(400, description="No API key passed")
+            if api_key not in VALID_API_KEYS:
+                # Failed attempts are limited per client IP
+                if not RATE_LIMITER.hit(f"admin:{request.remote_addr}", ADMIN_FAILED_LIMIT, 3600):
+                    abort(429, description="Rate limit exceeded. Try again later.")
+                abort(403, description="Invalid API Key for ADMIN")
 
         return param(*args, **kwargs)
 
@@ -115,27 +443,12 @@ def admin_required(param: callable):
 
 # Decorator to rate limit the user - Advised not to use with @admin_required
 def rate_limit(limit: int, time_window: int = 3600):
-    # Create an independent store for each decorator instance
-    request_store = {}
-
     def decorator(func):
         @wraps(func)  # Preserve the original function metadata
         def wrapper(*args, **kwargs):
-            user_ip = request.remote_addr
-            current_time = time.time()
-
-            # Ensure user IP is in the request store
-            if user_ip not in request_store:
-                request_store[user_ip] = []
-
-            timestamps = request_store[user_ip]
-            valid_timestamps = [ts for ts in timestamps if current_time - ts <= time_window]
-            request_store[user_ip] = valid_timestamps
-
-            if len(valid_timestamps) >= limit:
+            # Keyed by route too, so each decorated route keeps an independent limit
+            if not RATE_LIMITER.hit(f"{func.__name__}:{request.remote_addr}", limit, time_window):
                 abort(429, description="Rate limit exceeded. Try again later.")
-
-            request_store[user_ip].append(current_time)
             return func(*args, **kwargs)
 
         return wrapper
@@ -155,6 +468,16 @@ def create_tables():
             ip_address VARCHAR(255)
         )
         """,
+        # One row per solved flag, the primary key makes scoring a flag twice impossible
+        """
+        CREATE TABLE IF NOT EXISTS solves (
+            team_name VARCHAR(255) NOT NULL,
+            challenge_id INTEGER NOT NULL,
+            points INTEGER NOT NULL,
+            solved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (team_name, challenge_id)
+        )
+        """,
         """
         CREATE TABLE IF NOT EXISTS item (
             id SERIAL PRIMARY KEY,
@@ -203,31 +526,401 @@ def create_tables():
             name VARCHAR(255) NOT NULL,
             scraps INTEGER DEFAULT 0
         )
+        """,
+        # Every write to a team's score stamps its row with a new number from a sequence, so workers can tell whether
+        # their cached leaderboard is stale without all writers queueing on one shared counter row
+        """
+        CREATE SEQUENCE IF NOT EXISTS teams_version
+        """,
+        """
+        ALTER TABLE teams ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT nextval('teams_version')
+        """,
+        """
+        CREATE OR REPLACE FUNCTION stamp_team_version() RETURNS TRIGGER AS $$
+        BEGIN
+            NEW.version := nextval('teams_version');
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        DROP TRIGGER IF EXISTS teams_version ON teams
+        """,
+        """
+        CREATE TRIGGER teams_version
+        BEFORE UPDATE OF team_name, score ON teams
+        FOR EACH ROW EXECUTE FUNCTION stamp_team_version()
+        """,
+        # The single-row version counter these replace
+        """
+        DROP TRIGGER IF EXISTS teams_leaderboard_version ON teams
+        """,
+        """
+        DROP FUNCTION IF EXISTS bump_leaderboard_version()
+        """,
+        """
+        DROP TABLE IF EXISTS leaderboard_state
+        """,
+        # Shared with the Bank app, which may have created it already
+        """
+        CREATE TABLE IF NOT EXISTS transaction_logs (
+            id SERIAL PRIMARY KEY,
+            uuid UUID NOT NULL,
+            name VARCHAR(255) NOT NULL,
+            reason TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS transaction_logs_uuid_timestamp ON transaction_logs (uuid, timestamp)
+        """,
+        # Typed amount/direction columns and the parsing rules, as in the Bank app's migrate_transaction_amounts.py, so
+        # both apps agree on what a transaction moved; the trigger fills them in for the inserts here that only log a
+        # reason
+        r"""
+        CREATE OR REPLACE FUNCTION transaction_amount(name TEXT, reason TEXT) RETURNS INTEGER AS $$
+            -- The old extract_amount_from_reason: "(-X scraps)" / "(+X scraps)" by type, else the first number
+            SELECT CASE WHEN length(digits) <= 9 THEN digits::INTEGER END
+            FROM (SELECT COALESCE(
+                CASE
+                    WHEN name IN ('Purchase', 'Batch Remove') THEN substring(reason FROM '-\s*(\d+)\s*scraps')
+                    WHEN name IN ('Reimbursement', 'Batch Add') THEN substring(reason FROM '\+\s*(\d+)\s*scraps')
+                END,
+                substring(reason FROM '(\d+)')
+            ) AS digits) parsed
+        $$ LANGUAGE sql IMMUTABLE
+        """,
+        """
+        CREATE OR REPLACE FUNCTION transaction_direction(name TEXT) RETURNS SMALLINT AS $$
+            SELECT CASE
+                WHEN name IN ('Purchase', 'Batch Remove') THEN -1
+                WHEN name IN ('Reimbursement', 'Batch Add') THEN 1
+                ELSE 0
+            END::SMALLINT
+        $$ LANGUAGE sql IMMUTABLE
+        """,
+        # Risk rollups written before the columns counted large changes by the first number in the reason, recount
+        # them with the Bank app's rule while adding the columns
+        """
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_schema = current_schema()
+                           AND table_name = 'transaction_logs' AND column_name = 'amount') THEN
+                ALTER TABLE transaction_logs ADD COLUMN amount INTEGER, ADD COLUMN direction SMALLINT;
+                IF to_regclass('transaction_risk_hourly') IS NOT NULL THEN
+                    UPDATE transaction_risk_hourly r SET large_changes = l.large_changes
+                    FROM (
+                        SELECT uuid, date_trunc('hour', timestamp) AS hour,
+                               count(*) FILTER (WHERE transaction_amount(name, reason) >= 30) AS large_changes
+                        FROM transaction_logs
+                        GROUP BY 1, 2
+                    ) l
+                    WHERE r.uuid = l.uuid AND r.hour = l.hour AND r.large_changes <> l.large_changes;
+                END IF;
+            END IF;
+        END;
+        $$
+        """,
+        """
+        CREATE OR REPLACE FUNCTION fill_transaction_amount() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.amount IS NULL THEN
+                NEW.amount := transaction_amount(NEW.name, NEW.reason);
+            END IF;
+            IF NEW.direction IS NULL THEN
+                NEW.direction := transaction_direction(NEW.name);
+            END IF;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        DROP TRIGGER IF EXISTS transaction_logs_fill_amount ON transaction_logs
+        """,
+        """
+        CREATE TRIGGER transaction_logs_fill_amount
+        BEFORE INSERT ON transaction_logs
+        FOR EACH ROW EXECUTE FUNCTION fill_transaction_amount()
+        """,
+        # Fraud signals per user per hour, kept current by a trigger so fraud detection never scans the raw logs
+        """
+        CREATE TABLE IF NOT EXISTS transaction_risk_hourly (
+            uuid UUID NOT NULL,
+            hour TIMESTAMP NOT NULL,
+            transactions INTEGER NOT NULL DEFAULT 0,
+            large_changes INTEGER NOT NULL DEFAULT 0,
+            purchase_reimbursement_cycles INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (uuid, hour)
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS transaction_risk_hourly_hour ON transaction_risk_hourly (hour)
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS purchase_reason_hourly (
+            uuid UUID NOT NULL,
+            hour TIMESTAMP NOT NULL,
+            reason TEXT NOT NULL,
+            uses INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (uuid, hour, reason)
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS purchase_reason_hourly_hour ON purchase_reason_hourly (hour)
+        """,
+        # Backfill from the logs once, before the trigger below takes over
+        r"""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM transaction_risk_hourly) THEN
+                INSERT INTO transaction_risk_hourly
+                SELECT uuid, date_trunc('hour', timestamp), count(*),
+                       count(*) FILTER (WHERE COALESCE(amount, transaction_amount(name, reason)) >= 30),
+                       count(*) FILTER (WHERE name = 'Reimbursement' AND prev_name = 'Purchase'
+                                        AND timestamp - prev_timestamp < interval '1 hour')
+                FROM (
+                    SELECT *, LAG(name) OVER w AS prev_name, LAG(timestamp) OVER w AS prev_timestamp
+                    FROM transaction_logs
+                    WINDOW w AS (PARTITION BY uuid ORDER BY timestamp)
+                ) logs
+                GROUP BY 1, 2;
+
+                INSERT INTO purchase_reason_hourly
+                SELECT uuid, date_trunc('hour', timestamp), reason, count(*)
+                FROM transaction_logs
+                WHERE name = 'Purchase' AND reason IS NOT NULL
+                GROUP BY 1, 2, 3;
+            END IF;
+        END;
+        $$
+        """,
+        r"""
+        CREATE OR REPLACE FUNCTION roll_up_transaction_risk() RETURNS TRIGGER AS $$
+        BEGIN
+            -- Same large-change rule as the Bank app: rows it logged carry the amount, older ones are parsed
+            INSERT INTO transaction_risk_hourly AS r
+            SELECT n.uuid, date_trunc('hour', n.timestamp), count(*),
+                   count(*) FILTER (WHERE COALESCE(n.amount, transaction_amount(n.name, n.reason)) >= 30),
+                   count(*) FILTER (WHERE prev.name = 'Purchase' AND n.timestamp - prev.timestamp < interval '1 hour')
+            FROM new_rows n
+            LEFT JOIN LATERAL (
+                -- Previous transaction of the same user, one index probe on (uuid, timestamp)
+                SELECT p.name, p.timestamp FROM transaction_logs p
+                WHERE n.name = 'Reimbursement' AND p.uuid = n.uuid AND p.timestamp < n.timestamp
+                ORDER BY p.timestamp DESC
+                LIMIT 1
+            ) prev ON TRUE
+            GROUP BY 1, 2
+            ON CONFLICT (uuid, hour) DO UPDATE SET
+                transactions = r.transactions + EXCLUDED.transactions,
+                large_changes = r.large_changes + EXCLUDED.large_changes,
+                purchase_reimbursement_cycles = r.purchase_reimbursement_cycles
+                                                + EXCLUDED.purchase_reimbursement_cycles;
+
+            INSERT INTO purchase_reason_hourly AS r
+            SELECT uuid, date_trunc('hour', timestamp), reason, count(*)
+            FROM new_rows
+            WHERE name = 'Purchase' AND reason IS NOT NULL
+            GROUP BY 1, 2, 3
+            ON CONFLICT (uuid, hour, reason) DO UPDATE SET uses = r.uses + EXCLUDED.uses;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        DROP TRIGGER IF EXISTS transaction_logs_risk_rollup ON transaction_logs
+        """,
+        """
+        CREATE TRIGGER transaction_logs_risk_rollup
+        AFTER INSERT ON transaction_logs
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION roll_up_transaction_risk()
+        """,
+        # Transactions and scraps moved per hour and type, and bank-wide running totals, for the dashboards (this app's
+        # and the Bank app's, which shares these tables). Each database session adds
+        # to its own shard row and readers sum the shards, so concurrent writers never wait on one counter row until
+        # the other commits; reconcile_rollups folds the shards back into shard 0.
+        f"""
+        CREATE OR REPLACE FUNCTION rollup_shard() RETURNS INTEGER AS $$
+            SELECT pg_backend_pid() % {ROLLUP_SHARDS}
+        $$ LANGUAGE sql
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS transaction_type_hourly (
+            hour TIMESTAMP NOT NULL,
+            name VARCHAR(255) NOT NULL,
+            shard INTEGER NOT NULL DEFAULT 0,
+            transactions INTEGER NOT NULL DEFAULT 0,
+            scraps BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (hour, name, shard)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS bank_totals (
+            id INTEGER PRIMARY KEY,  -- The shard
+            users BIGINT NOT NULL DEFAULT 0,
+            transactions BIGINT NOT NULL DEFAULT 0,
+            scraps BIGINT NOT NULL DEFAULT 0
+        )
+        """,
+        # Before the shards there was one row per hour and type, and a single totals row (id = 1)
+        """
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_schema = current_schema()
+                           AND table_name = 'transaction_type_hourly' AND column_name = 'shard') THEN
+                ALTER TABLE transaction_type_hourly ADD COLUMN shard INTEGER NOT NULL DEFAULT 0;
+                ALTER TABLE transaction_type_hourly DROP CONSTRAINT transaction_type_hourly_pkey;
+                ALTER TABLE transaction_type_hourly ADD PRIMARY KEY (hour, name, shard);
+            END IF;
+        END;
+        $$
+        """,
+        # Rollups from before the scraps column are emptied, and rebuilt with it below
+        """
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_schema = current_schema()
+                           AND table_name = 'transaction_type_hourly' AND column_name = 'scraps') THEN
+                LOCK TABLE transaction_logs IN SHARE MODE;
+                ALTER TABLE transaction_type_hourly ADD COLUMN scraps BIGINT NOT NULL DEFAULT 0;
+                DELETE FROM transaction_type_hourly;
+            END IF;
+        END;
+        $$
+        """,
+        """
+        ALTER TABLE bank_totals DROP CONSTRAINT IF EXISTS bank_totals_id_check
+        """,
+        """
+        INSERT INTO bank_totals (id, users, transactions, scraps)
+        SELECT 0, (SELECT count(*) FROM credit_card), (SELECT count(*) FROM transaction_logs),
+               (SELECT COALESCE(sum(scraps), 0) FROM credit_card)
+        WHERE NOT EXISTS (SELECT 1 FROM bank_totals)
+        """,
+        """
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM transaction_type_hourly) THEN
+                INSERT INTO transaction_type_hourly (hour, name, transactions, scraps)
+                SELECT date_trunc('hour', timestamp), name, count(*),
+                       COALESCE(sum(COALESCE(amount, transaction_amount(name, reason))), 0)
+                FROM transaction_logs
+                GROUP BY 1, 2;
+            END IF;
+        END;
+        $$
+        """,
+        """
+        CREATE OR REPLACE FUNCTION add_bank_totals(users_delta BIGINT, transactions_delta BIGINT, scraps_delta BIGINT)
+        RETURNS VOID AS $$
+            INSERT INTO bank_totals AS t (id, users, transactions, scraps)
+            VALUES (rollup_shard(), users_delta, transactions_delta, scraps_delta)
+            ON CONFLICT (id) DO UPDATE SET users = t.users + EXCLUDED.users,
+                                           transactions = t.transactions + EXCLUDED.transactions,
+                                           scraps = t.scraps + EXCLUDED.scraps
+        $$ LANGUAGE sql
+        """,
+        """
+        CREATE OR REPLACE FUNCTION roll_up_transaction_counts() RETURNS TRIGGER AS $$
+        BEGIN
+            -- Deletes are counted off this session's shard as well, a shard may go negative, only the sum matters
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO transaction_type_hourly AS r (hour, name, shard, transactions, scraps)
+                SELECT date_trunc('hour', timestamp), name, rollup_shard(), count(*),
+                       COALESCE(sum(COALESCE(amount, transaction_amount(name, reason))), 0)
+                FROM new_rows
+                GROUP BY 1, 2
+                ON CONFLICT (hour, name, shard) DO UPDATE SET transactions = r.transactions + EXCLUDED.transactions,
+                                                              scraps = r.scraps + EXCLUDED.scraps;
+                PERFORM add_bank_totals(0, (SELECT count(*) FROM new_rows), 0);
+            ELSE
+                INSERT INTO transaction_type_hourly AS r (hour, name, shard, transactions, scraps)
+                SELECT date_trunc('hour', timestamp), name, rollup_shard(), -count(*),
+                       -COALESCE(sum(COALESCE(amount, transaction_amount(name, reason))), 0)
+                FROM old_rows
+                GROUP BY 1, 2
+                ON CONFLICT (hour, name, shard) DO UPDATE SET transactions = r.transactions + EXCLUDED.transactions,
+                                                              scraps = r.scraps + EXCLUDED.scraps;
+                PERFORM add_bank_totals(0, -(SELECT count(*) FROM old_rows), 0);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE OR REPLACE FUNCTION roll_up_bank_totals() RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                PERFORM add_bank_totals((SELECT count(*) FROM new_rows), 0,
+                                        (SELECT COALESCE(sum(scraps), 0) FROM new_rows));
+            ELSIF TG_OP = 'DELETE' THEN
+                PERFORM add_bank_totals(-(SELECT count(*) FROM old_rows), 0,
+                                        -(SELECT COALESCE(sum(scraps), 0) FROM old_rows));
+            ELSE
+                PERFORM add_bank_totals(0, 0, (SELECT COALESCE(sum(scraps), 0) FROM new_rows)
+                                              - (SELECT COALESCE(sum(scraps), 0) FROM old_rows));
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        # Transition tables allow one event per trigger, hence one trigger per event
+        """
+        DROP TRIGGER IF EXISTS transaction_logs_count_insert ON transaction_logs;
+        CREATE TRIGGER transaction_logs_count_insert
+        AFTER INSERT ON transaction_logs REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION roll_up_transaction_counts()
+        """,
+        """
+        DROP TRIGGER IF EXISTS transaction_logs_count_delete ON transaction_logs;
+        CREATE TRIGGER transaction_logs_count_delete
+        AFTER DELETE ON transaction_logs REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION roll_up_transaction_counts()
+        """,
+        """
+        DROP TRIGGER IF EXISTS credit_card_totals_insert ON credit_card;
+        CREATE TRIGGER credit_card_totals_insert
+        AFTER INSERT ON credit_card REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION roll_up_bank_totals()
+        """,
+        """
+        DROP TRIGGER IF EXISTS credit_card_totals_update ON credit_card;
+        CREATE TRIGGER credit_card_totals_update
+        AFTER UPDATE ON credit_card REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION roll_up_bank_totals()
+        """,
+        """
+        DROP TRIGGER IF EXISTS credit_card_totals_delete ON credit_card;
+        CREATE TRIGGER credit_card_totals_delete
+        AFTER DELETE ON credit_card REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION roll_up_bank_totals()
         """
     ]
 
     try:
         # Connect to the PostgreSQL database
-        conn = get_db_connection()
-        cur = conn.cursor()
+        with get_db_connection() as conn, conn.cursor() as cur:
+            # Execute each command to create the tables
+            for command in commands:
+                cur.execute(command)
 
-        # Execute each command to create the tables
-        for command in commands:
-            cur.execute(command)
+            # Solves that are still only recorded in the old comma-joined teams.flags_submitted
+            for flag, (challenge, points) in FLAG_SCORES.items():
+                cur.execute("""
+                    INSERT INTO solves (team_name, challenge_id, points)
+                    SELECT team_name, %s, %s FROM teams WHERE %s = ANY(string_to_array(flags_submitted, ','))
+                    ON CONFLICT (team_name, challenge_id) DO NOTHING
+                """, (challenge, points, flag))
 
-        # Commit the changes
-        conn.commit()
+            # Commit the changes
+            conn.commit()
 
         print("Tables created successfully.")
 
     except Exception as e:
         print(f"Error creating tables: {e}")
 
-    finally:
-        if conn:
-            cur.close()
-            conn.close()
-
 
 # --------------------------- APIs ---------------------------- #
 # ------------------------ Standalone --------------------------#
@@ -239,16 +932,15 @@ def execute_query():
     if not query:
         return jsonify({"error": "No query provided"}), 400
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(query)
-        if query.strip().lower().startswith("select"):
-            results = cursor.fetchall()
-        else:
-            conn.commit()
-            results = {"message": "Query executed successfully"}
-        cursor.close()
-        conn.close()
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query)
+            if query.strip().lower().startswith("select"):
+                results = cursor.fetchall()
+            else:
+                conn.commit()
+                results = {"message": "Query executed successfully"}
+            cursor.close()
         return jsonify(results), 200
     except Exception:
         return jsonify({"error": "Query Execution Failed - API execute_query"}), 500
@@ -274,11 +966,10 @@ def api_status():
     uptime = round(time.time() - START_TIME, 2)
 
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1")
-        cursor.close()
-        conn.close()
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
         db_status = True
     except Exception:
         db_status = False
@@ -286,7 +977,8 @@ def api_status():
     return jsonify({
         "status": "API is running",
         "uptime_seconds": uptime,
-        "database_connected": db_status
+        "database_connected": db_status,
+        "database_pool": DB_POOL.metrics()
     })
 
 
@@ -309,30 +1001,115 @@ def download_challenge_files(challenge_id: str):
         return abort(404, description="Challenge files not found")
 
 
+# Rows of `query` as CSV text, read through a server-side cursor `batch_size` rows at a time
+def stream_csv(header: list, query: str, params: tuple = (), batch_size: int = EXPORT_BATCH_SIZE):
+    with get_db_connection() as conn:
+        # Named cursors live on the server, so only one batch is ever held in memory
+        with conn.cursor(name=f"export_{uuid.uuid4().hex}") as cur:
+            cur.execute(query, params)
+            buffer = StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(header)
+            while True:
+                rows = cur.fetchmany(batch_size)
+                writer.writerows(rows)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+                if len(rows) < batch_size:
+                    return
+
+
+# Start a CSV export, the query runs here so database errors still turn into a normal error response
+def csv_response(filename: str, header: list, query: str, params: tuple = ()) -> Response:
+    rows = stream_csv(header, query, params)
+    first = next(rows)
+    return Response(chain([first], rows), mimetype="text/csv",
+                    headers={"Content-disposition": f"attachment; filename={filename}"})
+
+
+# File-like target for COPY ... TO STDOUT, passes ~64KB chunks to the response through a bounded queue
+class CopyChunkWriter:
+    def __init__(self, chunks: queue.Queue, cancelled: threading.Event, size: int = 64 * 1024):
+        self.chunks = chunks
+        self.cancelled = cancelled
+        self.size = size
+        self._buffer = bytearray()
+
+    def write(self, data):
+        self._buffer += data
+        if len(self._buffer) >= self.size:
+            self.flush()
+
+    def flush(self):
+        chunk, self._buffer = bytes(self._buffer), bytearray()
+        if not put_chunk(self.chunks, self.cancelled, chunk):
+            raise IOError("Backup download was cancelled")
+
+
+# Blocks while the client is behind, gives up (returns False) once the response is closed
+def put_chunk(chunks: queue.Queue, cancelled: threading.Event, chunk) -> bool:
+    while not cancelled.is_set():
+        try:
+            chunks.put(chunk, timeout=1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+# Stream `COPY <table> TO STDOUT` for each table without holding the dump in memory, optionally gzipped
+def stream_copy(tables: list, compress: bool = False):
+    chunks = queue.Queue(maxsize=16)
+    cancelled = threading.Event()
+
+    def produce():
+        # psycopg2 pushes COPY output into a file object, so it runs in its own thread
+        try:
+            with get_db_connection() as conn, conn.cursor() as cursor:
+                writer = CopyChunkWriter(chunks, cancelled)
+                for table_name in tables:
+                    cursor.copy_expert(sql.SQL("COPY {} TO STDOUT WITH BINARY").format(sql.Identifier(table_name)),
+                                       writer)
+                writer.flush()
+            put_chunk(chunks, cancelled, None)
+        except Exception as e:
+            # Timed like the chunks, a client that left with the queue full must not leave this thread stuck
+            put_chunk(chunks, cancelled, e)
+
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31 writes a gzip container
+    try:
+        # Started on first read, so a response that is never sent never ties up a connection
+        threading.Thread(target=produce, daemon=True).start()
+        while (chunk := chunks.get()) is not None:
+            if isinstance(chunk, Exception):
+                # Headers are already sent, all we can do is end the download early and log it
+                print(f"Error streaming database backup: {chunk}")
+                return
+            chunk = compressor.compress(chunk) if compressor else chunk
+            if chunk:
+                yield chunk
+        if compressor:
+            yield compressor.flush()
+    finally:
+        cancelled.set()
+
+
 @app.route('/backup/db', methods=['GET'])
 @admin_required
 def backup_db():
     try:
-        # Get the PostgreSQL database connection
-        conn = get_db_connection()
-        backup_file = BytesIO()
-
-        with conn.cursor() as cursor:
-            # Use PostgreSQL's built-in COPY command to dump the entire database
+        with get_db_connection() as conn, conn.cursor() as cursor:
             cursor.execute("SELECT tablename FROM pg_tables WHERE schemaname='public'")
-            tables = cursor.fetchall()
+            tables = [table[0] for table in cursor.fetchall()]
 
-            for table in tables:
-                table_name = table[0]
-                cursor.copy_expert(f"COPY {table_name} TO STDOUT WITH BINARY", backup_file)
-
-        backup_file.seek(0)
-
-        # Create a response to stream the file to the user
+        # Use PostgreSQL's built-in COPY command to dump the entire database, streamed straight to the user
+        compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+        filename = "database_backup.dump.gz" if compress else "database_backup.dump"
         return Response(
-            backup_file,
-            mimetype='application/octet-stream',
-            headers={"Content-Disposition": "attachment; filename=database_backup.dump"}
+            stream_copy(tables, compress),
+            mimetype='application/gzip' if compress else 'application/octet-stream',
+            headers={"Content-Disposition": f"attachment; filename={filename}"}
         )
     except Exception as e:
         return abort(500, description=f"Error backing up database as {e}")
@@ -350,49 +1127,47 @@ def buy():
         flash("Invalid input! Make sure all fields are filled.", "error")
         return redirect(url_for('shop'))
 
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute('SELECT * FROM item WHERE id = %s;', (item_id,))
-    item = cur.fetchone()
+    with get_db_connection() as conn:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute('SELECT * FROM item WHERE id = %s;', (item_id,))
+        item = cur.fetchone()
 
-    if item and item["stock"] > 0:
-        cur.execute('INSERT INTO receipt (user_email, item_id) VALUES (%s, %s);', (user_email, item_id))
-        conn.commit()
+        if item and item["stock"] > 0:
+            cur.execute('INSERT INTO receipt (user_email, item_id) VALUES (%s, %s);', (user_email, item_id))
+            conn.commit()
 
-        # Fetch the image URL (stored in the `image` column of the database)
-        item_image_url = item['image']  # Assuming this is the URL of the image
+            # Fetch the image URL (stored in the `image` column of the database)
+            item_image_url = item['image']  # Assuming this is the URL of the image
 
-        # Generate receipt image and return as a downloadable file
-        receipt_image_io = generate_receipt_image(user_email, item['name'], item['price'], item_image_url)
+            # Generate receipt image and return as a downloadable file
+            receipt_image_io = generate_receipt_image(user_email, item['name'], item['price'], item_image_url)
 
-        # Return the image directly as a downloadable file without saving it
-        return send_file(receipt_image_io, mimetype='image/png', as_attachment=True,
-                         download_name=f"receipt_{str(uuid.uuid4())[:8]}.png")
+            # Return the image directly as a downloadable file without saving it
+            return send_file(receipt_image_io, mimetype='image/png', as_attachment=True,
+                             download_name=f"receipt_{str(uuid.uuid4())[:8]}.png")
 
-    else:
-        flash('Item out of stock!', 'error')
+        else:
+            flash('Item out of stock!', 'error')
 
-    cur.close()
-    conn.close()
+        cur.close()
     return redirect(url_for('shop'))
 
 
 @app.route('/api/shop/update_stock', methods=['POST'])
 @admin_required
 def update_stock():
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    # Iterate through all posted stock values
-    for key, value in request.form.items():
-        if key.startswith("stock_"):  # The key will be in the form of 'stock_<item_id>'
-            item_id = key.split("_")[1]
-            new_stock = int(value)
-            cur.execute('UPDATE item SET stock = %s WHERE id = %s;', (new_stock, item_id))
-
-    conn.commit()
-    cur.close()
-    conn.close()
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+
+        # Iterate through all posted stock values
+        for key, value in request.form.items():
+            if key.startswith("stock_"):  # The key will be in the form of 'stock_<item_id>'
+                item_id = key.split("_")[1]
+                new_stock = int(value)
+                cur.execute('UPDATE item SET stock = %s WHERE id = %s;', (new_stock, item_id))
+
+        conn.commit()
+        cur.close()
     flash("Stock updated successfully!", "success")
     return redirect(url_for('modify_stock'))
 
@@ -402,26 +1177,24 @@ def update_stock():
 def cancel_receipt():
     receipt_id = request.form.get('receipt_id')
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('DELETE FROM receipt WHERE id = %s;', (receipt_id,))
-    conn.commit()
-    flash("Receipt cancelled!", "success")
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('DELETE FROM receipt WHERE id = %s;', (receipt_id,))
+        conn.commit()
+        flash("Receipt cancelled!", "success")
 
-    cur.close()
-    conn.close()
+        cur.close()
     return redirect(url_for('volunteer'))
 
 
 @app.route('/api/shop/remove_mission/<int:mission_id>', methods=['GET'])
 @admin_required
 def remove_mission(mission_id):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('DELETE FROM missions WHERE id = %s;', (mission_id,))
-    conn.commit()
-    cur.close()
-    conn.close()
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute('DELETE FROM missions WHERE id = %s;', (mission_id,))
+        conn.commit()
+        cur.close()
 
     flash("Mission removed successfully!", "success")
     return redirect(url_for('missions'))
@@ -439,13 +1212,12 @@ def add_mission():
             flash("All fields are required!", "error")
             return redirect(url_for('add_mission'))
 
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute('INSERT INTO missions (name, description, scraps) VALUES (%s, %s, %s);',
-                    (name, description, int(scraps)))
-        conn.commit()
-        cur.close()
-        conn.close()
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute('INSERT INTO missions (name, description, scraps) VALUES (%s, %s, %s);',
+                        (name, description, int(scraps)))
+            conn.commit()
+            cur.close()
 
         flash("Mission added successfully!", "success")
         return redirect(url_for('missions'))
@@ -457,12 +1229,11 @@ def add_mission():
 @app.route('/api/get/size', methods=['GET'])
 def get_db_size():
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT pg_size_pretty(pg_database_size(current_database())) AS size")
-        size = cursor.fetchone()[0]
-        cursor.close()
-        conn.close()
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT pg_size_pretty(pg_database_size(current_database())) AS size")
+            size = cursor.fetchone()[0]
+            cursor.close()
         return jsonify({"size": size}), 200
     except Exception:
         return jsonify({"error": "Failed to get database size"}), 500
@@ -472,12 +1243,11 @@ def get_db_size():
 @rate_limit(limit=100)
 def get_active_connections():
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT count(*) FROM pg_stat_activity WHERE state = 'active' AND pid <> pg_backend_pid()")
-        active_connections = cursor.fetchone()[0]
-        cursor.close()
-        conn.close()
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT count(*) FROM pg_stat_activity WHERE state = 'active' AND pid <> pg_backend_pid()")
+            active_connections = cursor.fetchone()[0]
+            cursor.close()
         return jsonify({"activeConnections": active_connections}), 200
     except Exception:
         return jsonify({"error": "Failed to get active connections"}), 500
@@ -487,12 +1257,11 @@ def get_active_connections():
 @rate_limit(limit=100)
 def view_teams():
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT id, team_name, score FROM teams')
-        teams = cursor.fetchall()
-        cursor.close()
-        conn.close()
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT id, team_name, score FROM teams')
+            teams = cursor.fetchall()
+            cursor.close()
         return jsonify(teams), 200
     except Exception:
         return jsonify({"error": "Failed to get all teams"}), 500
@@ -507,41 +1276,36 @@ def get_challenge_progress():
     team_name = session['team_name']
 
     try:
-        conn = get_db_connection()
-
-        cursor = conn.cursor()
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
 
-        cursor.execute("""
-            SELECT challenge_id, flag_submitted, score
-            FROM challenge_progress
-            WHERE team_name = %s
-        """, (team_name,))
+            cursor.execute("""
+                SELECT challenge_id, flag_submitted, score
+                FROM challenge_progress
+                WHERE team_name = %s
+            """, (team_name,))
 
-        progress = cursor.fetchall()
+            progress = cursor.fetchall()
 
-        if not progress:
-            return jsonify({"message": "No progress found for the team"}), 404
+            if not progress:
+                return jsonify({"message": "No progress found for the team"}), 404
 
-        progress_data = [
-            {
-                "challenge_id": challenge_id,
-                "flag_submitted": flag_submitted,
-                "score": score
-            }
-            for challenge_id, flag_submitted, score in progress
-        ]
+            progress_data = [
+                {
+                    "challenge_id": challenge_id,
+                    "flag_submitted": flag_submitted,
+                    "score": score
+                }
+                for challenge_id, flag_submitted, score in progress
+            ]
 
-        return jsonify(progress_data), 200
+            return jsonify(progress_data), 200
 
     except DatabaseError:
         return jsonify({"error": "Database error has occurred - Function get_challenge_progress"}), 500
     except Exception:
         return jsonify({"error": "An error occurred - Function get_challenge_progress"}), 500
 
-    finally:
-        cursor.close()
-        conn.close()
-
 
 @app.route('/api/get/leaderboard', methods=['GET'])
 @rate_limit(limit=100)
@@ -553,19 +1317,9 @@ def get_leaderboard():
         # Calculate offset for pagination
         offset = (page - 1) * per_page
 
-        # Fetch leaderboard data from the database
-        conn = get_db_connection()
-
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT team_name, score 
-            FROM teams
-            ORDER BY score DESC
-            LIMIT %s OFFSET %s
-        """, (per_page, offset))
-        leaderboard_local = cursor.fetchall()
-        cursor.close()
-        conn.close()
+        # Slice of the in-process leaderboard
+        LEADERBOARD.sync()
+        leaderboard_local = LEADERBOARD.page(max(offset, 0), max(per_page, 0))
 
         return jsonify([{"team_name": team_name, "score": score} for team_name, score in leaderboard_local]), 200
     except Exception:
@@ -577,18 +1331,17 @@ def get_leaderboard():
 @admin_required
 def get_tables():
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT table_name
-            FROM information_schema.tables 
-            WHERE table_schema = 'public' AND table_type = 'BASE TABLE'
-            AND table_name NOT LIKE 'pg_%'
-            AND table_name NOT LIKE 'sql_%'
-        """)
-        tables = cursor.fetchall()
-        cursor.close()
-        conn.close()
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT table_name
+                FROM information_schema.tables 
+                WHERE table_schema = 'public' AND table_type = 'BASE TABLE'
+                AND table_name NOT LIKE 'pg_%'
+                AND table_name NOT LIKE 'sql_%'
+            """)
+            tables = cursor.fetchall()
+            cursor.close()
         return jsonify([table[0] for table in tables]), 200
     except Exception:
         return jsonify({"error": "Getting the tables failed"}), 500
@@ -598,15 +1351,14 @@ def get_tables():
 @admin_required
 def get_table_rows(table_name: str):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
 
-        query = sql.SQL("SELECT * FROM {} LIMIT 100").format(sql.Identifier(table_name))
-        cursor.execute(query)
-        rows = cursor.fetchall()
+            query = sql.SQL("SELECT * FROM {} LIMIT 100").format(sql.Identifier(table_name))
+            cursor.execute(query)
+            rows = cursor.fetchall()
 
-        cursor.close()
-        conn.close()
+            cursor.close()
         return jsonify(rows), 200
     except Exception:
         return jsonify({"error": "Getting the table rows failed"}), 500
@@ -616,16 +1368,15 @@ def get_table_rows(table_name: str):
 @admin_required
 def get_table_schema(table_name: str):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT column_name, data_type
-            FROM information_schema.columns
-            WHERE table_name = %s
-        """, (table_name,))
-        schema = cursor.fetchall()
-        cursor.close()
-        conn.close()
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT column_name, data_type
+                FROM information_schema.columns
+                WHERE table_name = %s
+            """, (table_name,))
+            schema = cursor.fetchall()
+            cursor.close()
         return jsonify(schema), 200
     except Exception:
         return jsonify({"error": "Getting the table schema failed"}), 500
@@ -636,19 +1387,18 @@ def get_table_schema(table_name: str):
 def get_table_headers(table_name: str):
     try:
         # Assuming we have a function to get the table headers from the database
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
 
-        query = sql.SQL("SELECT * FROM {} LIMIT 1").format(sql.Identifier(table_name))
-        cursor.execute(query)
-        row = cursor.fetchone()
+            query = sql.SQL("SELECT * FROM {} LIMIT 1").format(sql.Identifier(table_name))
+            cursor.execute(query)
+            row = cursor.fetchone()
 
-        if row is None:
-            raise Exception("Table is empty")
+            if row is None:
+                raise Exception("Table is empty")
 
-        headers = [desc[0] for desc in cursor.description]
-        cursor.close()
-        conn.close()
+            headers = [desc[0] for desc in cursor.description]
+            cursor.close()
 
         # Reformat all the headers to be human-readable
         return jsonify([header.replace("_", " ").title() for header in headers])
@@ -663,28 +1413,27 @@ def get_table_headers(table_name: str):
 @admin_required
 def delete_table_item(table_name: str, row_id: int):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # Get the primary key column name for the table
-        cursor.execute("""
-            SELECT a.attname
-            FROM pg_constraint c
-            JOIN pg_namespace n ON n.oid = c.connamespace
-            JOIN pg_class t ON t.oid = c.conrelid
-            JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = ANY(c.conkey)
-            WHERE n.nspname = 'public' AND t.relname = %s AND c.contype = 'p'
-        """, (table_name,))
-        primary_key_column = cursor.fetchone()[0]
-
-        # Use the primary key column name in the delete query
-        query = sql.SQL("DELETE FROM {} WHERE {} = %s").format(sql.Identifier(table_name),
-                                                               sql.Identifier(primary_key_column))
-        cursor.execute(query, (row_id,))
-        conn.commit()
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+
+            # Get the primary key column name for the table
+            cursor.execute("""
+                SELECT a.attname
+                FROM pg_constraint c
+                JOIN pg_namespace n ON n.oid = c.connamespace
+                JOIN pg_class t ON t.oid = c.conrelid
+                JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = ANY(c.conkey)
+                WHERE n.nspname = 'public' AND t.relname = %s AND c.contype = 'p'
+            """, (table_name,))
+            primary_key_column = cursor.fetchone()[0]
+
+            # Use the primary key column name in the delete query
+            query = sql.SQL("DELETE FROM {} WHERE {} = %s").format(sql.Identifier(table_name),
+                                                                   sql.Identifier(primary_key_column))
+            cursor.execute(query, (row_id,))
+            conn.commit()
 
-        cursor.close()
-        conn.close()
+            cursor.close()
         return jsonify({"message": "Item deleted successfully."}), 200
     except Exception:
         return jsonify({"error": f"Failed to delete item"}), 500
@@ -694,15 +1443,14 @@ def delete_table_item(table_name: str, row_id: int):
 @admin_required
 def delete_table(table_name: str):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
 
-        query = sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(table_name))
-        cursor.execute(query)
-        conn.commit()
+            query = sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(table_name))
+            cursor.execute(query)
+            conn.commit()
 
-        cursor.close()
-        conn.close()
+            cursor.close()
         return jsonify({"message": "Table deleted successfully."}), 200
     except Exception:
         return jsonify({"error": "Deleting the table failed"}), 500
@@ -712,13 +1460,12 @@ def delete_table(table_name: str):
 @admin_required
 def delete_database():
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("DROP TABLE IF EXISTS users")
-        cursor.execute("DROP TABLE IF EXISTS teams")
-        conn.commit()
-        cursor.close()
-        conn.close()
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DROP TABLE IF EXISTS users")
+            cursor.execute("DROP TABLE IF EXISTS teams")
+            conn.commit()
+            cursor.close()
         return jsonify({"message": "Database deleted successfully."}), 200
     except Exception:
         return jsonify({"error": "Deleting the database failed"}), 500
@@ -735,20 +1482,24 @@ def get_user_profile():
         team_name = session['team_name']
 
         # Fetch user profile data from the database
-        conn = get_db_connection()
-
-        cursor = conn.cursor()
-        cursor.execute('SELECT team_name, score, flags_submitted FROM teams WHERE team_name = %s', (team_name,))
-        result = cursor.fetchone()
-        cursor.close()
-        conn.close()
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT t.team_name, t.score, array_remove(array_agg(s.challenge_id ORDER BY s.solved_at), NULL)
+                FROM teams t
+                LEFT JOIN solves s ON s.team_name = t.team_name
+                WHERE t.team_name = %s
+                GROUP BY t.team_name, t.score
+            """, (team_name,))
+            result = cursor.fetchone()
+            cursor.close()
 
         if result:
-            team_name, score, flags_submitted = result
+            team_name, score, solved = result
             return jsonify({
                 "team_name": team_name,
                 "score": score,
-                "flags_submitted": flags_submitted.split(',')
+                "flags_submitted": [CHALLENGE_FLAGS.get(challenge) for challenge in solved]
             }), 200
         else:
             return jsonify({"error": "User not found"}), 404
@@ -765,25 +1516,13 @@ def get_team_rank():
 
         team_name = session['team_name']
 
-        # Fetch the team's score and rank from the database
-        conn = get_db_connection()
-
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT team_name, score 
-            FROM teams 
-            ORDER BY score DESC
-        """)
-        teams = cursor.fetchall()
-        cursor.close()
-        conn.close()
-
-        # Calculate the rank of the logged-in team
-        rank = next((i + 1 for i, (name, score) in enumerate(teams) if name == team_name), None)
+        # Rank of the logged-in team, from the in-process leaderboard
+        LEADERBOARD.sync()
+        found = LEADERBOARD.rank(team_name)
 
-        if rank:
-            # Find the score of the next team to compare
-            next_team_score = teams[rank] if rank < len(teams) else None
+        if found:
+            # The next team down, to compare against
+            rank, next_team_score = found
             return jsonify({"rank": rank, "next_team_score": next_team_score}), 200
         else:
             return jsonify({"error": "Team not found"}), 404
@@ -801,41 +1540,39 @@ def get_team_history():
         team_name = session['team_name']
 
         try:
-            conn = get_db_connection()
-
-            cursor = conn.cursor()
-
-            cursor.execute("""
-                SELECT timestamp, flags_submitted, score 
-                FROM team_history
-                WHERE team_name = %s
-                ORDER BY timestamp DESC
-            """, (team_name,))
-
-            history = cursor.fetchall()
-
-            if not history:
-                return jsonify({"message": "No history found for the team"}), 404
-
-            history_data = [
-                {
-                    "timestamp": timestamp,
-                    "flags_submitted": flags_submitted.split(",") if flags_submitted else [],
-                    "score": score
-                }
-                for timestamp, flags_submitted, score in history
-            ]
+            with get_db_connection() as conn:
+                cursor = conn.cursor()
+
+                # Score after each solve, oldest first
+                cursor.execute("""
+                    SELECT solved_at, challenge_id, SUM(points) OVER (ORDER BY solved_at, challenge_id)
+                    FROM solves
+                    WHERE team_name = %s
+                    ORDER BY solved_at, challenge_id
+                """, (team_name,))
+
+                history = cursor.fetchall()
+
+                if not history:
+                    return jsonify({"message": "No history found for the team"}), 404
+
+                history_data = []
+                flags_submitted = []
+                for timestamp, challenge, score in history:
+                    flags_submitted.append(CHALLENGE_FLAGS.get(challenge))
+                    history_data.append({
+                        "timestamp": timestamp,
+                        "flags_submitted": list(flags_submitted),
+                        "score": score
+                    })
+                history_data.reverse()
 
-            return jsonify(history_data), 200
+                return jsonify(history_data), 200
 
         except DatabaseError:
             return jsonify({"error": "Database error - Getting team history"}), 500
         except Exception:
             return jsonify({"error": "An error occurred - Getting team history"}), 500
-
-        finally:
-            cursor.close()
-            conn.close()
     except Exception:
         return jsonify({"error": "Failed to get team history"}), 500
 
@@ -850,37 +1587,32 @@ def get_submission_history():
         team_name = session['team_name']
 
         try:
-            conn = get_db_connection()
-
-            cursor = conn.cursor()
+            with get_db_connection() as conn:
+                cursor = conn.cursor()
 
-            cursor.execute("""
-                SELECT flag, timestamp 
-                FROM flag_submissions
-                WHERE team_name = %s
-                ORDER BY timestamp DESC
-            """, (team_name,))
+                cursor.execute("""
+                    SELECT challenge_id, solved_at
+                    FROM solves
+                    WHERE team_name = %s
+                    ORDER BY solved_at DESC
+                """, (team_name,))
 
-            submissions = cursor.fetchall()
+                submissions = cursor.fetchall()
 
-            if not submissions:
-                return jsonify({"message": "No submissions found for the team"}), 404
+                if not submissions:
+                    return jsonify({"message": "No submissions found for the team"}), 404
 
-            submission_data = [
-                {"flag": flag, "timestamp": timestamp}
-                for flag, timestamp in submissions
-            ]
+                submission_data = [
+                    {"flag": CHALLENGE_FLAGS.get(challenge), "timestamp": timestamp}
+                    for challenge, timestamp in submissions
+                ]
 
-            return jsonify(submission_data), 200
+                return jsonify(submission_data), 200
 
         except DatabaseError:
             return jsonify({"error": "Database error - Get submission history"}), 500
         except Exception:
             return jsonify({"error": "An error occurred - Get submission history"}), 500
-
-        finally:
-            cursor.close()
-            conn.close()
     except Exception:
         return jsonify({"error": "Failed to get submission history"}), 500
 
@@ -972,6 +1704,46 @@ def reimbursement():
         return jsonify({"message": f"❌ Error processing reimbursement: {str(e)}"})
 
 
+# Apply `delta` scraps to every matching user in chunks of `chunk_size`, each chunk one transaction that updates
+# balances and writes the log rows in a single statement; returns the number of users changed
+def adjust_scraps(conn, delta: int, name_pattern: str, minimum: Optional[int], log_name: str, reason: str,
+                  chunk_size: int = BATCH_CHUNK_SIZE, progress: dict = None) -> int:
+    query = """
+        WITH batch AS (
+            SELECT uuid FROM credit_card
+            WHERE (%(after)s::uuid IS NULL OR uuid > %(after)s::uuid)
+            AND name ILIKE %(pattern)s AND (%(minimum)s::integer IS NULL OR scraps >= %(minimum)s)
+            ORDER BY uuid
+            LIMIT %(chunk)s
+            FOR UPDATE
+        ), changed AS (
+            UPDATE credit_card c SET scraps = c.scraps + %(delta)s
+            FROM batch b WHERE c.uuid = b.uuid
+            RETURNING c.uuid
+        ), logged AS (
+            INSERT INTO transaction_logs (uuid, name, reason)
+            SELECT uuid, %(log_name)s, %(reason)s FROM changed
+        )
+        SELECT (SELECT count(*) FROM changed), (SELECT max(uuid::text) FROM batch)
+    """
+    total, after = 0, None
+    with conn.cursor() as cur:
+        while True:
+            # Keyset pagination on uuid, so each chunk starts where the last one stopped
+            cur.execute(query, {"after": after, "pattern": name_pattern, "minimum": minimum, "chunk": chunk_size,
+                                "delta": delta, "log_name": log_name, "reason": reason})
+            count, after = cur.fetchone()
+            conn.commit()
+            total += count
+            if progress is not None:
+                progress["processed"] = total
+                progress["chunks"] = progress.get("chunks", 0) + 1
+            if count:
+                print(f"Batch {log_name}: {total} users done")
+            if count < chunk_size:
+                return total
+
+
 @app.route("/api/bank/batch-operation", methods=["POST"])
 def batch_operation():
     if not session.get("logged_in"):
@@ -982,64 +1754,54 @@ def batch_operation():
     filter_query = data.get("filter", "")
     amount = data.get("amount", 0)
     reason = data.get("reason", "Batch Operation")
+    # Optional id the client picks, to poll /api/bank/batch-operation/<job_id> while this runs
+    job_id = data.get("job_id") or str(uuid.uuid4())
+    while len(BATCH_PROGRESS) >= 100:  # Only the most recent jobs are kept
+        BATCH_PROGRESS.pop(next(iter(BATCH_PROGRESS)))
+    progress = BATCH_PROGRESS[job_id] = {"processed": 0, "chunks": 0, "finished": False}
+
+    # Filters match any part of the name, no filter matches everyone
+    name_pattern = '%' + filter_query + '%'
 
     try:
+        amount = int(amount)
         with get_db_connection() as conn:
-            with conn.cursor() as cur:
-                if operation_type == "add_scraps":
-                    # Add scraps to filtered users
-                    if filter_query:
-                        cur.execute(
-                            "UPDATE credit_card SET scraps = scraps + %s WHERE name ILIKE %s RETURNING uuid, name",
-                            (amount, '%' + filter_query + '%'))
-                    else:
-                        cur.execute("UPDATE credit_card SET scraps = scraps + %s RETURNING uuid, name",
-                                    (amount,))
-
-                    affected_users = cur.fetchall()
-                    affected_count = len(affected_users)
-
-                    # Log the batch transaction for each user
-                    for user in affected_users:
-                        cur.execute("INSERT INTO transaction_logs (uuid, name, reason) VALUES (%s, %s, %s)",
-                                    (user[0], "Batch Add", f"{reason} (+{amount} scraps)"))
-
-                    message = f"✅ Added {amount} scraps to {affected_count} users!"
-
-                elif operation_type == "remove_scraps":
-                    # Remove scraps from filtered users (only if they have enough)
-                    if filter_query:
-                        cur.execute(
-                            "UPDATE credit_card SET scraps = scraps - %s WHERE name ILIKE %s AND scraps >= %s RETURNING uuid, name",
-                            (amount, '%' + filter_query + '%', amount))
-                    else:
-                        cur.execute(
-                            "UPDATE credit_card SET scraps = scraps - %s WHERE scraps >= %s RETURNING uuid, name",
-                            (amount, amount))
-
-                    affected_users = cur.fetchall()
-                    affected_count = len(affected_users)
-
-                    # Log the batch transaction for each user
-                    for user in affected_users:
-                        cur.execute("INSERT INTO transaction_logs (uuid, name, reason) VALUES (%s, %s, %s)",
-                                    (user[0], "Batch Remove", f"{reason} (-{amount} scraps)"))
-
-                    message = f"✅ Removed {amount} scraps from {affected_count} users!"
+            if operation_type == "add_scraps":
+                affected_count = adjust_scraps(conn, amount, name_pattern, None, "Batch Add",
+                                               f"{reason} (+{amount} scraps)", progress=progress)
+                message = f"✅ Added {amount} scraps to {affected_count} users!"
 
-                else:
-                    return jsonify({"success": False, "message": "Invalid operation type"})
+            elif operation_type == "remove_scraps":
+                # Remove scraps from filtered users (only if they have enough)
+                affected_count = adjust_scraps(conn, -amount, name_pattern, amount, "Batch Remove",
+                                               f"{reason} (-{amount} scraps)", progress=progress)
+                message = f"✅ Removed {amount} scraps from {affected_count} users!"
 
-                conn.commit()
+            else:
+                return jsonify({"success": False, "message": "Invalid operation type"})
 
         return jsonify({
             "success": True,
             "message": message,
-            "affected_count": affected_count
+            "affected_count": affected_count,
+            "job_id": job_id
         })
     except Exception as e:
+        # Chunks already committed stay applied, so say how far it got
         print(f"Error in batch operation: {str(e)}")
-        return jsonify({"success": False, "message": f"❌ Error in batch operation: {str(e)}"})
+        return jsonify({"success": False, "job_id": job_id, "affected_count": progress["processed"],
+                        "message": f"❌ Error in batch operation after {progress['processed']} users: {str(e)}"})
+    finally:
+        progress["finished"] = True
+
+
+@app.route("/api/bank/batch-operation/<job_id>", methods=["GET"])
+def batch_operation_progress(job_id: str):
+    if not session.get("logged_in"):
+        return jsonify({"success": False, "message": "Not authorized"}), 403
+    if job_id not in BATCH_PROGRESS:
+        return jsonify({"success": False, "message": "Unknown job"}), 404
+    return jsonify({"success": True, **BATCH_PROGRESS[job_id]})
 
 
 @app.route("/api/bank/export-users", methods=["GET"])
@@ -1048,26 +1810,8 @@ def export_users():
         return redirect(url_for("login"))
 
     try:
-        with get_db_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT uuid, name, scraps FROM credit_card ORDER BY name ASC")
-                users = cur.fetchall()
-
-        # Create CSV content
-        csv_content = "UUID,Name,Scraps\n"
-        for user in users:
-            # Escape commas in names
-            name = f'"{user[1]}"' if ',' in user[1] else user[1]
-            csv_content += f"{user[0]},{name},{user[2]}\n"
-
-        # Create response with CSV file
-        response = Response(
-            csv_content,
-            mimetype="text/csv",
-            headers={
-                "Content-disposition": f"attachment; filename=users_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"}
-        )
-        return response
+        return csv_response(f"users_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv", ["UUID", "Name", "Scraps"],
+                            "SELECT uuid, name, scraps FROM credit_card ORDER BY name ASC")
     except Exception as e:
         print(f"Error exporting users: {str(e)}")
         return f"Error exporting users: {str(e)}", 500
@@ -1079,26 +1823,9 @@ def export_transactions():
         return redirect(url_for("login"))
 
     try:
-        with get_db_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT uuid, name, reason, timestamp FROM transaction_logs ORDER BY timestamp DESC")
-                transactions_ = cur.fetchall()
-
-        # Create CSV content
-        csv_content = "UUID,Type,Reason,Timestamp\n"
-        for transaction in transactions_:
-            # Escape commas in reason
-            reason = f'"{transaction[2]}"' if ',' in transaction[2] else transaction[2]
-            csv_content += f"{transaction[0]},{transaction[1]},{reason},{transaction[3]}\n"
-
-        # Create response with CSV file
-        response = Response(
-            csv_content,
-            mimetype="text/csv",
-            headers={
-                "Content-disposition": f"attachment; filename=transactions_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"}
-        )
-        return response
+        return csv_response(f"transactions_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                            ["UUID", "Type", "Reason", "Timestamp"],
+                            "SELECT uuid, name, reason, timestamp FROM transaction_logs ORDER BY timestamp DESC")
     except Exception as e:
         print(f"Error exporting transactions: {str(e)}")
         return f"Error exporting transactions: {str(e)}", 500
@@ -1154,78 +1881,32 @@ def transaction_analytics():
     transaction_type = request.args.get("type", "all")
 
     try:
-        # Calculate time range
+        # Calculate time range, in whole hours like the rollup
         end_time = datetime.now()
-        start_time = end_time - timedelta(hours=hours)
+        start_time = (end_time - timedelta(hours=hours)).replace(minute=0, second=0, microsecond=0)
 
         with get_db_connection() as conn:
             with conn.cursor() as cur:
-                # Build query based on transaction type
-                if transaction_type == "all":
-                    query = """
-                        SELECT 
-                            DATE_TRUNC('hour', timestamp) as hour_timestamp,
-                            name,
-                            COUNT(*) as count
-                        FROM transaction_logs
-                        WHERE timestamp >= %s AND timestamp <= %s
-                        GROUP BY DATE_TRUNC('hour', timestamp), name
-                        ORDER BY hour_timestamp
-                    """
-                    cur.execute(query, (start_time, end_time))
-                else:
-                    query = """
-                        SELECT 
-                            DATE_TRUNC('hour', timestamp) as hour_timestamp,
-                            name,
-                            COUNT(*) as count
-                        FROM transaction_logs
-                        WHERE timestamp >= %s AND timestamp <= %s AND name = %s
-                        GROUP BY DATE_TRUNC('hour', timestamp), name
-                        ORDER BY hour_timestamp
-                    """
-                    cur.execute(query, (start_time, end_time, transaction_type))
-
+                # One row per hour in the range, hours without transactions included as zeros
+                cur.execute("""
+                    SELECT
+                        to_char(h.hour, 'YYYY-MM-DD HH24:00'),
+                        COALESCE(SUM(t.transactions) FILTER (WHERE t.name = 'Purchase'), 0),
+                        COALESCE(SUM(t.transactions) FILTER (WHERE t.name = 'Reimbursement'), 0)
+                    FROM generate_series(%(start)s::timestamp, %(end)s::timestamp, interval '1 hour') h(hour)
+                    LEFT JOIN transaction_type_hourly t
+                        ON t.hour = h.hour AND (%(type)s = 'all' OR t.name = %(type)s)
+                    GROUP BY h.hour
+                    ORDER BY h.hour
+                """, {"start": start_time, "end": end_time, "type": transaction_type})
                 results = cur.fetchall()
 
-        # Process results into a format suitable for charts
-        hours_labels = []
-        purchases = []
-        reimbursements = []
-
-        # Create a dictionary to store counts by hour
-        hour_data = {}
-
-        for row in results:
-            hour_str = row[0].strftime("%Y-%m-%d %H:00")
-            if hour_str not in hour_data:
-                hour_data[hour_str] = {"Purchase": 0, "Reimbursement": 0}
-
-            transaction_name = row[1]
-            if transaction_name in ["Purchase", "Reimbursement"]:
-                hour_data[hour_str][transaction_name] = row[2]
-
-        # Fill in missing hours in the range
-        current_hour = start_time.replace(minute=0, second=0, microsecond=0)
-        while current_hour <= end_time:
-            hour_str = current_hour.strftime("%Y-%m-%d %H:00")
-            if hour_str not in hour_data:
-                hour_data[hour_str] = {"Purchase": 0, "Reimbursement": 0}
-            current_hour += timedelta(hours=1)
-
-        # Sort hours and create final arrays
-        sorted_hours = sorted(hour_data.keys())
-        for hour in sorted_hours:
-            hours_labels.append(hour)
-            purchases.append(hour_data[hour]["Purchase"])
-            reimbursements.append(hour_data[hour]["Reimbursement"])
-
         return jsonify({
             "success": True,
             "data": {
-                "labels": hours_labels,
-                "purchases": purchases,
-                "reimbursements": reimbursements
+                "labels": [row[0] for row in results],
+                "purchases": [row[1] for row in results],
+                "reimbursements": [row[2] for row in results]
             }
         })
     except Exception as e:
@@ -1241,17 +1922,13 @@ def dashboard_stats():
     try:
         with get_db_connection() as conn:
             with conn.cursor() as cur:
-                # Get total users
-                cur.execute("SELECT COUNT(*) FROM credit_card")
-                total_users = cur.fetchone()[0]
-
-                # Get total transactions
-                cur.execute("SELECT COUNT(*) FROM transaction_logs")
-                total_transactions = cur.fetchone()[0]
-
-                # Get total scraps
-                cur.execute("SELECT SUM(scraps) FROM credit_card")
-                total_scraps = cur.fetchone()[0] or 0
+                # Running totals, kept current by triggers on credit_card and transaction_logs, one row per shard
+                cur.execute("""
+                    SELECT COALESCE(sum(users), 0)::BIGINT, COALESCE(sum(transactions), 0)::BIGINT,
+                           COALESCE(sum(scraps), 0)::BIGINT
+                    FROM bank_totals
+                """)
+                total_users, total_transactions, total_scraps = cur.fetchone()
 
         return jsonify({
             "success": True,
@@ -1264,6 +1941,117 @@ def dashboard_stats():
         return jsonify({"success": False, "message": str(e)}), 500
 
 
+# Fold the shard rows of the dashboard rollups into shard 0, the sums stay the same so writers can carry on
+def compact_rollups(cur):
+    # Finished hours only, the current one is still being written to
+    cur.execute("""
+        WITH folded AS (
+            DELETE FROM transaction_type_hourly
+            WHERE shard <> 0 AND hour < date_trunc('hour', LOCALTIMESTAMP)
+            RETURNING hour, name, transactions, scraps
+        )
+        INSERT INTO transaction_type_hourly AS r (hour, name, shard, transactions, scraps)
+        SELECT hour, name, 0, sum(transactions), sum(scraps) FROM folded GROUP BY 1, 2
+        ON CONFLICT (hour, name, shard) DO UPDATE SET transactions = r.transactions + EXCLUDED.transactions,
+                                                      scraps = r.scraps + EXCLUDED.scraps
+    """)
+    cur.execute("""
+        WITH folded AS (
+            DELETE FROM bank_totals WHERE id <> 0 RETURNING users, transactions, scraps
+        )
+        INSERT INTO bank_totals AS t (id, users, transactions, scraps)
+        SELECT 0, sum(users), sum(transactions), sum(scraps) FROM folded HAVING count(*) > 0
+        ON CONFLICT (id) DO UPDATE SET users = t.users + EXCLUDED.users,
+                                       transactions = t.transactions + EXCLUDED.transactions,
+                                       scraps = t.scraps + EXCLUDED.scraps
+    """)
+
+
+# Check the dashboard rollups against the raw tables (optionally only the last `hours`), and fix them if `repair`
+def reconcile_rollups(repair: bool = False, hours: int = None) -> dict:
+    since = datetime.now() - timedelta(hours=hours) if hours else datetime.min
+    since = since.replace(minute=0, second=0, microsecond=0)
+    with get_db_connection() as conn, conn.cursor() as cur:
+        compact_rollups(cur)
+
+    with get_db_connection() as conn, conn.cursor() as cur:
+        # Rollups are written in the same transaction as the rows they count, so one snapshot sees both agree
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        if repair:
+            # Hold off writers, so nothing changes between the comparison and the fix
+            cur.execute("LOCK TABLE transaction_logs, credit_card IN SHARE MODE")
+
+        cur.execute("""
+            SELECT COALESCE(l.hour, r.hour), COALESCE(l.name, r.name),
+                   COALESCE(l.transactions, 0), COALESCE(l.scraps, 0)::BIGINT,
+                   COALESCE(r.transactions, 0)::BIGINT, COALESCE(r.scraps, 0)::BIGINT
+            FROM (
+                SELECT date_trunc('hour', timestamp) AS hour, name, count(*) AS transactions,
+                       sum(COALESCE(amount, transaction_amount(name, reason))) AS scraps
+                FROM transaction_logs
+                WHERE timestamp >= %(since)s
+                GROUP BY 1, 2
+            ) l
+            FULL JOIN (
+                SELECT hour, name, sum(transactions) AS transactions, sum(scraps) AS scraps
+                FROM transaction_type_hourly
+                WHERE hour >= %(since)s
+                GROUP BY 1, 2
+            ) r
+                ON r.hour = l.hour AND r.name = l.name
+            WHERE COALESCE(l.transactions, 0) <> COALESCE(r.transactions, 0)
+               OR COALESCE(l.scraps, 0) <> COALESCE(r.scraps, 0)
+        """, {"since": since})
+        hourly = cur.fetchall()
+
+        cur.execute("""
+            SELECT (SELECT count(*) FROM credit_card), (SELECT count(*) FROM transaction_logs),
+                   (SELECT COALESCE(sum(scraps), 0) FROM credit_card),
+                   COALESCE(sum(users), 0)::BIGINT, COALESCE(sum(transactions), 0)::BIGINT,
+                   COALESCE(sum(scraps), 0)::BIGINT
+            FROM bank_totals
+        """)
+        row = cur.fetchone()
+        actual, stored = row[:3], row[3:]
+        consistent = not hourly and actual == stored
+
+        if repair and not consistent:
+            for hour, name, transactions, scraps, _, _ in hourly:
+                cur.execute("DELETE FROM transaction_type_hourly WHERE hour = %s AND name = %s", (hour, name))
+                cur.execute("""
+                    INSERT INTO transaction_type_hourly (hour, name, transactions, scraps) VALUES (%s, %s, %s, %s)
+                """, (hour, name, transactions, scraps))
+            if actual != stored:
+                cur.execute("DELETE FROM bank_totals")
+                cur.execute("INSERT INTO bank_totals (id, users, transactions, scraps) VALUES (0, %s, %s, %s)", actual)
+
+    return {
+        "hourly_mismatches": [{"hour": hour.strftime("%Y-%m-%d %H:00"), "type": name,
+                               "logs": {"transactions": logs, "scraps": logs_scraps},
+                               "rollup": {"transactions": rollup, "scraps": rollup_scraps}}
+                              for hour, name, logs, logs_scraps, rollup, rollup_scraps in hourly],
+        "totals": {"logs": dict(zip(("users", "transactions", "scraps"), actual)),
+                   "rollup": dict(zip(("users", "transactions", "scraps"), stored))},
+        "consistent": consistent,
+        "repaired": repair and not consistent
+    }
+
+
+@app.route("/api/bank/reconcile-rollups", methods=["POST"])
+def reconcile_rollups_route():
+    if not session.get("logged_in"):
+        return jsonify({"success": False, "message": "Not authorized"}), 403
+
+    data = request.json or {}
+    try:
+        hours = int(data["hours"]) if data.get("hours") else None
+        result = reconcile_rollups(repair=bool(data.get("repair")), hours=hours)
+        return jsonify({"success": True, **result})
+    except Exception as e:
+        print(f"Error in reconcile_rollups: {str(e)}")
+        return jsonify({"success": False, "message": str(e)}), 500
+
+
 @app.route("/api/bank/fraud-detection", methods=["GET"])
 def fraud_detection():
     if not session.get("logged_in"):
@@ -1277,179 +2065,80 @@ def fraud_detection():
                 end_time = datetime.now()
                 start_time = end_time - timedelta(hours=hours)
 
-                # 1. Detect frequent transactions from same UUID
-                cur.execute("""
-                    SELECT uuid, COUNT(*) as transaction_count
-                    FROM transaction_logs
-                    WHERE timestamp >= %s
-                    GROUP BY uuid
-                    HAVING COUNT(*) > 5
-                    ORDER BY transaction_count DESC
-                    LIMIT 10
-                """, (start_time,))
+                # Rollups are per hour, so the window starts at the top of the hour
+                since = start_time.replace(minute=0, second=0, microsecond=0)
+
+                # Users whose summed hourly signal passes `threshold`, with their names joined in
+                def flagged_users(column: str, threshold: int) -> list:
+                    cur.execute(f"""
+                        SELECT r.uuid, COALESCE(c.name, 'Unknown'), SUM(r.{column}) AS total
+                        FROM transaction_risk_hourly r
+                        LEFT JOIN credit_card c ON c.uuid = r.uuid
+                        WHERE r.hour >= %s
+                        GROUP BY r.uuid, c.name
+                        HAVING SUM(r.{column}) > %s
+                        ORDER BY total DESC
+                        LIMIT 10
+                    """, (since, threshold))
+                    return cur.fetchall()
 
-                frequent_users = []
-                for row in cur.fetchall():
-                    # Get username
-                    cur.execute("SELECT name FROM credit_card WHERE uuid = %s", (row[0],))
-                    user_name = cur.fetchone()[0] if cur.rowcount > 0 else "Unknown"
-
-                    frequent_users.append({
-                        "uuid": row[0],
-                        "name": user_name,
-                        "transaction_count": row[1],
-                        "risk_level": "high" if row[1] > 30 else "medium"
-                    })
+                # 1. Detect frequent transactions from same UUID
+                frequent_users = [{
+                    "uuid": uuid_,
+                    "name": user_name,
+                    "transaction_count": count,
+                    "risk_level": "high" if count > 30 else "medium"
+                } for uuid_, user_name, count in flagged_users("transactions", 5)]
 
                 # 2. Detect duplicate reasons (same reason used multiple times)
                 cur.execute("""
-                    SELECT uuid, reason, COUNT(*) as reason_count
-                    FROM transaction_logs
-                    WHERE timestamp >= %s AND name = 'Purchase'
-                    GROUP BY uuid, reason
-                    HAVING COUNT(*) > 2
+                    SELECT r.uuid, COALESCE(c.name, 'Unknown'), r.reason, SUM(r.uses) AS reason_count
+                    FROM purchase_reason_hourly r
+                    LEFT JOIN credit_card c ON c.uuid = r.uuid
+                    WHERE r.hour >= %s
+                    GROUP BY r.uuid, c.name, r.reason
+                    HAVING SUM(r.uses) > 2
                     ORDER BY reason_count DESC
                     LIMIT 10
-                """, (start_time,))
-
-                duplicate_reasons = []
-                for row in cur.fetchall():
-                    # Get username
-                    cur.execute("SELECT name FROM credit_card WHERE uuid = %s", (row[0],))
-                    user_name = cur.fetchone()[0] if cur.rowcount > 0 else "Unknown"
-
-                    duplicate_reasons.append({
-                        "uuid": row[0],
-                        "name": user_name,
-                        "reason": row[1],
-                        "count": row[2],
-                        "risk_level": "high" if row[2] > 5 else "medium"
-                    })
-
-                # 3. Detect unusual transaction patterns (purchase followed by reimbursement)
-                cur.execute("""
-                    WITH user_transactions AS (
-                        SELECT 
-                            uuid, 
-                            name as transaction_type, 
-                            timestamp,
-                            LAG(name) OVER (PARTITION BY uuid ORDER BY timestamp) as prev_type,
-                            LAG(timestamp) OVER (PARTITION BY uuid ORDER BY timestamp) as prev_timestamp
-                        FROM transaction_logs
-                        WHERE timestamp >= %s
-                    )
-                    SELECT 
-                        uuid, 
-                        COUNT(*) as pattern_count
-                    FROM user_transactions
-                    WHERE 
-                        transaction_type = 'Reimbursement' AND 
-                        prev_type = 'Purchase' AND
-                        timestamp - prev_timestamp < interval '1 hour'
-                    GROUP BY uuid
-                    HAVING COUNT(*) > 2
-                    ORDER BY pattern_count DESC
-                    LIMIT 10
-                """, (start_time,))
-
-                unusual_patterns = []
-                for row in cur.fetchall():
-                    # Get username
-                    cur.execute("SELECT name FROM credit_card WHERE uuid = %s", (row[0],))
-                    user_name = cur.fetchone()[0] if cur.rowcount > 0 else "Unknown"
-
-                    unusual_patterns.append({
-                        "uuid": row[0],
-                        "name": user_name,
-                        "pattern": "Purchase-Reimbursement cycle",
-                        "count": row[1],
-                        "risk_level": "high" if row[1] > 3 else "medium"
-                    })
+                """, (since,))
+                duplicate_reasons = [{
+                    "uuid": uuid_,
+                    "name": user_name,
+                    "reason": reason,
+                    "count": count,
+                    "risk_level": "high" if count > 5 else "medium"
+                } for uuid_, user_name, reason, count in cur.fetchall()]
+
+                # 3. Detect unusual transaction patterns (purchase followed by reimbursement within an hour)
+                unusual_patterns = [{
+                    "uuid": uuid_,
+                    "name": user_name,
+                    "pattern": "Purchase-Reimbursement cycle",
+                    "count": count,
+                    "risk_level": "high" if count > 3 else "medium"
+                } for uuid_, user_name, count in flagged_users("purchase_reimbursement_cycles", 2)]
 
                 # 4. Detect unusual transaction times (outside normal hours 8am-8pm)
                 unusual_times = []  # Empty list since we're removing this risk factor
 
-                # 5. Detect sudden balance changes
-                cur.execute(r"""
-                    WITH balance_changes AS (
-                        SELECT 
-                            tl.uuid,
-                            tl.name AS transaction_type,
-                            CASE 
-                                WHEN tl.name IN ('Purchase', 'Batch Remove') THEN -1
-                                WHEN tl.name IN ('Reimbursement', 'Batch Add') THEN 1
-                                ELSE 0
-                            END AS direction,
-                            tl.reason,
-                            tl.timestamp
-                        FROM transaction_logs tl
-                        WHERE timestamp >= %s
-                    )
-                    SELECT 
-                        uuid, 
-                        COUNT(*) AS large_changes
-                    FROM balance_changes
-                    WHERE 
-                        reason ~ '[-+]?\d{2,}'  -- Matches numbers 30 and above (positive or negative)
-                        AND ABS(CAST((regexp_match(reason, '[-+]?\d{2,}'))[1] AS INTEGER)) >= 30
-                    GROUP BY uuid
-                    HAVING COUNT(*) > 2
-                    ORDER BY large_changes DESC
-                    LIMIT 10;
-                """, (start_time,))
-
-                large_changes = []
-                for row in cur.fetchall():
-                    # Get username
-                    cur.execute("SELECT name FROM credit_card WHERE uuid = %s", (row[0],))
-                    user_name = cur.fetchone()[0] if cur.rowcount > 0 else "Unknown"
-
-                    large_changes.append({
-                        "uuid": row[0],
-                        "name": user_name,
-                        "count": row[1],
-                        "risk_level": "high" if row[1] > 4 else "medium"
-                    })
-
-                # Calculate overall risk score for each user
-                all_uuids = set()
-                for item in frequent_users + duplicate_reasons + unusual_patterns + unusual_times + large_changes:
-                    all_uuids.add(item["uuid"])
+                # 5. Detect sudden balance changes (amounts of 30 scraps or more)
+                large_changes = [{
+                    "uuid": uuid_,
+                    "name": user_name,
+                    "count": count,
+                    "risk_level": "high" if count > 4 else "medium"
+                } for uuid_, user_name, count in flagged_users("large_changes", 2)]
 
+                # Calculate overall risk score for each user, (signal, points if high, points if medium)
                 risk_scores = {}
-                for uuid_ in all_uuids:
-                    risk_score = 0
-
-                    # Add scores from frequent transactions
-                    for item in frequent_users:
-                        if item["uuid"] == uuid_:
-                            risk_score += 30 if item["risk_level"] == "high" else 15
-
-                    # Add scores from duplicate reasons
-                    for item in duplicate_reasons:
-                        if item["uuid"] == uuid_:
-                            risk_score += 25 if item["risk_level"] == "high" else 10
-
-                    # Add scores from unusual patterns
-                    for item in unusual_patterns:
-                        if item["uuid"] == uuid_:
-                            risk_score += 40 if item["risk_level"] == "high" else 20
-
-                    # Add scores from large changes
-                    for item in large_changes:
-                        if item["uuid"] == uuid_:
-                            risk_score += 35 if item["risk_level"] == "high" else 15
-
-                    # Get username
-                    cur.execute("SELECT name FROM credit_card WHERE uuid = %s", (uuid_,))
-                    user_name = cur.fetchone()[0] if cur.rowcount > 0 else "Unknown"
-
-                    risk_scores[uuid_] = {
-                        "uuid": uuid_,
-                        "name": user_name,
-                        "score": risk_score,
-                        "level": "high" if risk_score > 70 else "medium" if risk_score > 30 else "low"
-                    }
+                for items, high, medium in ((frequent_users, 30, 15), (duplicate_reasons, 25, 10),
+                                            (unusual_patterns, 40, 20), (large_changes, 35, 15)):
+                    for item in items:
+                        entry = risk_scores.setdefault(item["uuid"], {"uuid": item["uuid"], "name": item["name"],
+                                                                      "score": 0})
+                        entry["score"] += high if item["risk_level"] == "high" else medium
+                for entry in risk_scores.values():
+                    entry["level"] = "high" if entry["score"] > 70 else "medium" if entry["score"] > 30 else "low"
 
                 # Sort risk scores by score (descending)
                 sorted_risk_scores = sorted(
@@ -1496,7 +2185,7 @@ def retry(url_to_check: str):
         sanitized_url = re.sub(r'^(https?://)?(www\.)?', '', url_to_check)
 
         # Prevent SSRF by checking if the URL is in the whitelist
-        if not any(re.fullmatch(pattern, sanitized_url) for pattern in allowed_urls()):
+        if not ALLOWED_URLS.match(sanitized_url):
             return jsonify({
                 "error_code": "URL_NOT_ALLOWED",
                 "error_message": "URL not in whitelist. Contact the developer if this is unexpected.",
@@ -1511,16 +2200,21 @@ def retry(url_to_check: str):
                 "status_code": 400
             }), 400
 
-        # Attempt the request
-        response = requests.get(url_to_check)
+        # Attempt the request, or reuse the result of a retry from the last few seconds
+        result = RETRY_CACHE.get(url_to_check)
+        if result is None:
+            response = RETRY_SESSION.get(url_to_check, timeout=RETRY_TIMEOUT)
+            result = (response.status_code, response.text[:250])  # Limit response to prevent excessive logging
+            RETRY_CACHE.put(url_to_check, result)
+        status_code, response_text = result
 
         # Return a structured JSON response
         return jsonify({
-            "message": "Retry successful" if response.status_code == 200 else "Retry failed",
+            "message": "Retry successful" if status_code == 200 else "Retry failed",
             "retried_url": url_to_check,
-            "status_code": response.status_code,
-            "response_text": response.text[:250]  # Limit response to prevent excessive logging
-        }), response.status_code
+            "status_code": status_code,
+            "response_text": response_text
+        }), status_code
 
     except requests.exceptions.ConnectionError:
         return jsonify({
@@ -1553,14 +2247,68 @@ def retry(url_to_check: str):
         }), 500
 
 
-def allowed_urls() -> List[str]:
-    allowed = []
-    for rule in app.url_map.iter_rules():
-        url = "scrapyard-bounty.vercel.app" + str(rule)
-        # Convert Flask URL rules to regex patterns
-        url_pattern = re.sub(r'<[^>]+>', r'[^/]+', url)
-        allowed.append(url_pattern)
-    return allowed
+# Every route of this app as one compiled pattern, rebuilt only after a rule is added
+class RouteMatcher:
+    def __init__(self, url_map, domain: str):
+        self.domain = domain
+        self._url_map = url_map
+        self._pattern = None
+        self._lock = threading.Lock()
+
+        # Flask registers every rule through Map.add, so a new route just drops the compiled pattern
+        add = url_map.add
+
+        def add_rule(rule_factory):
+            add(rule_factory)
+            self._pattern = None
+
+        url_map.add = add_rule
+
+    def _compile(self) -> re.Pattern:
+        with self._lock:
+            if self._pattern is None:
+                # Convert Flask URL rules to regex patterns, a variable matches one path segment
+                routes = sorted({"[^/]+".join(re.escape(part) for part in re.split(r'<[^>]+>', rule.rule))
+                                 for rule in self._url_map.iter_rules()})
+                self._pattern = re.compile(f"{re.escape(self.domain)}(?:{'|'.join(routes)})")
+            return self._pattern
+
+    def match(self, url: str) -> bool:
+        pattern = self._pattern or self._compile()
+        return pattern.fullmatch(url) is not None
+
+
+# Recent /retry results by URL, expired ones are dropped when looked up and the oldest when full
+class ResponseCache:
+    def __init__(self, ttl: float, max_items: int):
+        self.ttl = ttl
+        self.max_items = max_items
+        self._items = OrderedDict()  # url -> (expires at, result)
+        self._lock = threading.Lock()
+
+    def get(self, url: str):
+        with self._lock:
+            entry = self._items.get(url)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._items[url]
+                return None
+            return entry[1]
+
+    def put(self, url: str, result):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._items[url] = (time.monotonic() + self.ttl, result)
+            self._items.move_to_end(url)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+
+ALLOWED_URLS = RouteMatcher(app.url_map, "scrapyard-bounty.vercel.app")
+RETRY_CACHE = ResponseCache(RETRY_CACHE_TTL, RETRY_CACHE_SIZE)
+RETRY_SESSION = requests.Session()  # Keeps connections to retried hosts open between calls
 
 
 def generate_receipt_image(user_email: str, item_name: str, item_price: float | int, item_image_url: str) -> BytesIO:
@@ -1750,17 +2498,16 @@ def airtable():
 @app.route('/admin/shop')
 @admin_required
 def volunteer():
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    # Perform a join to fetch item details alongside receipts
-    cur.execute('''
-        SELECT receipt.id, receipt.user_email, receipt.status, item.name, item.price
-        FROM receipt
-        JOIN item ON receipt.item_id = item.id
-    ''')
-    receipts = cur.fetchall()
-    cur.close()
-    conn.close()
+    with get_db_connection() as conn:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        # Perform a join to fetch item details alongside receipts
+        cur.execute('''
+            SELECT receipt.id, receipt.user_email, receipt.status, item.name, item.price
+            FROM receipt
+            JOIN item ON receipt.item_id = item.id
+        ''')
+        receipts = cur.fetchall()
+        cur.close()
     return render_template_string(ADMIN_RECEIPTS_TEMPLATE, receipts=receipts), 200
 
 
@@ -1791,33 +2538,35 @@ def signin():
         if not team_name or not password:
             return render_template_string(SIGNIN_TEMPLATE, error="Team name and password are required."), 400
 
-        conn = get_db_connection()
-
-        cursor = conn.cursor()
-        cursor.execute('SELECT password, ip_address FROM teams WHERE team_name = %s', (team_name,))
-        result = cursor.fetchone()
-
-        if result:
-            stored_password, stored_ip = result
-            if check_password_hash(stored_password, password):
-                if stored_ip and stored_ip != request.remote_addr and team_name != 'ADMIN':
-                    return render_template_string(SIGNIN_TEMPLATE,
-                                                  error="Account is already in use from another device, only 1 account per device (Uses IP tracking) - To fix, please contact ADMIN"), 409
-                session['team_name'] = team_name
-                cursor.execute('UPDATE teams SET ip_address = %s WHERE team_name = %s',
-                               (request.remote_addr, team_name))
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT password, ip_address FROM teams WHERE team_name = %s', (team_name,))
+            result = cursor.fetchone()
+
+            if result:
+                stored_password, stored_ip = result
+                if check_password_hash(stored_password, password):
+                    if stored_ip and stored_ip != request.remote_addr and team_name != 'ADMIN':
+                        return render_template_string(SIGNIN_TEMPLATE,
+                                                      error="Account is already in use from another device, only 1 account per device (Uses IP tracking) - To fix, please contact ADMIN"), 409
+                    session['team_name'] = team_name
+                    cursor.execute('UPDATE teams SET ip_address = %s WHERE team_name = %s',
+                                   (request.remote_addr, team_name))
+                else:
+                    return render_template_string(SIGNIN_TEMPLATE, error="Invalid password."), 401
             else:
-                return render_template_string(SIGNIN_TEMPLATE, error="Invalid password."), 401
-        else:
-            hashed_password = generate_password_hash(password)
-            cursor.execute(
-                'INSERT INTO teams (team_name, password, ip_address, flags_submitted) VALUES (%s, %s, %s, %s)',
-                (team_name, hashed_password, request.remote_addr, ''))
-            session['team_name'] = team_name
+                hashed_password = generate_password_hash(password)
+                cursor.execute(
+                    'INSERT INTO teams (team_name, password, ip_address, flags_submitted) VALUES (%s, %s, %s, %s) '
+                    'RETURNING score, version', (team_name, hashed_password, request.remote_addr, ''))
+                new_team = (team_name, *cursor.fetchone())
+                session['team_name'] = team_name
 
-        conn.commit()
-        cursor.close()
-        conn.close()
+            conn.commit()
+            cursor.close()
+
+        if not result:
+            LEADERBOARD.apply(*new_team)
 
         resp = make_response(redirect(url_for('home')))
         resp.set_cookie('team_name', team_name, secure=True, samesite='Strict')
@@ -1825,81 +2574,74 @@ def signin():
     return render_template_string(SIGNIN_TEMPLATE), 200
 
 
+# Record a solve and add its points in one statement; returns the new score and the row's version, or None if it was
+# already solved
+def score_flag(cursor, team_name: str, challenge: int, points: int):
+    cursor.execute("""
+        WITH solve AS (
+            INSERT INTO solves (team_name, challenge_id, points) VALUES (%s, %s, %s)
+            ON CONFLICT (team_name, challenge_id) DO NOTHING
+            RETURNING team_name, points
+        )
+        UPDATE teams t SET score = t.score + solve.points
+        FROM solve WHERE t.team_name = solve.team_name
+        RETURNING t.score, t.version
+    """, (team_name, challenge, points))
+    return cursor.fetchone()
+
+
 @app.route('/submit', methods=['GET', 'POST'])
 def submit():
     if 'team_name' not in session or request.cookies.get('team_name') != session['team_name']:
         return redirect(url_for('signin'))
-    points = 0
     if request.method == 'POST':
         flag = request.form.get('flag')
         team_name = session.get('team_name')
         if not team_name:
             return redirect(url_for('signin'))
 
-        if flag in [FLAG_1, FLAG_2, FLAG_3, FLAG_4, FLAG_5]:
-            flag_scores = {
-                FLAG_1: FLAG_1_SCORE,
-                FLAG_2: FLAG_2_SCORE,
-                FLAG_3: FLAG_3_SCORE,
-                FLAG_4: FLAG_4_SCORE,
-                FLAG_5: FLAG_5_SCORE
-            }
-            points = round(flag_scores[flag], 2)
-
-        conn = get_db_connection()
-
-        cursor = conn.cursor()
-        cursor.execute('SELECT flags_submitted FROM teams WHERE team_name = %s', (team_name,))
-        result = cursor.fetchone()
-        flags_submitted = result[0].split(',') if result else []
+        if flag not in FLAG_SCORES:
+            return render_template_string(SUBMIT_TEMPLATE, error="Invalid flag."), 400
+        challenge, points = FLAG_SCORES[flag]
 
-        if flag in flags_submitted:
-            return render_template_string(SUBMIT_TEMPLATE, error="Flag already submitted."), 406
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            scored = score_flag(cursor, team_name, challenge, points)
+            if scored is None:
+                return render_template_string(SUBMIT_TEMPLATE, error="Flag already submitted."), 406
 
-        if flag in [FLAG_1, FLAG_2, FLAG_3, FLAG_4, FLAG_5]:
-            flags_submitted.append(flag)
-            cursor.execute('UPDATE teams SET score = score + %s, flags_submitted = %s WHERE team_name = %s',
-                           (round(points, 2), ','.join(flags_submitted), team_name))
             conn.commit()
             cursor.close()
-            conn.close()
-            return render_template_string(SUBMIT_TEMPLATE, success=True, points=round(points, 2)), 200
-        else:
-            return render_template_string(SUBMIT_TEMPLATE, error="Invalid flag."), 400
+        LEADERBOARD.apply(team_name, *scored)
+        return render_template_string(SUBMIT_TEMPLATE, success=True, points=round(points, 2)), 200
     return render_template_string(SUBMIT_TEMPLATE), 200
 
 
 @app.route('/leaderboard')
 def leaderboard():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT team_name, score FROM teams ORDER BY score DESC')
-    teams = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    LEADERBOARD.sync()
+    teams = LEADERBOARD.page(0)
     return render_template_string(LEADERBOARD_TEMPLATE, teams=teams), 200
 
 
 @app.route('/shop')
 def shop():
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute('SELECT * FROM item;')
-    items = cur.fetchall()
-    cur.close()
-    conn.close()
+    with get_db_connection() as conn:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute('SELECT * FROM item;')
+        items = cur.fetchall()
+        cur.close()
     return render_template_string(STORE_TEMPLATE, items=items), 200
 
 
 @app.route('/shop/modify_stock', methods=['GET'])
 @admin_required
 def modify_stock():
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute('SELECT * FROM item;')
-    items = cur.fetchall()
-    cur.close()
-    conn.close()
+    with get_db_connection() as conn:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute('SELECT * FROM item;')
+        items = cur.fetchall()
+        cur.close()
     return render_template_string(MODIFY_STOCKS_TEMPLATE, items=items), 200
 
 
@@ -1917,13 +2659,12 @@ def add_item():
             flash("All fields except description are required!", "error")
             return redirect(url_for('add_item'))
 
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute('INSERT INTO item (name, price, image, description, stock) VALUES (%s, %s, %s, %s, %s);',
-                    (name, float(price), image, description, int(stock)))
-        conn.commit()
-        cur.close()
-        conn.close()
+        with get_db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute('INSERT INTO item (name, price, image, description, stock) VALUES (%s, %s, %s, %s, %s);',
+                        (name, float(price), image, description, int(stock)))
+            conn.commit()
+            cur.close()
 
         flash("Item added successfully!", "error")
         return redirect(url_for('shop'))
@@ -1933,12 +2674,11 @@ def add_item():
 
 @app.route('/shop/missions')
 def missions():
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute('SELECT * FROM missions;')
-    mission = cur.fetchall()
-    cur.close()
-    conn.close()
+    with get_db_connection() as conn:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute('SELECT * FROM missions;')
+        mission = cur.fetchall()
+        cur.close()
     return render_template_string(MISSIONS_TEMPLATE, missions=mission), 200
 
 
@@ -1954,7 +2694,7 @@ def get_model_answer(answer_id):
 
 
 @app.route("/bank", methods=["GET"])
-def home():
+def bank_home():
     uuid_ = request.args.get("uuid")  # Get the UUID from query parameters
 
     if session.get("logged_in"):
@@ -2064,7 +2804,7 @@ def logout():
     # Clear the session
     session.clear()
     # Redirect to home page
-    return redirect(url_for("home"))
+    return redirect(url_for("bank_home"))
 
 
 @app.route("/bank/users", methods=["GET", "POST"])
@@ -2129,13 +2869,12 @@ def weblogin():
             username = request.form.get('username', '')
             password = request.form.get('password', '')
 
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            query = "SELECT * FROM users WHERE username=%s AND password=%s"
-            cursor.execute(query, (username, password))
-            user = cursor.fetchone()
-            cursor.close()
-            conn.close()
+            with get_db_connection() as conn:
+                cursor = conn.cursor()
+                query = "SELECT * FROM users WHERE username=%s AND password=%s"
+                cursor.execute(query, (username, password))
+                user = cursor.fetchone()
+                cursor.close()
 
             if user:
                 return render_template_string(COMP_TEMPLATE, challenge=2, success=True, flag=FLAG_2,
@@ -2259,88 +2998,91 @@ def steganography():
 
 # --------------------------- HTML --------------------------- #
 
+# Next to app.py, so the helper scripts in src/python can import the app from any directory
+HTML_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "src", "html")
+
 try:
     # HTML template for home page
-    with open("src/html/home.html", "r") as f:
+    with open(os.path.join(HTML_DIR, "home.html"), "r") as f:
         HOME_TEMPLATE = f.read()
 
     # HTML template for challenges
-    with open("src/html/competition.html", "r") as f:
+    with open(os.path.join(HTML_DIR, "competition.html"), "r") as f:
         COMP_TEMPLATE = f.read()
 
     # HTML templates for sign-in, submit and leaderboard pages
-    with open("src/html/signin.html", "r") as f:
+    with open(os.path.join(HTML_DIR, "signin.html"), "r") as f:
         SIGNIN_TEMPLATE = f.read()
 
-    with open("src/html/submit.html", "r", encoding="UTF-8") as f:
+    with open(os.path.join(HTML_DIR, "submit.html"), "r", encoding="UTF-8") as f:
         SUBMIT_TEMPLATE = f.read()
 
-    with open("src/html/leaderboard.html", "r") as f:
+    with open(os.path.join(HTML_DIR, "leaderboard.html"), "r") as f:
         LEADERBOARD_TEMPLATE = f.read()
 
     # HTML template for admin page
-    with open("src/html/admin.html", "r") as f:
+    with open(os.path.join(HTML_DIR, "admin.html"), "r") as f:
         ADMIN_TEMPLATE = f.read()
 
-    with open("src/html/airtable.html", "r") as f:
+    with open(os.path.join(HTML_DIR, "airtable.html"), "r") as f:
         AIR_TABLE_TEMPLATE = f.read()
 
     # HTML template for transactions page
-    with open("src/html/transactions.html", "r") as f:
+    with open(os.path.join(HTML_DIR, "transactions.html"), "r") as f:
         TRANSACTIONS_TEMPLATE = f.read()
 
     # Error templates
-    with open("src/html/error/400.html", "r") as f:
+    with open(os.path.join(HTML_DIR, "error", "400.html"), "r") as f:
         ERROR_400_TEMPLATE = f.read()
 
-    with open("src/html/error/403.html", "r") as f:
+    with open(os.path.join(HTML_DIR, "error", "403.html"), "r") as f:
         ERROR_403_TEMPLATE = f.read()
 
-    with open("src/html/error/404.html", "r") as f:
+    with open(os.path.join(HTML_DIR, "error", "404.html"), "r") as f:
         ERROR_404_TEMPLATE = f.read()
 
-    with open("src/html/error/405.html", "r") as f:
+    with open(os.path.join(HTML_DIR, "error", "405.html"), "r") as f:
         ERROR_405_TEMPLATE = f.read()
 
-    with open("src/html/error/429.html", "r") as f:
+    with open(os.path.join(HTML_DIR, "error", "429.html"), "r") as f:
         ERROR_429_TEMPLATE = f.read()
 
-    with open("src/html/error/500.html", "r") as f:
+    with open(os.path.join(HTML_DIR, "error", "500.html"), "r") as f:
         ERROR_500_TEMPLATE = f.read()
 
     # Shop templates
-    with open("src/html/add_item.html", "r") as f:
+    with open(os.path.join(HTML_DIR, "add_item.html"), "r") as f:
         ADD_ITEM_TEMPLATE = f.read()
 
-    with open("src/html/add_mission.html", "r") as f:
+    with open(os.path.join(HTML_DIR, "add_mission.html"), "r") as f:
         ADD_MISSION_TEMPLATE = f.read()
 
-    with open("src/html/admin.receipts.html", "r") as f:
+    with open(os.path.join(HTML_DIR, "admin.receipts.html"), "r") as f:
         ADMIN_RECEIPTS_TEMPLATE = f.read()
 
-    with open("src/html/missions.html", "r") as f:
+    with open(os.path.join(HTML_DIR, "missions.html"), "r") as f:
         MISSIONS_TEMPLATE = f.read()
 
-    with open("src/html/modify_stock.html", "r") as f:
+    with open(os.path.join(HTML_DIR, "modify_stock.html"), "r") as f:
         MODIFY_STOCKS_TEMPLATE = f.read()
 
-    with open("src/html/store.html", "r") as f:
+    with open(os.path.join(HTML_DIR, "store.html"), "r") as f:
         STORE_TEMPLATE = f.read()
 
     # Model Answers templates
-    with open("src/html/model_answers/1.html", "r") as f:
+    with open(os.path.join(HTML_DIR, "model_answers", "1.html"), "r") as f:
         MODEL_ANSWER_1_TEMPLATE = f.read()
 
-    with open("src/html/model_answers/2.html", "r") as f:
+    with open(os.path.join(HTML_DIR, "model_answers", "2.html"), "r") as f:
         MODEL_ANSWER_2_TEMPLATE = f.read()
 
-    with open("src/html/model_answers/3.html", "r") as f:
+    with open(os.path.join(HTML_DIR, "model_answers", "3.html"), "r") as f:
         MODEL_ANSWER_3_TEMPLATE = f.read()
 
-    with open("src/html/model_answers/4.html", "r") as f:
+    with open(os.path.join(HTML_DIR, "model_answers", "4.html"), "r") as f:
         MODEL_ANSWER_4_TEMPLATE = f.read()
 
-    with open("src/html/model_answers/5.html", "r") as f:
+    with open(os.path.join(HTML_DIR, "model_answers", "5.html"), "r") as f:
         MODEL_ANSWER_5_TEMPLATE = f.read()
 
     MODEL_ANSWERS = [MODEL_ANSWER_1_TEMPLATE, MODEL_ANSWER_2_TEMPLATE, MODEL_ANSWER_3_TEMPLATE, MODEL_ANSWER_4_TEMPLATE,
@@ -2360,6 +3102,7 @@ if __name__ == "__main__":
             with conn_main.cursor() as cur_main:
                 cur_main.execute("SELECT 1")
         create_tables()
+        DB_POOL.fill()
         print("Database connection successful")
 
         # Run with Waitress
@@ -0,0 +1,86 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from functools import wraps
+
+from flask import request, abort
+
+# Run from anywhere, the limiter lives in app.py two directories up
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+import app  # noqa: E402
+
+
+# The decorator as it was before, for comparison: per-decorator dict of timestamp lists
+def legacy_rate_limit(limit: int, time_window: int = 3600):
+    request_store = {}
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            user_ip = request.remote_addr
+            current_time = time.time()
+            if user_ip not in request_store:
+                request_store[user_ip] = []
+            valid_timestamps = [ts for ts in request_store[user_ip] if current_time - ts <= time_window]
+            request_store[user_ip] = valid_timestamps
+            if len(valid_timestamps) >= limit:
+                abort(429, description="Rate limit exceeded. Try again later.")
+            request_store[user_ip].append(current_time)
+            return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def view():
+    return "ok"
+
+
+def measure(func, ips: list) -> float:
+    # One request context, only the client address changes between calls. Werkzeug reads remote_addr from the
+    # environ once when the request is built, so set it on the request itself.
+    with app.app.test_request_context("/"):
+        start = time.perf_counter()
+        for ip in ips:
+            request.remote_addr = ip
+            func()
+        return (time.perf_counter() - start) / len(ips)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-request overhead of the rate limit decorator")
+    parser.add_argument("--ips", type=int, default=10000, help="Distinct client IPs")
+    parser.add_argument("--requests", type=int, default=200000)
+    args = parser.parse_args()
+
+    pool = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(args.ips)]
+    ips = [random.choice(pool) for _ in range(args.requests)]
+    # High enough that nothing is rejected, so every variant does the same work
+    limit = args.requests
+
+    baseline = measure(view, ips)
+    print(f"{args.requests} requests from {args.ips} IPs, undecorated view: {baseline * 10 ** 6:.2f}us/request")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stores = [
+            ("legacy list", None),
+            ("memory", app.MemoryRateStore(app.RATE_LIMIT_MAX_KEYS)),
+            ("sqlite", app.SQLiteRateStore(os.path.join(tmp, "rate_limits.db"))),
+        ]
+        for name, store in stores:
+            if store is None:
+                func = legacy_rate_limit(limit)(view)
+            else:
+                app.RATE_LIMITER = store  # The decorator looks the store up on every request
+                func = app.rate_limit(limit)(view)
+            per_request = measure(func, ips)
+            print(f"{name:<12} {per_request * 10 ** 6:8.2f}us/request  "
+                  f"(+{(per_request - baseline) * 10 ** 6:.2f}us decorator overhead)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+import argparse
+import os
+import sys
+
+# Run from anywhere (e.g. cron), the reconciliation lives in app.py two directories up
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from app import reconcile_rollups  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify the bank dashboard rollups against the raw tables")
+    parser.add_argument("--hours", type=int, help="Only check hourly rollups this recent (default: all)")
+    parser.add_argument("--repair", action="store_true", help="Rewrite rollups that do not match")
+    args = parser.parse_args()
+
+    result = reconcile_rollups(repair=args.repair, hours=args.hours)
+    for mismatch in result["hourly_mismatches"]:
+        print(f"{mismatch['hour']} {mismatch['type']}: logs {mismatch['logs']}, rollup {mismatch['rollup']}")
+    if result["totals"]["logs"] != result["totals"]["rollup"]:
+        print(f"Totals: logs {result['totals']['logs']}, rollup {result['totals']['rollup']}")
+
+    if result["consistent"]:
+        print("Rollups match the logs")
+    else:
+        print("Rollups repaired" if result["repaired"] else "Rollups do NOT match the logs (run with --repair)")
+        sys.exit(0 if result["repaired"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+from flask import Flask
+
+# Run from anywhere, the matcher lives in app.py two directories up
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from app import RouteMatcher  # noqa: E402
+
+DOMAIN = "scrapyard-bounty.vercel.app"
+
+
+def build_app(routes: int) -> Flask:
+    # A mix of static and parameterised rules, like the real API
+    bench = Flask(__name__)
+    for i in range(routes):
+        rule = f"/api/section{i % 20}/route{i}" + ("/<int:item_id>" if i % 3 == 0 else "")
+        bench.add_url_rule(rule, f"route{i}", lambda **kwargs: "ok")
+    return bench
+
+
+# The whitelist check as it was before: rebuild every pattern and try them one by one on each call
+def legacy_allowed(bench: Flask, url: str) -> bool:
+    allowed = []
+    for rule in bench.url_map.iter_rules():
+        allowed.append(re.sub(r'<[^>]+>', r'[^/]+', DOMAIN + str(rule)))
+    return any(re.fullmatch(pattern, url) for pattern in allowed)
+
+
+def measure(check, urls: list) -> float:
+    start = time.perf_counter()
+    for url in urls:
+        check(url)
+    return (time.perf_counter() - start) / len(urls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cost of the /retry whitelist check, old scan vs compiled matcher")
+    parser.add_argument("--routes", type=int, default=200)
+    parser.add_argument("--checks", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0, help="Seed for picking the checked URLs")
+    args = parser.parse_args()
+
+    bench = build_app(args.routes)
+    matcher = RouteMatcher(bench.url_map, DOMAIN)
+    rules = [str(rule) for rule in bench.url_map.iter_rules()]
+    # Half allowed URLs (anywhere in the rule list), half rejected ones which have to try every rule. Rejected URLs
+    # alternate between unknown paths and real routes with an extra segment, which match up to the last character.
+    random.seed(args.seed)
+    allowed = [DOMAIN + re.sub(r'<[^>]+>', "42", random.choice(rules)) for _ in range(args.checks)]
+    urls = [allowed[i] if i % 2 else f"{DOMAIN}/nope/{i}" if i % 4 else f"{allowed[i]}/extra"
+            for i in range(args.checks)]
+    assert all(legacy_allowed(bench, url) == matcher.match(url) for url in urls[:2000]), "Matchers disagree"
+
+    legacy = measure(lambda url: legacy_allowed(bench, url), urls)
+    compiled = measure(matcher.match, urls)
+    print(f"{len(rules)} rules, {args.checks} checks")
+    print(f"old scan         {legacy * 10 ** 6:9.2f}us/check")
+    print(f"compiled matcher {compiled * 10 ** 6:9.2f}us/check  ({legacy / compiled:.0f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
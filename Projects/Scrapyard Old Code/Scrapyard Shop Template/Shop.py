@@ -1,11 +1,15 @@
 import os
+import queue
 import re
+import sqlite3
+import threading
 import time
 import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 from functools import wraps
 from io import BytesIO
-from typing import List
 
 import psycopg2
 import requests
@@ -35,6 +39,26 @@ DB_URL_AIVEN = os.getenv("DB_URL_AIVEN")
 DB_NAME = os.getenv("DB_NAME")
 DOMAIN_NAME = "scrapyard-shop.vercel.app"  # Change me
 
+RECEIPT_WORKERS = int(os.getenv("RECEIPT_WORKERS", 4))  # Threads drawing and encoding receipts
+RECEIPT_RENDER_TIMEOUT = float(os.getenv("RECEIPT_RENDER_TIMEOUT", 15))  # Seconds a purchase waits for its receipt
+RECEIPT_IMAGE_TIMEOUT = float(os.getenv("RECEIPT_IMAGE_TIMEOUT", 3))  # Seconds to fetch an item image
+RECEIPT_IMAGE_REVALIDATE = float(os.getenv("RECEIPT_IMAGE_REVALIDATE", 300))  # Seconds before checking the ETag
+RECEIPT_THUMBNAIL_CACHE_SIZE = int(os.getenv("RECEIPT_THUMBNAIL_CACHE_SIZE", 256))  # Item thumbnails kept in memory
+RECEIPT_IMAGE_FAILURE_TTL = float(os.getenv("RECEIPT_IMAGE_FAILURE_TTL", 30))  # Seconds a failed image is not retried
+RECEIPT_IMAGE_FETCHERS = int(os.getenv("RECEIPT_IMAGE_FETCHERS", 2))  # Threads downloading item images
+
+PURCHASE_BATCH_SIZE = int(os.getenv("PURCHASE_BATCH_SIZE", 100))  # Most purchases committed in one transaction
+PURCHASE_COMMIT_WINDOW = float(os.getenv("PURCHASE_COMMIT_WINDOW", 0))  # Seconds to wait for more purchases per commit
+PURCHASE_TIMEOUT = float(os.getenv("PURCHASE_TIMEOUT", 10))  # Seconds a purchase waits for its commit
+STOCK_CACHE_TTL = float(os.getenv("STOCK_CACHE_TTL", 2))  # Seconds a sold out item is refused without asking the DB, 0 disables
+
+RETRY_TIMEOUT = float(os.getenv("RETRY_TIMEOUT", 5))  # Seconds /retry waits for the retried URL
+RETRY_CACHE_TTL = float(os.getenv("RETRY_CACHE_TTL", 10))  # Seconds a /retry result is reused
+RETRY_CACHE_SIZE = int(os.getenv("RETRY_CACHE_SIZE", 256))  # Retried URLs kept in the cache
+
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB")  # SQLite file shared by all workers, in-process only if unset
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", 100000))  # In-process store evicts beyond this
+
 
 # ------------------------- DATABASE ------------------------- #
 
@@ -60,29 +84,106 @@ def admin_required(param: callable):
     return wrap
 
 
+# ---------------------- RATE LIMITING ----------------------- #
+
+# Sliding window counter: this window's hits plus last window's, weighted by how much of it still overlaps
+# state is (window_start, current, previous, ...) or None, returns (allowed, new state)
+def slide_window(state: tuple, limit: int, window: float, now: float) -> tuple:
+    start = now - now % window
+    if state is None or state[0] < start - window:
+        current, previous = 0, 0
+    elif state[0] < start:
+        current, previous = 0, state[1]
+    else:
+        current, previous = state[1], state[2]
+    if previous * (1 - (now - start) / window) + current >= limit:
+        return False, (start, current, previous)
+    return True, (start, current + 1, previous)
+
+
+# Rate limit state for a single process, least recently hit keys are evicted first
+class MemoryRateStore:
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._windows = OrderedDict()  # key -> (window_start, current, previous, expires)
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, limit: int, window: float, now: float = None) -> bool:
+        now = time.time() if now is None else now
+        with self._lock:
+            # A key idle for two windows has nothing left to count
+            while self._windows and (len(self._windows) >= self.max_keys
+                                     or next(iter(self._windows.values()))[3] <= now):
+                self._windows.popitem(last=False)
+            allowed, state = slide_window(self._windows.pop(key, None), limit, window, now)
+            self._windows[key] = (*state, state[0] + 2 * window)
+        return allowed
+
+    def __len__(self):
+        return len(self._windows)
+
+
+# Rate limit state in a local SQLite file, shared by every worker process on the machine
+class SQLiteRateStore:
+    def __init__(self, path: str, sweep_every: int = 1000):
+        self.path = path
+        self.sweep_every = sweep_every  # Delete expired keys once per this many hits
+        self._local = threading.local()
+        self._hits = 0
+        self._connection().execute("""
+            CREATE TABLE IF NOT EXISTS rate_limits (
+                key TEXT PRIMARY KEY,
+                window_start REAL NOT NULL,
+                current INTEGER NOT NULL,
+                previous INTEGER NOT NULL,
+                expires REAL NOT NULL
+            )
+        """)
+        self._connection().execute("CREATE INDEX IF NOT EXISTS rate_limits_expires ON rate_limits (expires)")
+
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def hit(self, key: str, limit: int, window: float, now: float = None) -> bool:
+        now = time.time() if now is None else now
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")  # Take the write lock up front, so the read-modify-write is atomic
+        try:
+            row = db.execute("SELECT window_start, current, previous FROM rate_limits WHERE key = ?",
+                             (key,)).fetchone()
+            allowed, state = slide_window(row, limit, window, now)
+            db.execute("INSERT OR REPLACE INTO rate_limits VALUES (?, ?, ?, ?, ?)",
+                       (key, *state, state[0] + 2 * window))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        self._hits += 1
+        if self._hits % self.sweep_every == 0:
+            db.execute("DELETE FROM rate_limits WHERE expires <= ?", (now,))
+        return allowed
+
+    def __len__(self):
+        return self._connection().execute("SELECT count(*) FROM rate_limits").fetchone()[0]
+
+
+RATE_LIMITER = SQLiteRateStore(RATE_LIMIT_DB) if RATE_LIMIT_DB else MemoryRateStore(RATE_LIMIT_MAX_KEYS)
+
+
 # Decorator to rate limit the user - Advised not to use with @admin_required
 def rate_limit(limit: int, time_window: int = 3600):
-    # Create an independent store for each decorator instance
-    request_store = {}
-
     def decorator(func):
         @wraps(func)  # Preserve the original function metadata
         def wrapper(*args, **kwargs):
-            user_ip = request.remote_addr
-            current_time = time.time()
-
-            # Ensure user IP is in the request store
-            if user_ip not in request_store:
-                request_store[user_ip] = []
-
-            timestamps = request_store[user_ip]
-            valid_timestamps = [ts for ts in timestamps if current_time - ts <= time_window]
-            request_store[user_ip] = valid_timestamps
-
-            if len(valid_timestamps) >= limit:
+            # Keyed by route too, so each decorated route keeps an independent limit
+            if not RATE_LIMITER.hit(f"{func.__name__}:{request.remote_addr}", limit, time_window):
                 abort(429, description="Rate limit exceeded. Try again later.")
-
-            request_store[user_ip].append(current_time)
             return func(*args, **kwargs)
 
         return wrapper
@@ -90,6 +191,152 @@ def rate_limit(limit: int, time_window: int = 3600):
     return decorator
 
 
+# ------------------------- PURCHASES ------------------------- #
+
+# Take one unit of stock and write the receipt in a single statement, None if the item is sold out (or unknown)
+def reserve_item(cursor, item_id: int, user_email: str):
+    cursor.execute("""
+        WITH reserved AS (
+            UPDATE item SET stock = stock - 1
+            WHERE id = %s AND stock > 0
+            RETURNING id, name, price, image, stock
+        ), new_receipt AS (
+            INSERT INTO receipt (user_email, item_id)
+            SELECT %s, id FROM reserved
+        )
+        SELECT name, price, image, stock FROM reserved
+    """, (item_id, user_email))
+    return cursor.fetchone()
+
+
+# Last known stock per item, so a sold out item can be refused without a database round trip
+class StockCounter:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._stock = {}  # item id -> (stock, seen at)
+
+    def sold_out(self, item_id: int) -> bool:
+        entry = self._stock.get(item_id)
+        return entry is not None and entry[0] <= 0 and time.monotonic() - entry[1] < self.ttl
+
+    def update(self, item_id: int, stock: int):
+        if self.ttl > 0:
+            self._stock[item_id] = (stock, time.monotonic())
+
+    def forget(self, item_id: int):
+        self._stock.pop(item_id, None)
+
+
+# Queued purchases are reserved by one writer thread and committed together, one commit per batch instead of per buyer
+class PurchaseWriter:
+    def __init__(self, max_batch: int, window: float):
+        self.max_batch = max_batch
+        self.window = window
+        self.commits = 0
+        self.purchases = 0
+        self._queue = queue.Queue()
+        self._conn = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._claim_lock = threading.Lock()  # Decides between a timed out buyer and the writer, for each purchase
+
+    def _start(self):
+        # Started on the first purchase, importing the app should not open connections
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="purchase-writer", daemon=True)
+                self._thread.start()
+
+    def buy(self, user_email: str, item_id: int, timeout: float = PURCHASE_TIMEOUT):
+        self._start()
+        purchase = {"user_email": user_email, "item_id": item_id, "item": None, "error": None,
+                    "state": "queued", "done": threading.Event()}
+        self._queue.put(purchase)
+        if not purchase["done"].wait(timeout):
+            with self._claim_lock:
+                if purchase["state"] == "queued":
+                    # Still waiting for the writer, which skips it now, so retrying cannot buy the item twice
+                    purchase["state"] = "cancelled"
+                    raise TimeoutError("Purchase was not committed in time")
+            # Already in a commit, its outcome is only known once that finishes
+            purchase["done"].wait()
+        if purchase["error"]:
+            raise purchase["error"]
+        return purchase["item"]
+
+    def _next_batch(self) -> list:
+        # Whatever queued up while the last batch was committing goes into the next one
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)) if self.window
+                             else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _claim(self, batch: list) -> list:
+        # Purchases whose buyer gave up are dropped, the rest can no longer be cancelled
+        with self._claim_lock:
+            batch = [purchase for purchase in batch if purchase["state"] == "queued"]
+            for purchase in batch:
+                purchase["state"] = "claimed"
+        return batch
+
+    def _commit(self, batch: list):
+        if self._conn is None or self._conn.closed:
+            self._conn = get_db_connection()
+        try:
+            with self._conn.cursor(cursor_factory=RealDictCursor) as cur:
+                for purchase in batch:
+                    # A purchase the database refuses (e.g. a bad email) is undone alone, the rest still commit
+                    cur.execute("SAVEPOINT purchase")
+                    try:
+                        purchase["item"] = reserve_item(cur, purchase["item_id"], purchase["user_email"])
+                    except DatabaseError as e:
+                        cur.execute("ROLLBACK TO SAVEPOINT purchase")
+                        purchase["error"] = e
+                    else:
+                        cur.execute("RELEASE SAVEPOINT purchase")
+            self._conn.commit()
+        except Exception:
+            for purchase in batch:
+                purchase["item"] = None
+            self._conn.close()
+            raise
+        self.commits += 1
+        self.purchases += sum(purchase["error"] is None for purchase in batch)
+
+    def _run(self):
+        while True:
+            batch = self._claim(self._next_batch())
+            if not batch:
+                continue
+            try:
+                self._commit(batch)
+            except Exception as e:
+                print(f"Error committing purchases: {e}")
+                for purchase in batch:
+                    purchase["error"] = e
+            for purchase in batch:
+                if purchase["error"] is None:
+                    item = purchase["item"]
+                    STOCK.update(purchase["item_id"], item["stock"] if item else 0)
+                purchase["done"].set()
+
+
+STOCK = StockCounter(STOCK_CACHE_TTL)
+PURCHASES = PurchaseWriter(PURCHASE_BATCH_SIZE, PURCHASE_COMMIT_WINDOW)
+
+
+# Buy one unit of an item, returns the item (name, price, image, stock left) or None when it is sold out
+def purchase_item(user_email: str, item_id: int):
+    if STOCK.sold_out(item_id):
+        return None
+    return PURCHASES.buy(user_email, item_id)
+
+
 # --------------------------- APIs ---------------------------- #
 # ------------------------ Standalone --------------------------#
 
@@ -144,34 +391,39 @@ def buy():
     item_id = request.form.get('item_id')
     user_email = request.form.get('email')
 
-    if not item_id or not user_email:
+    if not item_id or not user_email or not item_id.isdigit():
         flash("Invalid input! Make sure all fields are filled.", "error")
         return redirect(url_for('shop'))
+    # receipt.user_email is VARCHAR(255), refused here rather than by the database in the middle of a batch
+    if len(user_email) > 255:
+        flash("Invalid input! The email is too long.", "error")
+        return redirect(url_for('shop'))
 
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute('SELECT * FROM item WHERE id = %s;', (item_id,))
-    item = cur.fetchone()
-
-    if item and item["stock"] > 0:
-        cur.execute('INSERT INTO receipt (user_email, item_id) VALUES (%s, %s);', (user_email, item_id))
-        conn.commit()
+    try:
+        item = purchase_item(user_email, int(item_id))
+    except Exception as e:
+        print(f"Error processing purchase: {e}")
+        abort(500, description="Purchase failed, please try again")
 
+    if item:
         # Fetch the image URL (stored in the `image` column of the database)
         item_image_url = item['image']  # Assuming this is the URL of the image
 
         # Generate receipt image and return as a downloadable file
-        receipt_image_io = generate_receipt_image(user_email, item['name'], item['price'], item_image_url)
+        try:
+            receipt_image_io = render_receipt(user_email, item['name'], item['price'], item_image_url)
+        except Exception as e:
+            # The purchase is already committed, so say so instead of inviting the buyer to pay again
+            print(f"Error rendering receipt: {e}")
+            flash(f"Bought {item['name']}! Your receipt could not be generated, but the purchase went through.",
+                  "success")
+            return redirect(url_for('shop'))
 
         # Return the image directly as a downloadable file without saving it
         return send_file(receipt_image_io, mimetype='image/png', as_attachment=True,
                          download_name=f"receipt_{str(uuid.uuid4())[:8]}.png")
 
-    else:
-        flash('Item out of stock!', 'error')
-
-    cur.close()
-    conn.close()
+    flash('Item out of stock!', 'error')
     return redirect(url_for('shop'))
 
 
@@ -182,13 +434,17 @@ def update_stock():
     cur = conn.cursor()
 
     # Iterate through all posted stock values
+    updated = []
     for key, value in request.form.items():
         if key.startswith("stock_"):  # The key will be in the form of 'stock_<item_id>'
             item_id = key.split("_")[1]
             new_stock = int(value)
             cur.execute('UPDATE item SET stock = %s WHERE id = %s;', (new_stock, item_id))
+            updated.append(int(item_id))
 
     conn.commit()
+    for item_id in updated:
+        STOCK.forget(item_id)  # Restocked items go back on sale here immediately
     cur.close()
     conn.close()
     flash("Stock updated successfully!", "success")
@@ -202,8 +458,17 @@ def cancel_receipt():
 
     conn = get_db_connection()
     cur = conn.cursor()
-    cur.execute('DELETE FROM receipt WHERE id = %s;', (receipt_id,))
+    # Put the unit back on sale along with removing the receipt
+    cur.execute("""
+        WITH cancelled AS (
+            DELETE FROM receipt WHERE id = %s RETURNING item_id
+        )
+        UPDATE item SET stock = stock + 1 FROM cancelled WHERE item.id = cancelled.item_id RETURNING item.id;
+    """, (receipt_id,))
+    restocked = cur.fetchone()
     conn.commit()
+    if restocked:
+        STOCK.forget(restocked[0])
     flash("Receipt cancelled!", "success")
 
     cur.close()
@@ -274,7 +539,7 @@ def retry(url_to_check: str):
         sanitized_url = re.sub(r'^(https?://)?(www\.)?', '', url_to_check)
 
         # Prevent SSRF by checking if the URL is in the whitelist
-        if not any(re.fullmatch(pattern, sanitized_url) for pattern in allowed_urls()):
+        if not ALLOWED_URLS.match(sanitized_url):
             return jsonify({
                 "error_code": "URL_NOT_ALLOWED",
                 "error_message": "URL not in whitelist. Contact the developer if this is unexpected.",
@@ -289,16 +554,21 @@ def retry(url_to_check: str):
                 "status_code": 400
             }), 400
 
-        # Attempt the request
-        response = requests.get(url_to_check)
+        # Attempt the request, or reuse the result of a retry from the last few seconds
+        result = RETRY_CACHE.get(url_to_check)
+        if result is None:
+            response = RETRY_SESSION.get(url_to_check, timeout=RETRY_TIMEOUT)
+            result = (response.status_code, response.text[:250])  # Limit response to prevent excessive logging
+            RETRY_CACHE.put(url_to_check, result)
+        status_code, response_text = result
 
         # Return a structured JSON response
         return jsonify({
-            "message": "Retry successful" if response.status_code == 200 else "Retry failed",
+            "message": "Retry successful" if status_code == 200 else "Retry failed",
             "retried_url": url_to_check,
-            "status_code": response.status_code,
-            "response_text": response.text[:250]  # Limit response to prevent excessive logging
-        }), response.status_code
+            "status_code": status_code,
+            "response_text": response_text
+        }), status_code
 
     except requests.exceptions.ConnectionError:
         return jsonify({
@@ -329,18 +599,191 @@ def retry(url_to_check: str):
         }), 500
 
 
-def allowed_urls() -> List[str]:
-    allowed = []
-    for rule in app.url_map.iter_rules():
-        url = DOMAIN_NAME + str(rule)
-        # Convert Flask URL rules to regex patterns
-        url_pattern = re.sub(r'<[^>]+>', r'[^/]+', url)
-        allowed.append(url_pattern)
-    return allowed
+# Every route of this app as one compiled pattern, rebuilt only after a rule is added
+class RouteMatcher:
+    def __init__(self, url_map, domain: str):
+        self.domain = domain
+        self._url_map = url_map
+        self._pattern = None
+        self._lock = threading.Lock()
+
+        # Flask registers every rule through Map.add, so a new route just drops the compiled pattern
+        add = url_map.add
+
+        def add_rule(rule_factory):
+            add(rule_factory)
+            self._pattern = None
+
+        url_map.add = add_rule
+
+    def _compile(self) -> re.Pattern:
+        with self._lock:
+            if self._pattern is None:
+                # Convert Flask URL rules to regex patterns, a variable matches one path segment
+                routes = sorted({"[^/]+".join(re.escape(part) for part in re.split(r'<[^>]+>', rule.rule))
+                                 for rule in self._url_map.iter_rules()})
+                self._pattern = re.compile(f"{re.escape(self.domain)}(?:{'|'.join(routes)})")
+            return self._pattern
+
+    def match(self, url: str) -> bool:
+        pattern = self._pattern or self._compile()
+        return pattern.fullmatch(url) is not None
+
+
+# Recent /retry results by URL, expired ones are dropped when looked up and the oldest when full
+class ResponseCache:
+    def __init__(self, ttl: float, max_items: int):
+        self.ttl = ttl
+        self.max_items = max_items
+        self._items = OrderedDict()  # url -> (expires at, result)
+        self._lock = threading.Lock()
+
+    def get(self, url: str):
+        with self._lock:
+            entry = self._items.get(url)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._items[url]
+                return None
+            return entry[1]
+
+    def put(self, url: str, result):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._items[url] = (time.monotonic() + self.ttl, result)
+            self._items.move_to_end(url)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+
+ALLOWED_URLS = RouteMatcher(app.url_map, DOMAIN_NAME)
+RETRY_CACHE = ResponseCache(RETRY_CACHE_TTL, RETRY_CACHE_SIZE)
+RETRY_SESSION = requests.Session()  # Keeps connections to retried hosts open between calls
+
+
+# ------------------------- RECEIPTS ------------------------- #
+
+# Loaded once, trying the font on every receipt meant a failed file lookup per purchase
+def load_receipt_font() -> ImageFont.ImageFont:
+    try:
+        return ImageFont.truetype("arial.ttf", 20)  # Change if missing
+    except IOError:
+        return ImageFont.load_default()
+
+
+RECEIPT_FONT = load_receipt_font()
+
+
+# Decoded 100x100 item thumbnails, least recently used dropped first; entries are revalidated with their ETag
+class ThumbnailCache:
+    def __init__(self, max_items: int, timeout: float, revalidate_after: float, failure_ttl: float):
+        self.max_items = max_items
+        self.timeout = timeout
+        self.revalidate_after = revalidate_after
+        self.failure_ttl = failure_ttl
+        self._items = OrderedDict()  # url -> (etag, checked at, thumbnail)
+        self._failures = {}  # url -> (failed at, error), so a dead image host is not asked again on every receipt
+        self._fetches = {}  # url -> Future of the download in progress, shared by everyone asking for that url
+        self._lock = threading.Lock()
+        self._session = requests.Session()  # Keeps connections to image hosts open between receipts
+
+    def _cached(self, url: str):
+        with self._lock:
+            entry = self._items.get(url)
+            if entry:
+                self._items.move_to_end(url)
+            return entry
+
+    def _store(self, url: str, etag, thumbnail: Image.Image):
+        with self._lock:
+            self._items[url] = (etag, time.monotonic(), thumbnail)
+            self._items.move_to_end(url)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def _fetch(self, url: str, entry) -> Image.Image:
+        # Ask the image host whether our copy is still current, only a changed image is downloaded and decoded again
+        headers = {"If-None-Match": entry[0]} if entry and entry[0] else {}
+        response = self._session.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and entry:
+            self._store(url, entry[0], entry[2])
+            return entry[2]
+        if response.status_code != 200:
+            raise Exception(f"Failed to fetch image: {response.status_code}")
+
+        thumbnail = Image.open(BytesIO(response.content))  # Load image from the URL content
+        thumbnail = thumbnail.convert("RGBA").resize((100, 100))
+        self._store(url, response.headers.get("ETag"), thumbnail)
+        return thumbnail
+
+    def get(self, url: str) -> Image.Image:
+        entry = self._cached(url)
+        if entry and time.monotonic() - entry[1] < self.revalidate_after:
+            return entry[2]
+
+        with self._lock:
+            failure = self._failures.get(url)
+            if failure and time.monotonic() - failure[0] < self.failure_ttl:
+                raise failure[1]
+            fetch = self._fetches.get(url)
+            owner = fetch is None
+            if owner:
+                fetch = self._fetches[url] = Future()
+
+        # Someone else is already downloading this url, wait for their result instead of downloading it again
+        if not owner:
+            return fetch.result(timeout=self.timeout * 2)
+
+        try:
+            thumbnail = self._fetch(url, entry)
+        except Exception as e:
+            with self._lock:
+                self._failures[url] = (time.monotonic(), e)
+                del self._fetches[url]
+            fetch.set_exception(e)
+            raise
+        with self._lock:
+            self._failures.pop(url, None)
+            del self._fetches[url]
+        fetch.set_result(thumbnail)
+        return thumbnail
+
+    def peek(self, url: str):
+        # The thumbnail if we have one, without waiting on the image host; a missing or stale one is fetched in the
+        # background for the next receipt
+        entry = self._cached(url)
+        if not entry or time.monotonic() - entry[1] >= self.revalidate_after:
+            self.prefetch(url)
+        return entry[2] if entry else None
+
+    def prefetch(self, url: str):
+        # Warm the cache in the background, e.g. as soon as an item is added
+        with self._lock:
+            failure = self._failures.get(url)
+            if url in self._fetches or (failure and time.monotonic() - failure[0] < self.failure_ttl):
+                return
+
+        def fetch():
+            try:
+                self.get(url)
+            except Exception as e:
+                print(f"Error prefetching item image: {e}")
+
+        THUMBNAIL_EXECUTOR.submit(fetch)
+
+
+THUMBNAILS = ThumbnailCache(RECEIPT_THUMBNAIL_CACHE_SIZE, RECEIPT_IMAGE_TIMEOUT, RECEIPT_IMAGE_REVALIDATE,
+                            RECEIPT_IMAGE_FAILURE_TTL)
+# Thumbnails are downloaded here, so a slow image host never holds up a receipt worker
+THUMBNAIL_EXECUTOR = ThreadPoolExecutor(max_workers=RECEIPT_IMAGE_FETCHERS, thread_name_prefix="thumbnail")
+# Receipts are drawn and encoded here, off the request threads and without holding a database connection
+RECEIPT_EXECUTOR = ThreadPoolExecutor(max_workers=RECEIPT_WORKERS, thread_name_prefix="receipt")
 
 
 # Modify the receipt generation to return the receipt image in-memory
-def generate_receipt_image(user_email, item_name, item_price, item_image_url):
+def generate_receipt_image(user_email: str, item_name: str, item_price, item_image_url: str) -> BytesIO:
     receipt_id = str(uuid.uuid4())[:8]  # Shortened UUID
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
@@ -348,35 +791,30 @@ def generate_receipt_image(user_email, item_name, item_price, item_image_url):
     img = Image.new("RGB", (400, 400), "white")
     draw = ImageDraw.Draw(img)
 
-    try:
-        font = ImageFont.truetype("arial.ttf", 20)  # Change if missing
-    except IOError:
-        font = ImageFont.load_default()
-
     # Receipt text
     text = f"Receipt ID: {receipt_id}\nUser: {user_email}\nItem: {item_name}\nPrice: {item_price} scraps\nDate: {timestamp}"
-    draw.text((20, 20), text, fill="black", font=font)
+    draw.text((20, 20), text, fill="black", font=RECEIPT_FONT)
 
-    # Fetch the image from the URL
-    try:
-        response = requests.get(item_image_url)
-        if response.status_code == 200:
-            item_image = Image.open(BytesIO(response.content))  # Load image from the URL content
-            item_image = item_image.resize((100, 100))  # Resize if necessary
-            img.paste(item_image, (20, 150))  # Paste the image onto the receipt
-        else:
-            raise Exception(f"Failed to fetch image: {response.status_code}")
-    except Exception as e:
-        print(f"Error loading item image: {e}")
+    # Item thumbnail from the cache, a receipt is never held up downloading one; without it the receipt goes out
+    # bare while it is fetched for the next one
+    thumbnail = THUMBNAILS.peek(item_image_url)
+    if thumbnail is not None:
+        img.paste(thumbnail, (20, 150), thumbnail)  # Paste the image onto the receipt, keeping transparency
 
-    # Generate the image in memory
+    # Generate the image in memory, a receipt is mostly white so light compression is plenty
     img_io = BytesIO()
-    img.save(img_io, 'PNG')
+    img.save(img_io, 'PNG', compress_level=1)
     img_io.seek(0)
 
     return img_io
 
 
+# Render a receipt on the receipt workers and wait for it
+def render_receipt(user_email: str, item_name: str, item_price, item_image_url: str) -> BytesIO:
+    return RECEIPT_EXECUTOR.submit(generate_receipt_image, user_email, item_name, item_price,
+                                   item_image_url).result(timeout=RECEIPT_RENDER_TIMEOUT)
+
+
 # ---------------------- ERROR HANDLERS --------------------- #
 
 @app.errorhandler(400)
@@ -542,6 +980,9 @@ def add_item():
         cur.close()
         conn.close()
 
+        # Have the thumbnail ready before the first purchase
+        THUMBNAILS.prefetch(image)
+
         flash("Item added successfully!", "error")
         return redirect(url_for('shop'))
 
@@ -0,0 +1,105 @@
+import argparse
+import hashlib
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from io import BytesIO
+
+import requests
+from PIL import Image, ImageDraw, ImageFont
+
+import Shop
+
+
+# Serves one item image with an ETag, like a CDN would
+def start_image_server(size: int) -> ThreadingHTTPServer:
+    image = Image.new("RGB", (size, size), "orange")
+    ImageDraw.Draw(image).ellipse((size // 4, size // 4, size * 3 // 4, size * 3 // 4), fill="navy")
+    body = BytesIO()
+    image.save(body, "PNG")
+    body = body.getvalue()
+    etag = f'"{hashlib.md5(body).hexdigest()}"'
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# The receipt as it used to be drawn: font lookup, download and decode on every purchase
+def legacy_receipt(user_email: str, item_name: str, item_price, item_image_url: str) -> BytesIO:
+    img = Image.new("RGB", (400, 400), "white")
+    draw = ImageDraw.Draw(img)
+    try:
+        font = ImageFont.truetype("arial.ttf", 20)
+    except IOError:
+        font = ImageFont.load_default()
+    text = (f"Receipt ID: {str(uuid.uuid4())[:8]}\nUser: {user_email}\nItem: {item_name}\n"
+            f"Price: {item_price} scraps\nDate: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    draw.text((20, 20), text, fill="black", font=font)
+    response = requests.get(item_image_url)
+    item_img = Image.open(BytesIO(response.content)).resize((100, 100))
+    img.paste(item_img, (20, 150))
+    img_io = BytesIO()
+    img.save(img_io, "PNG")
+    img_io.seek(0)
+    return img_io
+
+
+def measure(render, url: str, receipts: int, threads: int) -> float:
+    def one(_):
+        render("user@example.com", "Scrap Metal", 10, url)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(one, range(receipts)))
+    return receipts / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Receipts per second, old renderer vs cached thumbnails")
+    parser.add_argument("--receipts", type=int, default=500)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--image-size", type=int, default=800, help="Side of the served item image in pixels")
+    parser.add_argument("--revalidate", action="store_true",
+                        help="Revalidate the thumbnail in the background for every receipt instead of trusting "
+                             "the cache")
+    args = parser.parse_args()
+
+    server = start_image_server(args.image_size)
+    url = f"http://127.0.0.1:{server.server_port}/item.png"
+    # As when the item is added, so the receipts find the thumbnail cached
+    Shop.THUMBNAILS.get(url)
+    if args.revalidate:
+        Shop.THUMBNAILS.revalidate_after = 0
+    try:
+        print(f"{'Threads':>8} {'Old':>12} {'Cached':>12} {'Speedup':>8}")
+        for threads in args.threads:
+            old = measure(legacy_receipt, url, args.receipts, threads)
+            new = measure(Shop.render_receipt, url, args.receipts, threads)
+            print(f"{threads:>8} {old:>8.1f}/sec {new:>8.1f}/sec {new / old:>7.1f}x")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
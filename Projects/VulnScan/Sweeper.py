@@ -0,0 +1,43 @@
+import sys
+
+from vulnscan import TrainingConfig, log
+from vulnscan.sweep import run_sweep
+
+if __name__ == "__main__":
+    # noinspection DuplicatedCode
+    # ---------------- CONFIG ----------------
+    # Point at a model/round whose embeddings were already generated by Trainer.py
+    cfg = TrainingConfig()
+    cfg.update({
+        "MODEL_NAME": "Model_SenseMacro.4n1",  # Model whose cached embeddings are swept over
+        "MODEL_ROUND": 7,  # Round holding the embeddings (no new round folder is created)
+        "MAX_EPOCHS": 27,  # Epochs per TRAIN_LOOP of a surviving trial, as in Trainer.py
+        "EARLY_STOPPING_PATIENCE": 5,  # Number of epochs to wait for improvement before premature stopping
+        "LR_JUMP": {"MAX": 5, "MIN": 0.1},  # Upper and lower limits for learning rate jumps
+        "AUTO_CONTINUE": False,  # Whether to automatically continue training and ignore EARLY_STOPPING_PATIENCE
+    })
+
+    # Every combination is one trial
+    grid = {
+        "LR": [1e-3, 5e-4, 1e-4],
+        "LR_DECAY": [0.9, 0.95],
+        "JUMP_PATIENCE": [2, 3],
+        "BATCH_SIZE": [32, 64],
+        "TRAIN_LOOPS": [1, 3],
+    }
+
+    # ----------------- RUN ------------------
+    try:
+        run_sweep(
+            cfg=cfg,
+            grid=grid,
+            workers=None,  # None = os.cpu_count() // threads_per_worker
+            threads_per_worker=1,  # Torch threads per worker process
+            eta=3,  # Successive halving: keep the best 1/eta trials each rung (None to disable)
+            min_epochs=3,  # Budget of the first rung
+        )
+    except KeyboardInterrupt:
+        sys.exit("Interrupted by user during sweep.")
+    except Exception as e:
+        log(f"Error during sweep: {e}", cfg=cfg)
+        sys.exit(f"Error during sweep: {e}")
@@ -124,6 +124,7 @@ if __name__ == "__main__":
         "JUMP_PATIENCE": 3,  # Epochs to wait before applying a learning rate jump
         "LR_DECAY": 0.9,  # Factor to multiply learning rate after decay
         "AUTO_CONTINUE": False,  # Whether to automatically continue training and ignore EARLY_STOPPING_PATIENCE
+        "TENSOR_RESIDENT": False,  # Keep all embeddings in one tensor and sample batches by index (dataset must fit in RAM)
 
         # Number of samples to generate for training (not the same as for the training rounds themselves)
         "TEXT_MAX_LEN": 128,  # Maximum length of generated text samples
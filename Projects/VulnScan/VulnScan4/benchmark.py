@@ -1,139 +1,107 @@
-import random
-import time
-
-import matplotlib.pyplot as plt
-import numpy as np
-import seaborn as sns
-from tqdm import tqdm
-
-# Import the scanning function from the previous script
-from trainer import scan_text
-
-# Benchmark settings
-NUM_SAMPLES = 500  # Number of test cases
-TEXT_LENGTHS = [50, 100, 200, 300, 400, 512]  # Different text lengths to test
-
-# Generate test dataset with sensitive and non-sensitive samples
-SENSITIVE_EXAMPLES = [
-    "My SSN is 123-45-6789.",
-    "The password for my account is Hunter2.",
-    "My credit card number is 4111-1111-1111-1111.",
-    "Here's my bank account: 1234567890.",
-    "This is confidential company data."
-]
-NON_SENSITIVE_EXAMPLES = [
-    "I love programming in Python!",
-    "The weather is nice today.",
-    "Let's meet at the coffee shop at 3 PM.",
-    "Just finished reading an amazing book.",
-    "Exploring new AI technologies is fun!"
-]
-
-
-# Function to generate random texts with varying lengths
-def generate_random_text(length, is_sensitive=False):
-    base_text = random.choice(SENSITIVE_EXAMPLES if is_sensitive else NON_SENSITIVE_EXAMPLES)
-    return " ".join([base_text] * (length // len(base_text)))
-
-
-# Benchmarking storage
-results = []
-
-print("Running benchmarks...")
-
-# Run tests
-for length in tqdm(TEXT_LENGTHS):
-    for _ in range(NUM_SAMPLES // len(TEXT_LENGTHS)):
-        is_sensitive = random.choice([True, False])
-        test_text = generate_random_text(length, is_sensitive)
-
-        start_time = time.time()
-        output = scan_text(test_text)
-        end_time = time.time()
-
-        results.append({
-            "text_length": length,
-            "confidence": output["confidence"],
-            "sensitive": output["sensitive"],
-            "expected": is_sensitive,
-            "time_taken": end_time - start_time
-        })
-
-# Convert results to NumPy array for analysis
-results_np = np.array([
-    (r["text_length"], r["confidence"], r["sensitive"], r["expected"], r["time_taken"])
-    for r in results
-])
-
-# Extract columns
-text_lengths = results_np[:, 0]
-confidences = results_np[:, 1]
-predicted_sensitive = results_np[:, 2]
-expected_sensitive = results_np[:, 3]
-inference_times = results_np[:, 4]
-
-# Calculate accuracy
-accuracy = np.mean(predicted_sensitive == expected_sensitive) * 100
-print(f"Model Accuracy: {accuracy:.2f}%")
-
-# Plotting
-sns.set_theme(style="whitegrid")
-
-# 1. Confidence Distribution
-plt.figure(figsize=(10, 5))
-sns.histplot(confidences, bins=20, kde=True, color="blue")
-plt.title("Confidence Score Distribution")
-plt.xlabel("Confidence (%)")
-plt.ylabel("Frequency")
-plt.show()
-
-# 2. Text Length vs Confidence
-plt.figure(figsize=(10, 5))
-sns.boxplot(x=text_lengths, y=confidences, palette="coolwarm")
-plt.title("Text Length vs Confidence Score")
-plt.xlabel("Text Length")
-plt.ylabel("Confidence (%)")
-plt.show()
-
-# 3. Inference Time vs Text Length
-plt.figure(figsize=(10, 5))
-sns.lineplot(x=text_lengths, y=inference_times, marker="o", linestyle="--", color="red")
-plt.title("Inference Time vs Text Length")
-plt.xlabel("Text Length")
-plt.ylabel("Time Taken (seconds)")
-plt.show()
-
-# 4. Accuracy per Text Length
-accuracy_per_length = []
-for length in TEXT_LENGTHS:
-    indices = text_lengths == length
-    acc = np.mean(predicted_sensitive[indices] == expected_sensitive[indices]) * 100
-    accuracy_per_length.append(acc)
-
-plt.figure(figsize=(10, 5))
-sns.barplot(x=TEXT_LENGTHS, y=accuracy_per_length, palette="viridis")
-plt.title("Accuracy vs Text Length")
-plt.xlabel("Text Length")
-plt.ylabel("Accuracy (%)")
-plt.ylim(0, 100)
-plt.show()
-
-# 5. ROC Curve Simulation
-true_positives = np.sum((predicted_sensitive == 1) & (expected_sensitive == 1))
-false_positives = np.sum((predicted_sensitive == 1) & (expected_sensitive == 0))
-true_negatives = np.sum((predicted_sensitive == 0) & (expected_sensitive == 0))
-false_negatives = np.sum((predicted_sensitive == 0) & (expected_sensitive == 1))
-
-tpr = true_positives / (true_positives + false_negatives) if (true_positives + false_negatives) else 0
-fpr = false_positives / (false_positives + true_negatives) if (false_positives + true_negatives) else 0
-
-plt.figure(figsize=(5, 5))
-plt.plot([0, fpr, 1], [0, tpr, 1], marker="o", linestyle="--", color="green", label="ROC Curve")
-plt.plot([0, 1], [0, 1], linestyle="--", color="grey", alpha=0.7)
-plt.xlabel("False Positive Rate")
-plt.ylabel("True Positive Rate")
-plt.title("ROC Curve Simulation")
-plt.legend()
-plt.show()
-
-print("Benchmarking completed successfully!")
+import argparse
+import os
+import sys
+
+import torch
+
+# Make the vulnscan package and tools/data.py importable when run from VulnScan4/
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+
+from data import sensitive_texts, nonsensitive_texts  # noqa: E402
+from vulnscan.benchmark import sweep, save_results, load_results, compare  # noqa: E402
+
+
+# ---------------- TARGETS ----------------
+def load_scan_text():
+    from trainer import scan_text
+
+    def predict(texts: list[str]):
+        return [scan_text(text) for text in texts]
+
+    return predict
+
+
+def load_simplenn(name: str, round_: int):
+    from sentence_transformers import SentenceTransformer
+    from vulnscan import SimpleNN
+
+    model = SimpleNN(input_dim=384)
+    state = torch.load(f"{ROOT}/cache/{name}/round_{round_}/{name}_round{round_}.pth", map_location="cpu")
+    model.load_state_dict(state["model_state_dict"])
+    model.eval()
+    embed_model = SentenceTransformer("all-MiniLM-L6-v2", device="cpu")
+
+    def predict(texts: list[str]):
+        embs = embed_model.encode(texts, convert_to_tensor=True, device="cpu", batch_size=max(len(texts), 1))
+        return torch.sigmoid(model(embs))
+
+    return predict
+
+
+def load_quantized(name: str, round_: int):
+    from vulnscan import QuantizedScanner
+
+    scanner = QuantizedScanner(artifact_dir=f"{ROOT}/cache/{name}/round_{round_}/quantized",
+                               threads=torch.get_num_threads())
+
+    def predict(texts: list[str]):
+        return scanner.predict(texts, batch_size=max(len(texts), 1))
+
+    return predict
+
+
+# ---------------- MAIN ----------------
+def main():
+    parser = argparse.ArgumentParser(description="Headless VulnScan inference benchmark")
+    parser.add_argument("--targets", nargs="+", default=["scan_text", "simplenn"],
+                        choices=["scan_text", "simplenn", "quantized"])
+    parser.add_argument("--model-name", default="Model_SenseMacro.4n1")
+    parser.add_argument("--round", type=int, default=7)
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--text-lengths", nargs="+", type=int, default=[50, 200, 512])
+    parser.add_argument("--threads", nargs="+", type=int, default=[1, os.cpu_count() or 1])
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the JSON report")
+    parser.add_argument("--baseline", help="Stored JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed regression ratio (0.10 = 10%%)")
+    args = parser.parse_args()
+
+    loaders = {
+        "scan_text": load_scan_text,
+        "simplenn": lambda: load_simplenn(args.model_name, args.round),
+        "quantized": lambda: load_quantized(args.model_name, args.round),
+    }
+    targets = {name: loaders[name]() for name in args.targets}
+
+    print("Running benchmarks...")
+    report = sweep(
+        targets=targets,
+        pool=sensitive_texts + nonsensitive_texts,
+        batch_sizes=args.batch_sizes,
+        text_lengths=args.text_lengths,
+        threads=args.threads,
+        warmup=args.warmup,
+        iterations=args.iterations,
+        seed=args.seed,
+    )
+    save_results(report, args.output)
+    print(f"Saved results to {args.output}")
+
+    if args.baseline:
+        regressions = compare(report, load_results(args.baseline), threshold=args.threshold)
+        if not regressions:
+            print(f"No regressions beyond {args.threshold * 100:.0f}% against {args.baseline}")
+            return
+        print(f"\n[!] {len(regressions)} regression(s) against {args.baseline}:")
+        for r in regressions:
+            print(f"    {r['target']} bs={r['batch_size']} len={r['text_length']} thr={r['threads']} | "
+                  f"{r['metric']}: {r['baseline']:.2f} -> {r['current']:.2f} ({r['change'] * 100:+.1f}%)")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
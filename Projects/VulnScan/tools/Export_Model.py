@@ -0,0 +1,81 @@
+import os
+import time
+
+import torch
+from sentence_transformers import SentenceTransformer
+
+from data import test_texts, test_labels
+from vulnscan import SimpleNN, QuantizedScanner, export_quantized
+
+# ---------------- INIT ----------------
+NAME = "Model_SenseMacro.4n1"
+ROUND = 7
+THREADS = 4  # Fixed thread count for the CPU runtime
+BENCH_REPEATS = 20  # Timed passes over the data.py texts
+OUTPUT_DIR = f"../cache/{NAME}/round_{ROUND}/quantized"
+
+# Production nodes are CPU-only, so export and compare on CPU
+device = "cpu"
+torch.set_num_threads(THREADS)
+
+# ---------------- LOAD EAGER MODEL + EMBEDDER ----------------
+model = SimpleNN(input_dim=384).to(device)
+state = torch.load(
+    f"../cache/{NAME}/round_{ROUND}/{NAME}_round{ROUND}.pth",
+    map_location="cpu"
+)
+model.load_state_dict(state["model_state_dict"])
+model.eval()
+
+embed_model = SentenceTransformer("all-MiniLM-L6-v2", device=device)
+
+
+def eager_predict(texts: list[str]) -> torch.Tensor:
+    with torch.inference_mode():
+        embs = embed_model.encode(texts, convert_to_tensor=True, device=device)
+        return torch.sigmoid(model(embs)).view(-1)
+
+
+# ---------------- 1. EXPORT ----------------
+print(f"Exporting int8 TorchScript pipeline to {OUTPUT_DIR}...")
+export_quantized(embed_model=embed_model, model=model, out_dir=OUTPUT_DIR, example_texts=test_texts[:8])
+size_mb = os.path.getsize(os.path.join(OUTPUT_DIR, "pipeline.pt")) / 10 ** 6
+print(f"Artifact size: {size_mb:.2f}MB")
+
+scanner = QuantizedScanner(artifact_dir=OUTPUT_DIR, threads=THREADS)
+
+# ---------------- 2. PARITY CHECK ----------------
+eager_probs = eager_predict(test_texts)
+quant_probs = scanner.predict(test_texts)
+
+eager_labels = (eager_probs >= 0.5).long()
+quant_labels = (quant_probs >= 0.5).long()
+true_labels = torch.tensor(test_labels)
+
+agreement = (eager_labels == quant_labels).float().mean().item()
+max_diff = (eager_probs - quant_probs).abs().max().item()
+print("\n=== PARITY: eager vs quantized on data.py ===")
+print(f"Decision agreement: {agreement * 100:.2f}%")
+print(f"Max |prob diff|: {max_diff:.4f}")
+print(f"Eager accuracy: {(eager_labels == true_labels).float().mean().item() * 100:.2f}%")
+print(f"Quantized accuracy: {(quant_labels == true_labels).float().mean().item() * 100:.2f}%")
+for i in torch.nonzero(eager_labels != quant_labels).view(-1).tolist():
+    print(f"    Mismatch [{i + 1}] eager={eager_probs[i]:.3f} quant={quant_probs[i]:.3f} | {test_texts[i][:50]}...")
+
+
+# ---------------- 3. LATENCY / THROUGHPUT ----------------
+def bench(predict, texts: list[str]) -> tuple[float, float]:
+    predict(texts)  # Warm-up
+    start = time.perf_counter()
+    for _ in range(BENCH_REPEATS):
+        predict(texts)
+    elapsed = time.perf_counter() - start
+    return elapsed / BENCH_REPEATS * 1000, BENCH_REPEATS * len(texts) / elapsed
+
+
+print(f"\n=== BENCHMARK: {len(test_texts)} texts x {BENCH_REPEATS} passes, {THREADS} threads ===")
+eager_ms, eager_tps = bench(eager_predict, test_texts)
+quant_ms, quant_tps = bench(scanner.predict, test_texts)
+print(f"Eager:     {eager_ms:8.2f}ms/pass | {eager_tps:8.1f} texts/s")
+print(f"Quantized: {quant_ms:8.2f}ms/pass | {quant_tps:8.1f} texts/s")
+print(f"Speedup: {eager_ms / quant_ms:.2f}x")
@@ -0,0 +1,102 @@
+import os
+import random
+import threading
+import time
+
+import psutil
+import torch
+from sentence_transformers import SentenceTransformer
+
+from data import sensitive_texts, nonsensitive_texts
+from vulnscan import SimpleNN
+from vulnscan.stream import scan_file, read_windows, StreamStats
+
+# ---------------- INIT ----------------
+NAME = "Model_SenseMacro.4n1"
+ROUND = 7
+SIZES_GB = [1, 10]  # Synthetic input sizes
+DATA_DIR = "../cache/stream_benchmark"
+READER_ONLY = False  # True = benchmark chunked read + windowing + dedup only (no embedding), much faster on CPU
+SENSITIVE_RATE = 0.01  # Fraction of synthetic lines that contain sensitive data
+RSS_INTERVAL = 0.5  # Seconds between RSS samples
+
+device = "cuda" if torch.cuda.is_available() else "cpu"
+os.makedirs(DATA_DIR, exist_ok=True)
+
+
+# ---------------- SYNTHETIC INPUT ----------------
+def make_file(path: str, size_gb: int):
+    """Write a log-like file of `size_gb` GB a few MB at a time (never held in memory)."""
+    target = size_gb * 1024 ** 3
+    if os.path.exists(path) and os.path.getsize(path) >= target:
+        return
+    rng = random.Random(size_gb)
+    written = 0
+    with open(path, "w", encoding="utf-8") as f:
+        while written < target:
+            lines = []
+            for _ in range(20_000):
+                ts = f"2025-01-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}"
+                pool = sensitive_texts if rng.random() < SENSITIVE_RATE else nonsensitive_texts
+                lines.append(f"{ts} INFO req={rng.getrandbits(32):08x} {rng.choice(pool)}\n")
+            block = "".join(lines)
+            f.write(block)
+            written += len(block.encode("utf-8"))
+
+
+# ---------------- RSS SAMPLER ----------------
+class RSSSampler:
+    def __init__(self):
+        self.process = psutil.Process(os.getpid())
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.samples.append(self.process.memory_info().rss / 10 ** 6)
+            time.sleep(RSS_INTERVAL)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+# ---------------- LOAD MODEL + EMBEDDER ----------------
+if not READER_ONLY:
+    model = SimpleNN(input_dim=384).to(device)
+    state = torch.load(f"../cache/{NAME}/round_{ROUND}/{NAME}_round{ROUND}.pth", map_location="cpu")
+    model.load_state_dict(state["model_state_dict"])
+    embed_model = SentenceTransformer("all-MiniLM-L6-v2", device=device)
+
+# ---------------- RUN ----------------
+for size_gb in SIZES_GB:
+    path = f"{DATA_DIR}/synthetic_{size_gb}GB.log"
+    print(f"\nPreparing {path}...")
+    make_file(path, size_gb)
+    file_mb = os.path.getsize(path) / 10 ** 6
+
+    stats = StreamStats()
+    start = time.perf_counter()
+    with RSSSampler() as rss:
+        if READER_ONLY:
+            for _ in read_windows(path):
+                stats.windows += 1
+        else:
+            for _ in scan_file(path, embed_model=embed_model, model=model, device=device, stats=stats):
+                pass
+    elapsed = time.perf_counter() - start
+
+    # Compare RSS early vs. late in the run: a constant-memory scan keeps these close
+    quarter = max(len(rss.samples) // 4, 1)
+    print(f"=== {size_gb}GB ({'reader only' if READER_ONLY else 'full pipeline'}) ===")
+    print(f"Time: {elapsed:.1f}s | Throughput: {file_mb / elapsed:.1f}MB/s")
+    print(f"Windows: {stats.windows} | Duplicates skipped: {stats.duplicates} | "
+          f"Scanned: {stats.scanned} | Flagged: {stats.flagged}")
+    print(f"Peak RSS: {max(rss.samples):.0f}MB | "
+          f"Mean RSS first quarter: {sum(rss.samples[:quarter]) / quarter:.0f}MB | "
+          f"last quarter: {sum(rss.samples[-quarter:]) / quarter:.0f}MB")
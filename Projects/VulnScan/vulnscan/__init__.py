@@ -4,6 +4,7 @@ from vulnscan.log import log
 from vulnscan.genData import DataGen
 from vulnscan.config import TrainingConfig
 from vulnscan.train import Train, SimpleNN, EmbeddingDataset
+from vulnscan.inference import export_quantized, QuantizedScanner
 
 
 # ---------------- PLOTTING ----------------
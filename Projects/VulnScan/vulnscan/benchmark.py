@@ -0,0 +1,160 @@
+import gc
+import json
+import os
+import platform
+import random
+import time
+from typing import Callable
+
+import numpy as np
+import psutil
+import torch
+
+PredictFn = Callable[[list[str]], object]
+
+
+# ---------------- INPUTS ----------------
+def make_texts(pool: list[str], text_length: int, count: int, seed: int = 0) -> list[str]:
+    """
+    Build `count` texts of roughly `text_length` characters by sampling sentences from `pool`.
+
+    Sentences are drawn at random (seeded, so every run sees the same inputs) instead of repeating
+    one canned sentence, so tokenization and attention see realistic, varied input.
+    """
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        parts, size = [], 0
+        while size < text_length:
+            sentence = rng.choice(pool)
+            parts.append(sentence)
+            size += len(sentence) + 1
+        texts.append(" ".join(parts)[:text_length])
+    return texts
+
+
+# ---------------- MEASUREMENT ----------------
+def _rss_mb(process: psutil.Process) -> float:
+    return process.memory_info().rss / 10 ** 6
+
+
+def measure(predict: PredictFn, texts: list[str], batch_size: int,
+            warmup: int = 3, iterations: int = 30) -> dict:
+    """Time `predict` on consecutive batches of `texts` and summarise the latency distribution."""
+    process = psutil.Process(os.getpid())
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)] or [[]]
+
+    for i in range(warmup):
+        predict(batches[i % len(batches)])
+
+    gc.collect()
+    gc_was_enabled = gc.isenabled()
+    gc.disable()  # Keep collector pauses out of the timed region
+    samples_ns, peak_rss = [], _rss_mb(process)
+    try:
+        with torch.inference_mode():
+            for i in range(iterations):
+                batch = batches[i % len(batches)]
+                start = time.perf_counter_ns()
+                predict(batch)
+                samples_ns.append(time.perf_counter_ns() - start)
+                peak_rss = max(peak_rss, _rss_mb(process))
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    latencies_ms = np.array(samples_ns, dtype=np.float64) / 1e6
+    total_s = latencies_ms.sum() / 1000
+    return {
+        "iterations": iterations,
+        "mean_ms": float(latencies_ms.mean()),
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "throughput_tps": float(iterations * batch_size / total_s) if total_s else 0.0,
+        "peak_rss_mb": float(peak_rss),
+    }
+
+
+def sweep(targets: dict[str, PredictFn], pool: list[str], batch_sizes: list[int], text_lengths: list[int],
+          threads: list[int], warmup: int = 3, iterations: int = 30, seed: int = 0) -> dict:
+    """Run every target over the batch size x text length x thread count grid."""
+    results = []
+    for n_threads in threads:
+        torch.set_num_threads(n_threads)
+        for text_length in text_lengths:
+            texts = make_texts(pool, text_length=text_length, count=max(batch_sizes) * 4, seed=seed)
+            for batch_size in batch_sizes:
+                for name, predict in targets.items():
+                    stats = measure(predict, texts, batch_size=batch_size, warmup=warmup, iterations=iterations)
+                    results.append({
+                        "target": name,
+                        "batch_size": batch_size,
+                        "text_length": text_length,
+                        "threads": n_threads,
+                        **stats,
+                    })
+                    print(f"{name:>10} | bs={batch_size:<4} len={text_length:<5} thr={n_threads:<3} | "
+                          f"p50={stats['p50_ms']:8.2f}ms p95={stats['p95_ms']:8.2f}ms "
+                          f"p99={stats['p99_ms']:8.2f}ms | {stats['throughput_tps']:8.1f} texts/s | "
+                          f"rss={stats['peak_rss_mb']:.0f}MB")
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "warmup": warmup,
+            "iterations": iterations,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+# ---------------- PERSISTENCE / COMPARISON ----------------
+def save_results(report: dict, path: str):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=4)
+
+
+def load_results(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def _key(result: dict) -> tuple:
+    return result["target"], result["batch_size"], result["text_length"], result["threads"]
+
+
+def compare(current: dict, baseline: dict, threshold: float = 0.10) -> list[dict]:
+    """
+    Compare two reports and return the configurations that regressed by more than `threshold`.
+
+    A regression is a p50 or p95 latency increase, or a throughput drop, beyond the threshold
+    (0.10 = 10%). Configurations missing from the baseline are ignored.
+    """
+    base = {_key(r): r for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        old = base.get(_key(result))
+        if old is None:
+            continue
+        for metric, higher_is_worse in (("p50_ms", True), ("p95_ms", True), ("throughput_tps", False)):
+            if not old[metric]:
+                continue
+            change = (result[metric] - old[metric]) / old[metric]
+            if (change if higher_is_worse else -change) > threshold:
+                regressions.append({
+                    "target": result["target"],
+                    "batch_size": result["batch_size"],
+                    "text_length": result["text_length"],
+                    "threads": result["threads"],
+                    "metric": metric,
+                    "baseline": old[metric],
+                    "current": result[metric],
+                    "change": change,
+                })
+    return regressions
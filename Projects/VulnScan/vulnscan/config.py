@@ -35,6 +35,7 @@ class TrainingConfig:
         self.LR_DECAY: float = 0.9
         self.BEST_VAL_LOSS: float = float("inf")
         self.AUTO_CONTINUE: bool = False
+        self.TENSOR_RESIDENT: bool = False
 
         # Dataset / data generation
         self.DATASET_SIZE: int = 1000
@@ -0,0 +1,89 @@
+import json
+import os
+
+import torch
+import torch.nn as nn
+from sentence_transformers import SentenceTransformer
+from transformers import AutoTokenizer
+
+from vulnscan.train import SimpleNN
+
+ARTIFACT_FILE = "pipeline.pt"
+TOKENIZER_DIR = "tokenizer"
+META_FILE = "meta.json"
+
+
+# ---------------- PIPELINE ----------------
+class ScanPipeline(nn.Module):
+    """Embedder + classifier as one module, so both halves end up in a single graph."""
+
+    def __init__(self, embed_model: SentenceTransformer, model: SimpleNN):
+        super().__init__()
+        self.embedder = embed_model
+        self.classifier = model
+
+    def forward(self, input_ids: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+        features = self.embedder({"input_ids": input_ids, "attention_mask": attention_mask})
+        return self.classifier(features["sentence_embedding"])
+
+
+# ---------------- EXPORT ----------------
+def export_quantized(embed_model: SentenceTransformer, model: SimpleNN, out_dir: str,
+                     example_texts: list[str] | None = None) -> str:
+    """
+    Export the embedder + classifier as an int8 dynamically quantized, frozen TorchScript artifact.
+
+    All nn.Linear layers (the transformer's and SimpleNN's) are quantized to qint8, the pipeline is
+    traced, frozen and passed through optimize_for_inference. The tokenizer is saved next to it.
+    Returns the directory the artifact was written to.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    embed_model = embed_model.to("cpu").eval()
+    model = model.to("cpu").eval()
+
+    pipeline = ScanPipeline(embed_model=embed_model, model=model).eval()
+    quantized = torch.ao.quantization.quantize_dynamic(pipeline, {nn.Linear}, dtype=torch.qint8)
+
+    example_texts = example_texts or ["My SSN is 123-45-6789", "The sky is blue today"]
+    enc = tokenize(embed_model.tokenizer, example_texts, embed_model.max_seq_length)
+    with torch.no_grad():
+        traced = torch.jit.trace(quantized, (enc["input_ids"], enc["attention_mask"]), strict=False)
+        traced = torch.jit.optimize_for_inference(torch.jit.freeze(traced.eval()))
+
+    traced.save(os.path.join(out_dir, ARTIFACT_FILE))
+    embed_model.tokenizer.save_pretrained(os.path.join(out_dir, TOKENIZER_DIR))
+    with open(os.path.join(out_dir, META_FILE), "w") as f:
+        json.dump({
+            "max_seq_length": embed_model.max_seq_length,
+            "quantization": "dynamic-qint8",
+            "format": "torchscript",
+        }, f, indent=4)
+    return out_dir
+
+
+def tokenize(tokenizer, texts: list[str], max_length: int) -> dict[str, torch.Tensor]:
+    return tokenizer(texts, padding=True, truncation=True, max_length=max_length, return_tensors="pt")
+
+
+# ---------------- RUNTIME ----------------
+class QuantizedScanner:
+    """CPU-only runtime for an artifact produced by export_quantized."""
+
+    def __init__(self, artifact_dir: str, threads: int = 1):
+        torch.set_num_threads(threads)
+        self.threads = threads
+        with open(os.path.join(artifact_dir, META_FILE)) as f:
+            self.meta = json.load(f)
+        self.tokenizer = AutoTokenizer.from_pretrained(os.path.join(artifact_dir, TOKENIZER_DIR))
+        self.module = torch.jit.load(os.path.join(artifact_dir, ARTIFACT_FILE), map_location="cpu")
+        self.module.eval()
+
+    def predict(self, texts: list[str], batch_size: int = 32) -> torch.Tensor:
+        """Return the sensitive-data probability for each text, shape (len(texts),)."""
+        probs = []
+        with torch.inference_mode():
+            for i in range(0, len(texts), batch_size):
+                enc = tokenize(self.tokenizer, texts[i:i + batch_size], self.meta["max_seq_length"])
+                logits = self.module(enc["input_ids"], enc["attention_mask"])
+                probs.append(torch.sigmoid(logits).view(-1))
+        return torch.cat(probs) if probs else torch.empty(0)
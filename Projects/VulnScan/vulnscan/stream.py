@@ -0,0 +1,201 @@
+import hashlib
+import queue
+import threading
+from collections import OrderedDict
+from typing import Iterator
+
+import torch
+from sentence_transformers import SentenceTransformer
+
+from vulnscan.train import SimpleNN
+
+_DONE = object()  # End-of-stream sentinel passed between stages
+
+
+# ---------------- READER ----------------
+_WHITESPACE = b" \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f"  # ASCII bytes str.split() cuts on, never part of a multi-byte UTF-8 character
+
+
+def read_windows(path: str, window_tokens: int = 64, overlap: int = 16,
+                 chunk_bytes: int = 4 * 1024 * 1024) -> Iterator[tuple[int, str]]:
+    """
+    Yield (byte_offset, text) sliding windows of `window_tokens` whitespace tokens from a file.
+
+    Consecutive windows share `overlap` tokens so a secret split across a boundary is still seen whole.
+    The file is read `chunk_bytes` at a time and cut on the last whitespace byte; the bytes after it are
+    carried into the next chunk, so no token is ever split and only one chunk is held in memory (plus a
+    single token longer than a chunk, if the input has one). Offsets point at the chunk a window starts in.
+    """
+    if not 0 <= overlap < window_tokens:
+        raise ValueError("overlap must be in [0, window_tokens)")
+    step = window_tokens - overlap
+
+    with open(path, "rb") as f:
+        pending = b""  # Bytes after the last whitespace of the previous chunk
+        pos = 0  # File offset of the start of `pending`
+        carry: list[str] = []
+        carry_offset = 0
+        emitted = False
+        while True:
+            data = f.read(chunk_bytes)
+            buf = pending + data
+            if not buf:
+                break
+            if data:
+                cut = max(buf.rfind(byte) for byte in _WHITESPACE)
+                if cut < 0:
+                    # No whitespace at all, the token continues into the next chunk
+                    pending = buf
+                    continue
+                buf, pending = buf[:cut + 1], buf[cut + 1:]
+            else:
+                pending = b""
+
+            tokens = carry + buf.decode("utf-8", errors="replace").split()
+            offset = carry_offset if carry else pos
+
+            i = 0
+            while i + window_tokens <= len(tokens):
+                yield offset, " ".join(tokens[i:i + window_tokens])
+                emitted = True
+                i += step
+            carry = tokens[i:]
+            carry_offset = offset if i == 0 else pos
+            pos += len(buf)
+
+        # The first `overlap` carried tokens are already in the last window
+        if carry and (len(carry) > overlap or not emitted):
+            yield carry_offset, " ".join(carry)
+
+
+class _SeenWindows:
+    """Bounded set of window digests (oldest evicted first), so dedup memory does not grow with file size."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.digests: OrderedDict[bytes, None] = OrderedDict()
+
+    def check_and_add(self, text: str) -> bool:
+        digest = hashlib.blake2b(text.encode("utf-8", errors="replace"), digest_size=16).digest()
+        if digest in self.digests:
+            self.digests.move_to_end(digest)
+            return True
+        self.digests[digest] = None
+        if len(self.digests) > self.capacity:
+            self.digests.popitem(last=False)
+        return False
+
+
+# ---------------- PIPELINE ----------------
+class StreamStats:
+    def __init__(self):
+        self.windows = 0
+        self.duplicates = 0
+        self.scanned = 0
+        self.flagged = 0
+        self.last_offset = 0
+
+
+def _stage(target, *args) -> threading.Thread:
+    thread = threading.Thread(target=target, args=args, daemon=True)
+    thread.start()
+    return thread
+
+
+def scan_file(path: str, embed_model: SentenceTransformer, model: SimpleNN, threshold: float = 0.5,
+              window_tokens: int = 64, overlap: int = 16, batch_size: int = 64, queue_size: int = 4,
+              dedup_capacity: int = 100_000, device: str = "cpu", only_flagged: bool = True,
+              stats: StreamStats | None = None) -> Iterator[dict]:
+    """
+    Stream-scan a file of any size with bounded memory.
+
+    Reader, embedder and classifier run as separate stages joined by queues of at most `queue_size`
+    batches, so a slow stage blocks the one before it (back-pressure) instead of letting batches pile
+    up. Windows whose hash was already seen are skipped. Yields one dict per window (only those at or
+    above `threshold` when `only_flagged` is set).
+    """
+    stats = stats or StreamStats()
+    seen = _SeenWindows(dedup_capacity)
+    text_q: queue.Queue = queue.Queue(maxsize=queue_size)
+    embed_q: queue.Queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors: list[BaseException] = []
+
+    def put(q: queue.Queue, item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(q: queue.Queue):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def reader():
+        try:
+            batch = []
+            for offset, text in read_windows(path, window_tokens=window_tokens, overlap=overlap):
+                stats.windows += 1
+                if seen.check_and_add(text):
+                    stats.duplicates += 1
+                    continue
+                batch.append((offset, text))
+                if len(batch) == batch_size:
+                    if not put(text_q, batch):
+                        return
+                    batch = []
+            if batch:
+                put(text_q, batch)
+        except BaseException as err:
+            errors.append(err)
+        finally:
+            put(text_q, _DONE)
+
+    def embedder():
+        try:
+            while True:
+                batch = get(text_q)
+                if batch is _DONE:
+                    break
+                with torch.inference_mode():
+                    embs = embed_model.encode([text for _, text in batch], convert_to_tensor=True,
+                                              device=device, batch_size=len(batch))
+                if not put(embed_q, (batch, embs)):
+                    return
+        except BaseException as err:
+            errors.append(err)
+        finally:
+            put(embed_q, _DONE)
+
+    threads = [_stage(reader), _stage(embedder)]
+    model.eval()
+    try:
+        # Classifier stage runs in the caller's thread, as the generator is consumed
+        while True:
+            item = embed_q.get()
+            if item is _DONE:
+                break
+            batch, embs = item
+            with torch.inference_mode():
+                probs = torch.sigmoid(model(embs)).view(-1).tolist()
+            for (offset, text), prob in zip(batch, probs):
+                stats.scanned += 1
+                stats.last_offset = offset
+                if prob >= threshold:
+                    stats.flagged += 1
+                elif only_flagged:
+                    continue
+                yield {"offset": offset, "probability": prob, "sensitive": prob >= threshold, "text": text}
+        if errors:
+            raise errors[0]
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=5)
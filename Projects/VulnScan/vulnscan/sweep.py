@@ -0,0 +1,210 @@
+import itertools
+import json
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from tabulate import tabulate
+
+from vulnscan.config import TrainingConfig
+from vulnscan.log import log
+from vulnscan.train import Train, SimpleNN
+
+# Hyperparameters a sweep is allowed to vary
+SWEEP_PARAMS = ("LR", "LR_DECAY", "JUMP_PATIENCE", "BATCH_SIZE", "TRAIN_LOOPS")
+
+# Per-worker embedding store, filled once by _init_worker
+_STORE: dict[str, torch.Tensor] = {}
+
+
+# ---------------- EMBEDDING STORE ----------------
+def _load_split(embed_cache_dir: str, split: str) -> tuple[torch.Tensor, torch.Tensor]:
+    files = sorted(f for f in os.listdir(embed_cache_dir) if f.startswith(f"{split}_"))
+    if not files:
+        raise FileNotFoundError(f"No '{split}_*.pt' embeddings found in {embed_cache_dir}")
+    data = [torch.load(os.path.join(embed_cache_dir, f), map_location="cpu") for f in files]
+    return (torch.cat([d["embeddings"] for d in data], dim=0).float().contiguous(),
+            torch.cat([d["labels"] for d in data], dim=0).float().contiguous())
+
+
+def build_store(embed_cache_dir: str, store_path: str) -> str:
+    """Consolidate the cached train/validation embeddings into one file that workers memory-map."""
+    train_X, train_y = _load_split(embed_cache_dir, "train")
+    val_X, val_y = _load_split(embed_cache_dir, "validation")
+    torch.save({"train_X": train_X, "train_y": train_y, "val_X": val_X, "val_y": val_y}, store_path)
+    return store_path
+
+
+def _init_worker(store_path: str, threads: int):
+    torch.set_num_threads(threads)
+    # mmap=True: every worker maps the same pages read-only instead of holding its own copy
+    _STORE.update(torch.load(store_path, map_location="cpu", mmap=True, weights_only=True))
+
+
+# ---------------- TRIAL ----------------
+def _trial_config(params: dict, base: dict) -> TrainingConfig:
+    cfg = TrainingConfig()
+    cfg.update({**base, **params, "DEVICE": "cpu"})
+    return cfg
+
+
+def _train_trial(trial: dict, budget: int, base: dict) -> dict:
+    """
+    Train `trial` on the shared store, resuming from its saved state, until it has run `budget` epochs
+    per TRAIN_LOOP (so every trial is at the same fraction of its full run, whatever its TRAIN_LOOPS).
+    """
+    cfg = _trial_config(trial["params"], base)
+    trainer = Train(cfg=cfg)
+    train_X, train_y, val_X, val_y = _STORE["train_X"], _STORE["train_y"], _STORE["val_X"], _STORE["val_y"]
+
+    model = SimpleNN(input_dim=train_X.shape[1])
+    optimizer = optim.Adam(model.parameters(), lr=cfg.LR)
+    if trial["state"] is not None:
+        model.load_state_dict(trial["state"]["model"])
+        optimizer.load_state_dict(trial["state"]["optimizer"])
+    criterion = nn.BCEWithLogitsLoss()
+    scaler = torch.amp.GradScaler(enabled=False)
+
+    # Same TRAIN_LOOPS semantics as Train.model: MAX_EPOCHS epochs per loop, each loop with a fresh
+    # optimizer and loss-weighted sampler
+    epochs_per_loop = cfg.MAX_EPOCHS
+    budget = min(budget, cfg.MAX_EPOCHS) * cfg.TRAIN_LOOPS
+    lr_state = trial["state"]["lr_state"] if trial["state"] else None
+    weights = trial["state"]["weights"] if trial["state"] else None
+    stopped = trial["state"]["stopped"] if trial["state"] else False
+
+    start = time.perf_counter()
+    while trial["epochs"] < budget:
+        if trial["epochs"] % epochs_per_loop == 0:
+            optimizer = optim.Adam(model.parameters(), lr=cfg.LR)
+            lr_state = trainer.new_lr_state()
+            weights = trainer.sampler_weights(model, train_X, train_y)
+            stopped = False
+        if stopped:
+            # Early-stopped inside this loop: skip to the next loop boundary
+            trial["epochs"] = min(budget, (trial["epochs"] // epochs_per_loop + 1) * epochs_per_loop)
+            continue
+
+        train_loss, _, _ = trainer.train_one_epoch_tensor(
+            model=model, X=train_X, y=train_y, weights=weights,
+            optimizer=optimizer, criterion=criterion, scaler=scaler
+        )
+        val_loss, val_metrics = trainer.validate_tensor(model=model, X=val_X, y=val_y, criterion=criterion)
+        trainer.jumpstart_lr(optimizer, val_loss, lr_state)
+
+        trial["history"]["train_loss"].append(train_loss)
+        trial["history"]["val_loss"].append(val_loss)
+        for k in ["accuracy", "precision", "recall", "f1"]:
+            trial["history"][k].append(val_metrics[k])
+
+        if lr_state["patience"] >= cfg.EARLY_STOPPING_PATIENCE and not cfg.AUTO_CONTINUE:
+            stopped = True
+        trial["epochs"] += 1
+
+    trial["train_time"] += time.perf_counter() - start
+    trial["state"] = {
+        "model": model.state_dict(),
+        "optimizer": optimizer.state_dict(),
+        "lr_state": lr_state,
+        "weights": weights,
+        "stopped": stopped,
+    }
+    return trial
+
+
+def _score(trial: dict) -> float:
+    return min(trial["history"]["val_loss"], default=float("inf"))
+
+
+# ---------------- SWEEP ----------------
+def run_sweep(cfg: TrainingConfig, grid: dict[str, list], workers: int | None = None,
+              threads_per_worker: int = 1, eta: int | None = 3, min_epochs: int = 2) -> list[dict]:
+    """
+    Train every combination in `grid` concurrently and return the leaderboard (best val loss first).
+
+    Worker count defaults to cpu_count // threads_per_worker. With `eta` set, successive halving is
+    applied: all trials run `min_epochs`, the best 1/eta continue with eta times the budget, and so on
+    up to cfg.MAX_EPOCHS. Budgets count epochs per TRAIN_LOOP, so the last rung is the same
+    MAX_EPOCHS x TRAIN_LOOPS run as Train.model. With `eta=None` every trial runs the full budget.
+    """
+    unknown = set(grid) - set(SWEEP_PARAMS)
+    if unknown:
+        raise AttributeError(f"Cannot sweep over {sorted(unknown)}, allowed: {list(SWEEP_PARAMS)}")
+
+    sweep_dir = f"{cfg.CACHE_DIR}/{cfg.MODEL_NAME}/sweep_{time.strftime('%Y%m%d_%H%M%S')}"
+    os.makedirs(sweep_dir, exist_ok=True)
+    store_path = build_store(cfg.EMBED_CACHE_DIR, f"{sweep_dir}/embedding_store.pt")
+
+    keys = list(grid)
+    trials = [{
+        "id": i,
+        "params": dict(zip(keys, values)),
+        "epochs": 0,
+        "train_time": 0.0,
+        "status": "running",
+        "state": None,
+        "history": {"train_loss": [], "val_loss": [], "accuracy": [], "precision": [], "recall": [], "f1": []},
+    } for i, values in enumerate(itertools.product(*(grid[k] for k in keys)))]
+
+    # Settings shared by all trials; only the swept parameters differ
+    base = {k: getattr(cfg, k) for k in ("MAX_EPOCHS", "EARLY_STOPPING_PATIENCE", "LR_JUMP", "AUTO_CONTINUE",
+                                         *SWEEP_PARAMS)}
+
+    workers = workers or max(1, (os.cpu_count() or 1) // threads_per_worker)
+    workers = min(workers, len(trials))
+    log(f"Sweeping {len(trials)} configurations on {workers} workers "
+        f"({threads_per_worker} thread(s) each), successive halving: {f'eta={eta}' if eta else 'off'}", cfg)
+
+    budget = min(min_epochs, cfg.MAX_EPOCHS) if eta else cfg.MAX_EPOCHS
+    alive = trials
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"),
+                             initializer=_init_worker, initargs=(store_path, threads_per_worker)) as pool:
+        while True:
+            alive = list(pool.map(_train_trial, alive, [budget] * len(alive), [base] * len(alive)))
+            for trial in alive:
+                trials[trial["id"]] = trial
+            alive.sort(key=_score)
+            log(f"Rung at {budget} epochs per loop: best val loss {_score(alive[0]):.4f} "
+                f"({alive[0]['params']}), {len(alive)} trial(s) alive", cfg)
+
+            if not eta or budget >= cfg.MAX_EPOCHS or len(alive) <= 1:
+                break
+            keep = max(1, len(alive) // eta)
+            for trial in alive[keep:]:
+                trials[trial["id"]]["status"] = f"pruned@{budget}"
+            alive = alive[:keep]
+            budget = min(budget * eta, cfg.MAX_EPOCHS)
+
+    for trial in alive:
+        trials[trial["id"]]["status"] = "completed"
+
+    leaderboard = sorted(({
+        "rank": 0,
+        "id": t["id"],
+        **t["params"],
+        "epochs": t["epochs"],
+        "best_val_loss": _score(t),
+        "best_f1": max(t["history"]["f1"], default=0.0),
+        "final_accuracy": t["history"]["accuracy"][-1] if t["history"]["accuracy"] else 0.0,
+        "train_time": t["train_time"],
+        "status": t["status"],
+    } for t in trials), key=lambda r: r["best_val_loss"])
+    for i, row in enumerate(leaderboard, start=1):
+        row["rank"] = i
+
+    with open(f"{sweep_dir}/leaderboard.json", "w") as f:
+        json.dump(leaderboard, f, indent=4)
+    with open(f"{sweep_dir}/histories.json", "w") as f:
+        json.dump({t["id"]: {"params": t["params"], "history": t["history"]} for t in trials}, f)
+    best = trials[leaderboard[0]["id"]]
+    torch.save({"model_state_dict": best["state"]["model"], "params": best["params"]},
+               f"{sweep_dir}/best_model.pth")
+    os.remove(store_path)
+
+    log(f"Sweep leaderboard:\n{tabulate(leaderboard, headers='keys', floatfmt='.4f')}", cfg)
+    log(f"Saved sweep results to {sweep_dir}", cfg)
+    return leaderboard
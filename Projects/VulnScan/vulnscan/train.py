@@ -1,5 +1,6 @@
 import os
 import sys
+import time
 
 import torch
 import torch.nn as nn
@@ -44,6 +45,15 @@ class EmbeddingDataset(Dataset):
                 return self.current_batch['embeddings'][rel_idx], self.current_batch['labels'][rel_idx]
         raise IndexError("Index out of range")
 
+    def to_tensors(self, device: str = "cpu") -> tuple[torch.Tensor, torch.Tensor]:
+        """Load every cached file into one (embeddings, labels) tensor pair, for datasets that fit in RAM."""
+        embeddings, labels = [], []
+        for f in self.files:
+            data = torch.load(os.path.join(self.embed_cache_dir, f))
+            embeddings.append(data['embeddings'])
+            labels.append(data['labels'])
+        return torch.cat(embeddings, dim=0).to(device), torch.cat(labels, dim=0).to(device)
+
 
 # ---------------- MODEL ----------------
 class SimpleNN(nn.Module):
@@ -61,6 +71,22 @@ class SimpleNN(nn.Module):
         return self.fc(x)
 
 
+# ---------------- METRICS ----------------
+def binary_metrics(preds: torch.Tensor, labels: torch.Tensor) -> dict[str, float]:
+    """Accuracy / precision / recall / F1 from 0-1 tensors, matching sklearn with zero_division=0."""
+    preds, labels = preds.view(-1).bool(), labels.view(-1).bool()
+    tp, fp, fn, correct = torch.stack([
+        (preds & labels).sum(), (preds & ~labels).sum(), (~preds & labels).sum(), (preds == labels).sum()
+    ]).tolist()  # single device sync
+    total = preds.numel()
+    return {
+        "accuracy": correct / total if total else 0.0,
+        "precision": tp / (tp + fp) if tp + fp else 0.0,
+        "recall": tp / (tp + fn) if tp + fn else 0.0,
+        "f1": 2 * tp / (2 * tp + fp + fn) if tp else 0.0
+    }
+
+
 # ---------------- TRAINING ----------------
 class Train:
     def __init__(self, cfg: TrainingConfig):
@@ -84,6 +110,26 @@ class Train:
         weights /= weights.sum()  # normalize
         return WeightedRandomSampler(weights=weights, num_samples=len(weights), replacement=True)
 
+    # Single optimisation step, shared by the DataLoader and tensor-resident paths
+    def _train_step(
+            self, model: SimpleNN, X: torch.Tensor, y: torch.Tensor,
+            optimizer: torch.optim.Adam, criterion: nn.BCEWithLogitsLoss,
+            scaler: torch.amp.GradScaler
+    ):
+        optimizer.zero_grad()
+        with torch.amp.autocast(device_type="cuda" if self.device == "cuda" else "cpu",
+                                enabled=(self.device == "cuda")):
+            outputs = model(X)
+            loss = criterion(outputs, y)
+        if self.device == "cuda":
+            scaler.scale(loss).backward()
+            scaler.step(optimizer)
+            scaler.update()
+        else:
+            loss.backward()
+            optimizer.step()
+        return outputs, loss
+
     # Train for a single epoch
     def train_one_epoch(
             self, model: SimpleNN, loader: DataLoader,
@@ -94,18 +140,7 @@ class Train:
         epoch_loss, all_preds, all_labels = 0, [], []
         for X, y in loader:
             X, y = X.to(self.device), y.to(self.device)
-            optimizer.zero_grad()
-            with torch.amp.autocast(device_type="cuda" if self.device == "cuda" else "cpu",
-                                    enabled=(self.device == "cuda")):
-                outputs = model(X)
-                loss = criterion(outputs, y)
-            if self.device == "cuda":
-                scaler.scale(loss).backward()
-                scaler.step(optimizer)
-                scaler.update()
-            else:
-                loss.backward()
-                optimizer.step()
+            outputs, loss = self._train_step(model, X, y, optimizer, criterion, scaler)
             epoch_loss += loss.item()
             all_preds.extend(torch.sigmoid(outputs).round().cpu().detach().numpy())
             all_labels.extend(y.cpu().numpy())
@@ -132,6 +167,73 @@ class Train:
         }
         return val_loss, metrics
 
+    # ---------------- TENSOR-RESIDENT PATH ----------------
+    # Whole dataset lives in one tensor on self.device; batches are drawn by index sampling.
+    def sampler_weights(self, model: SimpleNN, X: torch.Tensor, y: torch.Tensor) -> torch.Tensor:
+        criterion = nn.BCEWithLogitsLoss(reduction='none')
+        chunk = self.cfg.BATCH_SIZE * 256
+        model.eval()
+        with torch.no_grad():
+            losses = torch.cat([
+                criterion(model(X[i:i + chunk]), y[i:i + chunk]).view(-1) for i in range(0, len(X), chunk)
+            ]).float()
+        return losses / losses.sum()  # normalize
+
+    def train_one_epoch_tensor(
+            self, model: SimpleNN, X: torch.Tensor, y: torch.Tensor, weights: torch.Tensor,
+            optimizer: torch.optim.Adam, criterion: nn.BCEWithLogitsLoss,
+            scaler: torch.amp.GradScaler
+    ):
+        model.train()
+        # Same draw as WeightedRandomSampler(weights, num_samples=len(weights), replacement=True)
+        order = torch.multinomial(weights, num_samples=len(weights), replacement=True)
+        epoch_loss = torch.zeros((), device=self.device)
+        all_preds, all_labels = [], []
+        batches = 0
+        for idx in order.split(self.cfg.BATCH_SIZE):
+            X_batch, y_batch = X[idx], y[idx]
+            outputs, loss = self._train_step(model, X_batch, y_batch, optimizer, criterion, scaler)
+            epoch_loss += loss.detach()
+            all_preds.append(torch.sigmoid(outputs.detach()).round())
+            all_labels.append(y_batch)
+            batches += 1
+        return (epoch_loss / max(batches, 1)).item(), torch.cat(all_preds), torch.cat(all_labels)
+
+    def validate_tensor(self, model: SimpleNN, X: torch.Tensor, y: torch.Tensor, criterion: nn.BCEWithLogitsLoss):
+        model.eval()
+        val_loss = torch.zeros((), device=self.device)
+        preds = []
+        batches = 0
+        with torch.no_grad():
+            for i in range(0, len(X), self.cfg.BATCH_SIZE):
+                outputs = model(X[i:i + self.cfg.BATCH_SIZE])
+                val_loss += criterion(outputs, y[i:i + self.cfg.BATCH_SIZE])
+                preds.append(torch.sigmoid(outputs).round())
+                batches += 1
+        return (val_loss / max(batches, 1)).item(), binary_metrics(torch.cat(preds), y)
+
+    # ---------------- LR JUMPSTARTER ----------------
+    @staticmethod
+    def new_lr_state() -> dict:
+        return {"best_val_loss": float('inf'), "patience": 0, "jumps": 0}
+
+    # Decay LR on improvement, jump it after JUMP_PATIENCE stalled epochs. Returns True if it jumped.
+    def jumpstart_lr(self, optimizer: torch.optim.Adam, val_loss: float, state: dict) -> bool:
+        if val_loss < state["best_val_loss"]:
+            state["best_val_loss"] = val_loss
+            state["patience"] = 0
+            for g in optimizer.param_groups:
+                g['lr'] = max(g['lr'] * self.cfg.LR_DECAY, self.cfg.LR * self.cfg.LR_JUMP["MIN"])
+            return False
+        state["patience"] += 1
+        if state["patience"] >= self.cfg.JUMP_PATIENCE:
+            state["jumps"] += 1
+            for g in optimizer.param_groups:
+                g['lr'] = min(g['lr'] * 3, self.cfg.LR * self.cfg.LR_JUMP["MAX"])
+            state["patience"] = 0
+            return True
+        return False
+
     # Save model checkpoint
     def save_checkpoint(self, model: SimpleNN, optimizer: torch.optim.Adam, scaler: torch.amp.GradScaler, epoch: int):
         round_dir = f"{self.cfg.CACHE_DIR}/{self.cfg.MODEL_NAME}/round_{self.cfg.MODEL_ROUND}"
@@ -149,68 +251,80 @@ class Train:
     def model(self, model: SimpleNN, train_dataset: EmbeddingDataset, val_loader: DataLoader):
         history_loops = []
 
+        tensor_resident = self.cfg.TENSOR_RESIDENT
+        if tensor_resident:
+            log("Loading embeddings into memory (tensor-resident training)...", self.cfg)
+            train_X, train_y = train_dataset.to_tensors(self.device)
+            val_X, val_y = val_loader.dataset.to_tensors(self.device)
+
         for loop in range(self.cfg.TRAIN_LOOPS):
             log(f"Starting TRAIN_LOOP {loop + 1}/{self.cfg.TRAIN_LOOPS}", self.cfg)
 
-            # Create sampler focusing on weak spots
-            sampler = self.create_sampler(train_dataset, model)
-            train_loader = DataLoader(dataset=train_dataset, batch_size=self.cfg.BATCH_SIZE,
-                                      sampler=sampler)
-
             optimizer = optim.Adam(model.parameters(), lr=self.cfg.LR)
             criterion = nn.BCEWithLogitsLoss()
             scaler = torch.amp.GradScaler(enabled=(self.device == "cuda"))
 
+            # Create sampler focusing on weak spots
+            if tensor_resident:
+                weights = self.sampler_weights(model, train_X, train_y)
+
+                def run_epoch():
+                    return self.train_one_epoch_tensor(
+                        model=model, X=train_X, y=train_y, weights=weights,
+                        optimizer=optimizer, criterion=criterion, scaler=scaler
+                    )
+
+                def run_validation():
+                    return self.validate_tensor(model=model, X=val_X, y=val_y, criterion=criterion)
+            else:
+                sampler = self.create_sampler(train_dataset, model)
+                train_loader = DataLoader(dataset=train_dataset, batch_size=self.cfg.BATCH_SIZE,
+                                          sampler=sampler)
+
+                def run_epoch():
+                    return self.train_one_epoch(
+                        model=model, loader=train_loader, optimizer=optimizer, criterion=criterion, scaler=scaler
+                    )
+
+                def run_validation():
+                    return self.validate(model=model, loader=val_loader, criterion=criterion)
+
             # LR Jumpstarter
-            max_lr = self.cfg.LR * self.cfg.LR_JUMP["MAX"]
-            min_lr = self.cfg.LR * self.cfg.LR_JUMP["MIN"]
-            patience_for_jump = self.cfg.JUMP_PATIENCE
-            lr_decay_factor = self.cfg.LR_DECAY
-            best_val_loss = float('inf')
-            patience_counter = 0
-            jump_counter = 0
+            lr_state = self.new_lr_state()
 
             history = {
                 "train_loss": [], "val_loss": [],
-                "accuracy": [], "precision": [], "recall": [], "f1": []
+                "accuracy": [], "precision": [], "recall": [], "f1": [],
+                "epoch_time": []
             }
 
             for epoch in tqdm(range(self.cfg.MAX_EPOCHS), desc=f"Loop {loop+1}/{self.cfg.TRAIN_LOOPS} Epochs", leave=False):
                 try:
                     log(message=f"Epoch {epoch + 1}/{self.cfg.MAX_EPOCHS}", cfg=self.cfg, silent=True)
-                    train_loss, train_preds, train_labels = self.train_one_epoch(
-                        model=model, loader=train_loader, optimizer=optimizer, criterion=criterion, scaler=scaler
-                    )
-
-                    val_loss, val_metrics = self.validate(model=model, loader=val_loader, criterion=criterion)
+                    epoch_start = time.perf_counter()
+                    train_loss, train_preds, train_labels = run_epoch()
+                    val_loss, val_metrics = run_validation()
+                    epoch_time = time.perf_counter() - epoch_start
 
                     # LR Jumpstarter logic
-                    if val_loss < best_val_loss:
-                        best_val_loss = val_loss
-                        patience_counter = 0
-                        for g in optimizer.param_groups:
-                            g['lr'] = max(g['lr'] * lr_decay_factor, min_lr)
-                    else:
-                        patience_counter += 1
-                        if patience_counter >= patience_for_jump:
-                            jump_counter += 1
-                            log(message=f"Validation stalled. Jumping LR (jump #{jump_counter})!", cfg=self.cfg, silent=True)
-                            for g in optimizer.param_groups:
-                                g['lr'] = min(g['lr'] * 3, max_lr)
-                            patience_counter = 0
+                    if self.jumpstart_lr(optimizer, val_loss, lr_state):
+                        log(message=f"Validation stalled. Jumping LR (jump #{lr_state['jumps']})!", cfg=self.cfg, silent=True)
 
                     # Update history
                     history["train_loss"].append(train_loss)
                     history["val_loss"].append(val_loss)
                     for k in ["accuracy", "precision", "recall", "f1"]:
                         history[k].append(val_metrics[k])
+                    history["epoch_time"].append(epoch_time)
 
                     log(message=f"Train Loss: {train_loss:.4f} | Val Loss: {val_loss:.4f} | "
                         f"Val Acc: {val_metrics['accuracy']:.4f} | F1: {val_metrics['f1']:.4f} | "
-                        f"LR: {optimizer.param_groups[0]['lr']:.6f}", cfg=self.cfg, silent=True)
+                        f"LR: {optimizer.param_groups[0]['lr']:.6f} | "
+                        f"Epoch Time ({'tensor' if tensor_resident else 'dataloader'}): {epoch_time:.2f}s",
+                        cfg=self.cfg, silent=True)
 
                     # Early stopping
-                    if patience_counter >= self.cfg.EARLY_STOPPING_PATIENCE and not self.cfg.AUTO_CONTINUE:
+                    if lr_state["patience"] >= self.cfg.EARLY_STOPPING_PATIENCE and not self.cfg.AUTO_CONTINUE:
                         log("Early stopping triggered.", self.cfg)
                         break
 
@@ -219,5 +333,8 @@ class Train:
                 except KeyboardInterrupt:
                     self.save_checkpoint(model, optimizer, scaler, epoch)
                     sys.exit("\nTraining interrupted. Model saved.")
+            log(f"TRAIN_LOOP {loop + 1} mean epoch time "
+                f"({'tensor' if tensor_resident else 'dataloader'}): "
+                f"{sum(history['epoch_time']) / max(len(history['epoch_time']), 1):.2f}s", self.cfg)
             history_loops.append(history)
         return history_loops